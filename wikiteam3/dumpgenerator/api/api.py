@@ -124,6 +124,7 @@ def checkRetryAPI(api="", apiclient=False, session: requests.Session = None):
                 apiurl.path.replace("api.php", ""),
                 scheme=apiurl.scheme,
                 pool=session,
+                compress=False,  # the session asks for its own encodings
             )
         except KeyError:
             # Probably KeyError: 'query'
@@ -143,6 +144,7 @@ def checkRetryAPI(api="", apiclient=False, session: requests.Session = None):
                     apiurl.path.replace("api.php", ""),
                     scheme=newscheme,
                     pool=session,
+                    compress=False,  # the session asks for its own encodings
                 )
             except KeyError:
                 check = False
@@ -1,7 +1,6 @@
 import re
 
 from wikiteam3.dumpgenerator.api import getJSON
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 
 
@@ -15,7 +14,6 @@ def getNamespacesScraper(config: Config = None, session=None):
             url=config.index, params={"title": "Special:Allpages"}, timeout=30
         )
         raw = r.text
-        Delay(config=config, session=session)
 
         # [^>]*? to include selected="selected"
         m = re.compile(
@@ -60,7 +58,6 @@ def getNamespacesAPI(config: Config = None, session=None):
             timeout=30,
         )
         result = getJSON(r)
-        Delay(config=config, session=session)
         try:
             nsquery = result["query"]["namespaces"]
         except KeyError:
@@ -1,5 +1,7 @@
+import os
 import re
 import sys
+from typing import *
 from urllib.parse import urlparse
 
 import mwclient
@@ -9,26 +11,31 @@ from wikiteam3.dumpgenerator.api.namespaces import (
     getNamespacesAPI,
     getNamespacesScraper,
 )
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.index import DumpIndex
 from wikiteam3.utils import cleanHTML, domain2prefix, undoHTMLEntities
-from wikiteam3.utils.monkey_patch import DelaySession
+from wikiteam3.utils.traffic import setPhase
 
 
-def getPageTitlesAPI(config: Config = None, session=None):
-    """Uses the API to get the list of page titles"""
-    titles = []
+def getPageTitlesAPI(
+    config: Config = None, session=None, cursors: Dict = None, checkpoint=None
+):
+    """Uses the API to get the list of (title, namespace) of the pages\n
+    `cursors` maps namespaces to the allpages continuation to resume them from,
+    or to "done". Once all the titles before a continuation were consumed,
+    `checkpoint(namespace, continuation)` is called, with None at the end of
+    the namespace."""
+    cursors = cursors or {}
     namespaces, namespacenames = getNamespacesAPI(config=config, session=session)
 
-    # apply delay to the session for mwclient.Site.allpages()
-    delay_session = DelaySession(
-        session=session, msg=f"Session delay: {__name__}", config=config
-    )
-    delay_session.hijack()
     for namespace in namespaces:
         if namespace in config.exnamespaces:
             print("    Skipping namespace = %d" % (namespace))
             continue
+        cursor = cursors.get(namespace, {})
+        if cursor == "done":
+            print("    Titles in the namespace %d were listed before" % (namespace))
+            continue
 
         print("    Retrieving titles in the namespace %d" % (namespace))
         apiurl = urlparse(config.api)
@@ -37,22 +44,48 @@ def getPageTitlesAPI(config: Config = None, session=None):
             apiurl.path.replace("api.php", ""),
             scheme=apiurl.scheme,
             pool=session,
+            compress=False,  # the session asks for its own encodings
         )
-        for page in site.allpages(namespace=namespace):
-            title = page.name
-            titles.append(title)
-            yield title
-
-        if len(titles) != len(set(titles)):
+        # allpages never lists a title twice, unless the continuation loops
+        titles = set()
+        while cursor is not None:
+            data = site.get(
+                "query",
+                list="allpages",
+                apnamespace=namespace,
+                aplimit=site.api_limit,
+                **cursor,
+            )
+            for page in data.get("query", {}).get("allpages", []):
+                title = page["title"]
+                if title in titles:
+                    break
+                titles.add(title)
+                yield title, namespace
+            else:
+                if data.get("continue"):
+                    # New style continuation, added in MediaWiki 1.21
+                    nextcursor = data["continue"]
+                else:
+                    nextcursor = data.get("query-continue", {}).get("allpages")
+                if nextcursor != cursor:
+                    cursor = nextcursor
+                    if cursor is not None and checkpoint:
+                        checkpoint(namespace, cursor)
+                    continue
             print("Probably a loop, switching to next namespace")
-            titles = list(set(titles))
-
-    delay_session.release()
+            break
+        if checkpoint:
+            checkpoint(namespace, None)
 
 
-def getPageTitlesScraper(config: Config = None, session=None):
-    """Scrape the list of page titles from Special:Allpages"""
-    titles = []
+def getPageTitlesScraper(
+    config: Config = None, session=None, cursors: Dict = None, checkpoint=None
+):
+    """Scrape the list of (title, namespace) of the pages from Special:Allpages\n
+    Namespaces are resumed as a whole, see getPageTitlesAPI()"""
+    cursors = cursors or {}
+    titles = set()
     namespaces, namespacenames = getNamespacesScraper(config=config, session=session)
     r_title = r'title="(?P<title>[^>]+)">'
     r_suballpages1 = r'&amp;from=(?P<from>[^>"]+)&amp;to=(?P<to>[^>"]+)">'
@@ -61,6 +94,9 @@ def getPageTitlesScraper(config: Config = None, session=None):
     # Should be enough subpages on Special:Allpages
     deep = 50
     for namespace in namespaces:
+        if cursors.get(namespace) == "done":
+            print("    Titles in the namespace %d were listed before" % (namespace))
+            continue
         print("    Retrieving titles in the namespace", namespace)
         url = f"{config.index}?title=Special:Allpages&namespace={namespace}"
         r = session.get(url=url, timeout=30)
@@ -76,7 +112,7 @@ def getPageTitlesScraper(config: Config = None, session=None):
             r_suballpages = r_suballpages3
         c = 0
         oldfr = ""
-        checked_suballpages = []
+        checked_suballpages = set()
         rawacum = raw
         while r_suballpages and re.search(r_suballpages, raw) and c < deep:
             # load sub-Allpages
@@ -104,8 +140,7 @@ def getPageTitlesScraper(config: Config = None, session=None):
 
                 if name not in checked_suballpages:
                     # to avoid reload dupe subpages links
-                    checked_suballpages.append(name)
-                    Delay(config=config, session=session)
+                    checked_suballpages.add(name)
                     # print ('Fetching URL: ', url)
                     r = session.get(url=url, timeout=10)
                     raw = str(r.text)
@@ -122,8 +157,6 @@ def getPageTitlesScraper(config: Config = None, session=None):
                         "pages",
                     )
 
-                Delay(config=config, session=session)
-
             assert (
                 currfr is not None
             ), "re.search found the pattern, but re.finditer fails, why?"
@@ -136,10 +169,12 @@ def getPageTitlesScraper(config: Config = None, session=None):
             t = undoHTMLEntities(text=i.group("title"))
             if not t.startswith("Special:"):
                 if t not in titles:
-                    titles.append(t)
+                    titles.add(t)
                     c += 1
+                    yield t, namespace
         print("    %d titles retrieved in the namespace %d" % (c, namespace))
-    return titles
+        if checkpoint:
+            checkpoint(namespace, None)
 
 
 def getPageTitles(config: Config = None, session=None):
@@ -164,28 +199,71 @@ def getPageTitles(config: Config = None, session=None):
         )
     )
 
+    titlesfilename = "{}-{}-titles.txt".format(
+        domain2prefix(config=config), config.date
+    )
+    index = DumpIndex(config)
+    progress = index.getTitlesProgress()
+    titlespath = f"{config.path}/{titlesfilename}"
+    if progress is not None and (
+        not os.path.exists(titlespath)
+        or os.path.getsize(titlespath) < progress["offset"]
+    ):
+        print("The titles listed in the previous session are lost, listing them again")
+        progress = None
+    if progress is None:
+        index.clearTitles()
+        progress = {"offset": 0, "namespaces": {}}
+        titlesfile = open(titlespath, "w", encoding="utf-8")
+    else:
+        print("Resuming the list of titles interrupted in the previous session")
+        # drop the titles written after the last checkpoint, they are listed again
+        with open(titlespath, "r+b") as f:
+            f.truncate(progress["offset"])
+        titlesfile = open(titlespath, "a", encoding="utf-8")
+    cursors = {int(ns): cursor for ns, cursor in progress["namespaces"].items()}
+
+    indexed = []
+
+    def checkpoint(namespace: int, cursor: Optional[Dict]):
+        """Flush the titles listed so far, and where to list the next ones from"""
+        nonlocal indexed
+        titlesfile.flush()
+        progress["offset"] = titlesfile.tell()
+        progress["namespaces"][str(namespace)] = cursor or "done"
+        index.addTitles(indexed, progress=progress)
+        indexed = []
+
+    phase = setPhase(session, "titles")
     titles = []
     if config.api:
         try:
-            titles = getPageTitlesAPI(config=config, session=session)
+            titles = getPageTitlesAPI(
+                config=config, session=session, cursors=cursors, checkpoint=checkpoint
+            )
         except:
             print("Error: could not get page titles from the API")
-            titles = getPageTitlesScraper(config=config, session=session)
+            titles = getPageTitlesScraper(
+                config=config, session=session, cursors=cursors, checkpoint=checkpoint
+            )
     elif config.index:
-        titles = getPageTitlesScraper(config=config, session=session)
+        titles = getPageTitlesScraper(
+            config=config, session=session, cursors=cursors, checkpoint=checkpoint
+        )
 
-    titlesfilename = "{}-{}-titles.txt".format(
-        domain2prefix(config=config), config.date
-    )
-    with open(f"{config.path}/{titlesfilename}", "w", encoding="utf-8") as titlesfile:
+    with index, titlesfile:
         c = 0
-        for title in titles:
+        for title, namespace in titles:
             titlesfile.write(str(title) + "\n")
+            indexed.append((str(title), namespace))
             c += 1
+        index.addTitles(indexed)
         # TODO: Sort to remove dupes? In CZ, Widget:AddThis appears two times:
         # main namespace and widget namespace.
         # We can use sort -u in UNIX, but is it worth it?
         titlesfile.write("--END--\n")
+        index.setComplete("titles")
+    setPhase(session, phase)
     print("Titles saved at...", titlesfilename)
 
     print("%d page titles loaded" % (c))
@@ -214,17 +292,13 @@ def checkTitleOk(
     return lasttitle == "--END--"
 
 
-def readTitles(config: Config = None, session=None, start=None, batch=False):
-    """Read title list from a file, from the title "start" """
-    if not checkTitleOk(config):
-        getPageTitles(config=config, session=session)
-
+def readTitlesFile(config: Config = None, start=None):
+    """Read title list from titles.txt, from the title "start" """
     titlesfilename = "{}-{}-titles.txt".format(
         domain2prefix(config=config), config.date
     )
     titlesfile = open(f"{config.path}/{titlesfilename}", encoding="utf-8")
 
-    titlelist = []
     seeking = start is not None
     with titlesfile as f:
         for line in f:
@@ -235,7 +309,25 @@ def readTitles(config: Config = None, session=None, start=None, batch=False):
                 continue
             elif seeking:
                 seeking = False
+            yield title
+
+
+def readTitles(config: Config = None, session=None, start=None, batch=False):
+    """Read title list from the index, or from titles.txt for dumps started
+    without one, from the title "start" """
+    if not checkTitleOk(config):
+        getPageTitles(config=config, session=session)
+
+    index = DumpIndex(config)
+    if index.isComplete("titles"):
+        titles = index.iterTitles(start=start)
+    else:
+        index.close()
+        titles = readTitlesFile(config=config, start=start)
 
+    titlelist = []
+    try:
+        for title in titles:
             if not batch:
                 yield title
             else:
@@ -244,3 +336,5 @@ def readTitles(config: Config = None, session=None, start=None, batch=False):
                     continue
                 yield titlelist
                 titlelist = []
+    finally:
+        index.close()
@@ -0,0 +1,144 @@
+import pytest
+import requests
+
+from wikiteam3.dumpgenerator.api import page_titles
+from wikiteam3.dumpgenerator.config import Config
+
+
+class FakeSite:
+    """list=allpages two titles at a time, namespace 2 loops back to its start"""
+
+    api_limit = 2
+    PAGES = {0: ["A", "B", "C"], 1: ["Talk:A"], 2: ["User:A", "User:B"]}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get(self, action, list=None, apnamespace=0, aplimit=1, apcontinue=""):
+        titles = self.PAGES[apnamespace]
+        start = titles.index(apcontinue) if apcontinue else 0
+        data = {"query": {"allpages": [{"title": t} for t in titles[start:][:aplimit]]}}
+        if start + aplimit < len(titles):
+            data["continue"] = {"apcontinue": titles[start + aplimit]}
+        elif apnamespace == 2:
+            data["continue"] = {"apcontinue": titles[0]}
+        return data
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    monkeypatch.setattr(page_titles.mwclient, "Site", FakeSite)
+    monkeypatch.setattr(
+        page_titles, "getNamespacesAPI", lambda config, session: ([0, 1, 2], {})
+    )
+    return Config(
+        api="https://wiki.example.org/w/api.php",
+        path=str(tmp_path),
+        date="20240101",
+        namespaces=["all"],
+        exnamespaces=[],
+    )
+
+
+def test_getPageTitlesAPI(config):
+    checkpoints = []
+    titles = page_titles.getPageTitlesAPI(
+        config=config,
+        session=requests.Session(),
+        checkpoint=lambda ns, cursor: checkpoints.append((ns, cursor)),
+    )
+    assert list(titles) == [
+        ("A", 0),
+        ("B", 0),
+        ("C", 0),
+        ("Talk:A", 1),
+        ("User:A", 2),
+        ("User:B", 2),
+    ]
+    assert checkpoints == [
+        (0, {"apcontinue": "C"}),
+        (0, None),
+        (1, None),
+        (2, {"apcontinue": "User:A"}),
+        (2, None),
+    ]
+
+
+def test_getPageTitles_resume(config, monkeypatch, tmp_path):
+    getPageTitlesAPI = page_titles.getPageTitlesAPI
+
+    def interrupted(checkpoint=None, **kwargs):
+        """Crashes right after the checkpoint before "C" was saved"""
+
+        def crash(namespace, cursor):
+            checkpoint(namespace, cursor)
+            if cursor == {"apcontinue": "C"}:
+                raise KeyboardInterrupt
+
+        return getPageTitlesAPI(checkpoint=crash, **kwargs)
+
+    session = requests.Session()
+    monkeypatch.setattr(page_titles, "getPageTitlesAPI", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        page_titles.getPageTitles(config=config, session=session)
+    monkeypatch.setattr(page_titles, "getPageTitlesAPI", getPageTitlesAPI)
+
+    (titlesfile,) = tmp_path.glob("*-titles.txt")
+    # a title listed after the checkpoint, to be dropped when resuming
+    with open(titlesfile, "a", encoding="utf-8") as f:
+        f.write("C\n")
+
+    page_titles.getPageTitles(config=config, session=session)
+    assert titlesfile.read_text(encoding="utf-8").splitlines() == [
+        "A",
+        "B",
+        "C",
+        "Talk:A",
+        "User:A",
+        "User:B",
+        "--END--",
+    ]
+    assert list(page_titles.readTitles(config=config, start="Talk:A")) == [
+        "Talk:A",
+        "User:A",
+        "User:B",
+    ]
+    with page_titles.DumpIndex(config) as index:
+        assert index.getTitlesProgress() is None
+
+
+@pytest.mark.parametrize("lost", ["removed", "truncated"])
+def test_getPageTitles_resume_lost_titles(config, monkeypatch, tmp_path, lost):
+    getPageTitlesAPI = page_titles.getPageTitlesAPI
+
+    def interrupted(checkpoint=None, **kwargs):
+        def crash(namespace, cursor):
+            checkpoint(namespace, cursor)
+            if namespace == 1:
+                raise KeyboardInterrupt
+
+        return getPageTitlesAPI(checkpoint=crash, **kwargs)
+
+    session = requests.Session()
+    monkeypatch.setattr(page_titles, "getPageTitlesAPI", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        page_titles.getPageTitles(config=config, session=session)
+    monkeypatch.setattr(page_titles, "getPageTitlesAPI", getPageTitlesAPI)
+
+    (titlesfile,) = tmp_path.glob("*-titles.txt")
+    if lost == "removed":
+        titlesfile.unlink()
+    else:
+        titlesfile.write_text("A\n", encoding="utf-8")
+
+    # listed again from the start
+    page_titles.getPageTitles(config=config, session=session)
+    assert titlesfile.read_text(encoding="utf-8").splitlines() == [
+        "A",
+        "B",
+        "C",
+        "Talk:A",
+        "User:A",
+        "User:B",
+        "--END--",
+    ]
@@ -2,6 +2,7 @@ import argparse
 import datetime
 import http
 import http.cookiejar
+import importlib.util
 import os
 import queue
 import re
@@ -16,7 +17,11 @@ from wikiteam3.dumpgenerator.api.index_check import checkIndex
 from wikiteam3.dumpgenerator.config import Config, newConfig
 from wikiteam3.dumpgenerator.version import getVersion
 from wikiteam3.utils import domain2prefix, getUserAgent, mod_requests_text
+from wikiteam3.utils.connection_pool import PooledHTTPAdapter
 from wikiteam3.utils.login import uniLogin
+from wikiteam3.utils.rate_limit import AdaptiveTokenBucket, getRetryAfter
+from wikiteam3.utils.thread_pool import setConcurrency
+from wikiteam3.utils.traffic import TrafficMetrics, negotiateEncoding
 
 from ...utils.user_agent import setupUserAgent
 from .delay import Delay
@@ -35,11 +40,25 @@ def getArgumentParser():
         metavar="5",
         default=0.5,
         type=float,
-        help="adds a delay (in seconds)",
+        help="minimum time between requests to a host (in seconds), time spent waiting for the server counts towards it",
+    )
+    parser.add_argument(
+        "--burst",
+        metavar="1",
+        default=1,
+        type=int,
+        help="number of requests that can be sent at once before --delay applies (default: 1)",
     )
     parser.add_argument(
         "--retries", metavar="5", default=5, help="Maximum number of retries for "
     )
+    parser.add_argument(
+        "--maxlag",
+        metavar="5",
+        default=5,
+        type=int,
+        help="MediaWiki maxlag parameter sent to the API: when the database replicas lag more than this (in seconds), slow down and retry. 0 to disable (default: 5)",
+    )
     parser.add_argument("--path", help="path to store wiki dump at")
     parser.add_argument(
         "--resume",
@@ -68,6 +87,25 @@ def getArgumentParser():
     parser.add_argument(
         "--insecure", action="store_true", help="Disable SSL certificate verification"
     )
+    parser.add_argument(
+        "--pool-connections",
+        metavar="10",
+        default=10,
+        type=int,
+        help="number of hosts to keep connection pools for (default: 10)",
+    )
+    parser.add_argument(
+        "--pool-maxsize",
+        metavar="N",
+        default=0,
+        type=int,
+        help="maximum number of connections kept alive per host (default: --concurrency, at least 10)",
+    )
+    parser.add_argument(
+        "--no-keep-alive",
+        action="store_true",
+        help="close the connection after every request, for servers that mishandle keep-alive",
+    )
 
     parser.add_argument(
         "--stdout-log-file",
@@ -121,6 +159,28 @@ def getArgumentParser():
         action="store_true",
         help="[[! Development only !]] Export all revisions from an API generator, but query page by page MediaWiki 1.27+ only. (default: --curonly)",
     )
+    groupDownload.add_argument(
+        "--no-export-batch",
+        action="store_true",
+        help="With --xml --curonly, ask Special:Export for one page at a time instead of many, for wikis that mishandle the batches",
+    )
+    groupDownload.add_argument(
+        "--xml-workers",
+        metavar="1",
+        default=1,
+        type=int,
+        help="With --xmlrevisions, number of namespaces to dump concurrently, each into its own shard merged at the end. With --xml, number of pages to download concurrently, written in the order of the titles. (default: 1)",
+    )
+    groupDownload.add_argument(
+        "--xml-compression",
+        choices=["xz", "zstd"],
+        help="Compress the XML dump as it is written, in frames that can be decompressed on their own, so an interrupted dump resumes from its last complete frame. zstd needs the compression extra. (default: not compressed)",
+    )
+    groupDownload.add_argument(
+        "--xml-multistream",
+        action="store_true",
+        help="With --xml-compression, write the XML dump as a multistream dump: frames of 100 pages at most, and an index of the pages (offset:id:title, the offset being the one of their frame) next to it, to extract a page without decompressing the rest. (default: frames of 16 MiB and no index)",
+    )
     groupDownload.add_argument(
         "--images", action="store_true", help="Generates an image dump"
     )
@@ -134,6 +194,20 @@ def getArgumentParser():
         action="store_true",
         help="Don't verify image size and hash while downloading. (useful for wikis with server-side image resizing)",
     )
+    groupDownload.add_argument(
+        "--image-workers",
+        metavar="1",
+        default=1,
+        type=int,
+        help="Number of images to download concurrently. Workers share the --delay and --burst of each host. (default: 1)",
+    )
+    groupDownload.add_argument(
+        "--concurrency",
+        metavar="N",
+        default=0,
+        type=int,
+        help="Maximum number of requests in flight at once, across all the workers. (default: the larger of --xml-workers and --image-workers)",
+    )
     groupDownload.add_argument(
         "--namespaces",
         metavar="1,2,3",
@@ -198,6 +272,40 @@ def checkParameters(args=argparse.Namespace()) -> bool:
         print("ERROR: --curonly requires --xml")
         passed = False
 
+    if args.xml_compression and not args.xml:
+        print("ERROR: --xml-compression requires --xml")
+        passed = False
+    if args.xml_multistream and not args.xml_compression:
+        print("ERROR: --xml-multistream requires --xml-compression")
+        passed = False
+    if args.xml_compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        print(
+            "ERROR: --xml-compression zstd requires zstandard, "
+            "install wikiteam3[compression]"
+        )
+        passed = False
+
+    if args.burst < 1:
+        print("ERROR: --burst must be at least 1")
+        passed = False
+
+    # --xml-workers and --image-workers need at least one worker
+    if args.xml_workers < 1:
+        print("ERROR: --xml-workers must be at least 1")
+        passed = False
+    if args.image_workers < 1:
+        print("ERROR: --image-workers must be at least 1")
+        passed = False
+    if args.concurrency < 0:
+        print("ERROR: --concurrency must be positive")
+        passed = False
+    if args.pool_connections < 1:
+        print("ERROR: --pool-connections must be at least 1")
+        passed = False
+    if args.pool_maxsize < 0:
+        print("ERROR: --pool-maxsize must be positive")
+        passed = False
+
     # --xmlrevisions not supported with --curonly
     if args.xmlrevisions and args.curonly:
         print("ERROR: --xmlrevisions not supported with --curonly")
@@ -238,9 +346,11 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
         requests.packages.urllib3.util.ssl_.DEFAULT_CIPHERS = "ALL:@SECLEVEL=1"
         print("WARNING: SSL certificate verification disabled")
 
+    # Requests the workers can have in flight at once
+    concurrency = args.concurrency or max(args.xml_workers, args.image_workers)
+
     # Custom session retry
     try:
-        from requests.adapters import HTTPAdapter
         from urllib3.util.retry import Retry
 
         # Courtesy datashaman https://stackoverflow.com/a/35504626
@@ -251,29 +361,26 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
                         "_pool"
                     ]  # type: urllib3.connectionpool.HTTPSConnectionPool
                     if "response" in kwargs:
+                        # let the rate limiter know the server is struggling
+                        response = kwargs["response"]
+                        if response is not None and response.status in (429, 503):
+                            session.rate_limiter.throttle(
+                                f"{conn.scheme}://{conn.host}", getRetryAfter(response)
+                            )
                         try:
-                            # drain conn in advance so that it won't be put back into conn.pool
+                            # read the rest of the response, so that its
+                            # connection goes back to the pool for the retry
                             kwargs["response"].drain_conn()
                         except:
                             pass
-                    # Useless, retry happens inside urllib3
-                    # for adapters in session.adapters.values():
-                    #     adapters: HTTPAdapter
-                    #     adapters.poolmanager.clear()
-
-                    # Close existing connection so that a new connection will be used
-                    if hasattr(conn, "pool"):
-                        pool = conn.pool  # type: queue.Queue
-                        try:
-                            # Don't directly use this, This closes connection pool by making conn.pool = None
-                            conn.close()
-                        except:
-                            pass
-                        conn.pool = pool
+                    # Keep the pooled connections: urllib3 already discards
+                    # broken ones, and reconnecting costs a TCP/TLS handshake
                 return super().increment(method=method, url=url, *args, **kwargs)
 
             def sleep(self, response=None):
                 backoff = self.get_backoff_time()
+                if response is not None:
+                    backoff = max(backoff, self.get_retry_after(response) or 0)
                 if backoff <= 0:
                     return
                 if response is not None:
@@ -296,11 +403,22 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
                 "POST",
             ],
         )
-        session.mount("https://", HTTPAdapter(max_retries=__retries__))
-        session.mount("http://", HTTPAdapter(max_retries=__retries__))
     except:
         # Our urllib3/requests is too old
-        pass
+        __retries__ = 0
+
+    # Connection pools, shared by http:// and https:// so that the metrics
+    # cover both, with by default a connection kept alive for every request
+    # that may be in flight
+    adapter = PooledHTTPAdapter(
+        pool_connections=args.pool_connections,
+        pool_maxsize=args.pool_maxsize or max(10, concurrency),
+        max_retries=__retries__,
+        keep_alive=not args.no_keep_alive,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.pool_metrics = adapter.metrics
 
     # Set cookies
     cj = http.cookiejar.MozillaCookieJar()
@@ -313,6 +431,22 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
     session.headers.update({"User-Agent": getUserAgent()})
     setupUserAgent(session)  # monkey patch
 
+    # Compressed responses, counted in wire and decoded bytes
+    print("Accepting content encodings:", negotiateEncoding(session))
+    TrafficMetrics().attach(session)
+
+    # Rate limit every request of the session, mwclient's included,
+    # slowing down while the server struggles
+    AdaptiveTokenBucket(
+        rate=1 / args.delay if args.delay > 0 else 0,
+        burst=args.burst,
+        maxlag=args.maxlag,
+        retries=int(args.retries),
+    ).attach(session)
+
+    # Overlapping requests of the workers, all of them together
+    setConcurrency(session, concurrency)
+
     # Set HTTP Basic Auth
     if args.http_user and args.http_password:
         session.auth = (args.user, args.password)
@@ -456,13 +590,18 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
             "logs": False,
             "xml": args.xml,
             "xmlapiexport": args.xmlapiexport,
+            "export_batch": not args.no_export_batch,
             "xmlrevisions": args.xmlrevisions or args.xmlrevisions_page,
             "xmlrevisions_page": args.xmlrevisions_page,
+            "xml_workers": args.xml_workers,
+            "xml_compression": args.xml_compression or "",
+            "xml_multistream": args.xml_multistream,
             "namespaces": namespaces,
             "exnamespaces": exnamespaces,
             "path": args.path and os.path.normpath(args.path) or "",
             "cookies": args.cookies or "",
             "delay": args.delay,
+            "burst": args.burst,
             "retries": int(args.retries),
         }
     )
@@ -475,6 +614,7 @@ def getParameters(params=None) -> Tuple[Config, Dict]:
         "stdout_log_path": args.stdout_log_path,
         "bypass_cdn_image_compression": args.bypass_cdn_image_compression,
         "disable_image_verify": args.disable_image_verify,
+        "image_workers": args.image_workers,
     }
 
     # calculating path, if not defined by user with --path=
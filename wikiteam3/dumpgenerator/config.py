@@ -40,6 +40,7 @@ class Config:
 
     # General params
     delay: float = 0.0
+    burst: int = 1
     retries: int = 0
     path: str = ""
     logs: bool = False
@@ -57,10 +58,14 @@ class Config:
     xmlrevisions_page: bool = False
     images: bool = False
     namespaces: List[int] = None
+    xml_workers: int = 1  # namespaces (--xmlrevisions) or pages (--xml) at once
     exnamespaces: List[int] = None
+    xml_compression: str = ""  # xz or zstd, of the XML dump as it is written
+    xml_multistream: bool = False  # frames of a few pages, and their index
 
     api_chunksize: int = 0  # arvlimit, ailimit, etc
     export: str = ""  # Special:Export page name
+    export_batch: bool = True  # --curonly: many pages per Special:Export request
     http_method: str = ""
 
     # Meta info params
@@ -29,10 +29,18 @@ from wikiteam3.dumpgenerator.dump.misc.index_php import saveIndexPHP
 from wikiteam3.dumpgenerator.dump.misc.site_info import saveSiteInfo
 from wikiteam3.dumpgenerator.dump.misc.special_logs import saveLogs
 from wikiteam3.dumpgenerator.dump.misc.special_version import saveSpecialVersion
-from wikiteam3.dumpgenerator.dump.xmldump.xml_dump import generateXMLDump
+from wikiteam3.dumpgenerator.dump.xmldump.xml_checkpoint import loadCheckpoint
+from wikiteam3.dumpgenerator.dump.xmldump.xml_compress import readLastFrame
+from wikiteam3.dumpgenerator.dump.xmldump.xml_dump import (
+    generateXMLDump,
+    getXMLFilename,
+)
 from wikiteam3.dumpgenerator.dump.xmldump.xml_integrity import checkXMLIntegrity
+from wikiteam3.dumpgenerator.index import DumpIndex
 from wikiteam3.dumpgenerator.log import logerror
 from wikiteam3.utils import avoidWikimediaProjects, domain2prefix, undoHTMLEntities
+from wikiteam3.utils.connection_pool import describeConnections
+from wikiteam3.utils.traffic import describeTraffic, setPhase
 
 
 # From https://stackoverflow.com/a/57008707
@@ -118,9 +126,12 @@ class DumpGenerator:
             else:
                 DumpGenerator.createNewDump(config=config, other=other)
 
+            setPhase(other["session"], "misc")
             saveIndexPHP(config=config, session=other["session"])
             saveSpecialVersion(config=config, session=other["session"])
             saveSiteInfo(config=config, session=other["session"])
+            print(describeConnections(other["session"]))
+            print(describeTraffic(other["session"]))
             bye()
 
     @staticmethod
@@ -138,6 +149,7 @@ class DumpGenerator:
                 config=config, other=other, images=images, session=other["session"]
             )
         if config.logs:
+            setPhase(other["session"], "logs")
             saveLogs(config=config, session=other["session"])
 
     @staticmethod
@@ -149,31 +161,38 @@ class DumpGenerator:
             xmliscomplete = False
             lastxmltitle = None
             lastxmlrevid = None
-            try:
-                with FileReadBackwards(
-                    "%s/%s-%s-%s.xml"
-                    % (
-                        config.path,
-                        domain2prefix(config=config, session=other["session"]),
-                        config.date,
-                        "current" if config.curonly else "history",
-                    ),
-                    encoding="utf-8",
-                ) as frb:
-                    for l in frb:
-                        if l.strip() == "</mediawiki>":
-                            # xml dump is complete
-                            xmliscomplete = True
-                            break
+            xmlfilename = "{}/{}".format(
+                config.path, getXMLFilename(config=config, session=other["session"])
+            )
+            checkpoint = loadCheckpoint(xmlfilename)
+            if checkpoint is not None:
+                # no need to read the dump backwards, the checkpoint knows
+                xmliscomplete = checkpoint["complete"]
+                lastxmltitle = checkpoint.get("title")
+                lastxmlrevid = checkpoint.get("revid")
+            else:
+                try:
+                    if config.xml_compression:
+                        # only the last frame, read as FileReadBackwards would
+                        lines = readLastFrame(xmlfilename, config.xml_compression)
+                        frb = contextlib.nullcontext(lines.splitlines()[::-1])
+                    else:
+                        frb = FileReadBackwards(xmlfilename, encoding="utf-8")
+                    with frb:
+                        for l in frb:
+                            if l.strip() == "</mediawiki>":
+                                # xml dump is complete
+                                xmliscomplete = True
+                                break
 
-                        if xmlrevid := re.search(r"    <id>([^<]+)</id>", l):
-                            lastxmlrevid = int(xmlrevid.group(1))
-                        if xmltitle := re.search(r"<title>([^<]+)</title>", l):
-                            lastxmltitle = undoHTMLEntities(text=xmltitle.group(1))
-                            break
+                            if xmlrevid := re.search(r"    <id>([^<]+)</id>", l):
+                                lastxmlrevid = int(xmlrevid.group(1))
+                            if xmltitle := re.search(r"<title>([^<]+)</title>", l):
+                                lastxmltitle = undoHTMLEntities(text=xmltitle.group(1))
+                                break
 
-            except:
-                pass  # probably file does not exists
+                except:
+                    pass  # probably file does not exists
 
             if xmliscomplete:
                 print("XML dump was completed in the previous session")
@@ -195,12 +214,18 @@ class DumpGenerator:
         if config.images:
             # load images list
             lastimage = ""
+            index = DumpIndex(config)
+            indexComplete = index.isComplete("images")
+            if indexComplete:
+                # the index has the list and what was saved, no need to scan
+                images = index.getImages()
+                lastimage = "--END--"
             imagesFilePath = "{}/{}-{}-images.txt".format(
                 config.path,
                 domain2prefix(config=config),
                 config.date,
             )
-            if os.path.exists(imagesFilePath):
+            if not indexComplete and os.path.exists(imagesFilePath):
                 with open(imagesFilePath) as f:
                     lines = f.read().splitlines()
                     images.extend(l.split("\t") for l in lines if re.search(r"\t", l))
@@ -224,32 +249,36 @@ class DumpGenerator:
                 # so
                 images = Image.getImageNames(config=config, session=other["session"])
                 Image.saveImageNames(config=config, images=images)
-            # checking images directory
-            listdir = []
-            try:
-                listdir = os.listdir(f"{config.path}/images")
-            except OSError:
-                pass  # probably directory does not exist
-            listdir = set(listdir)
-            c_desc = 0
-            c_images = 0
-            c_checked = 0
-            for filename, url, uploader, size, sha1 in images:
-                lastfilename = filename
-                if other["filenamelimit"] < len(filename.encode("utf-8")):
-                    logerror(
-                        config=config,
-                        to_stdout=True,
-                        text=f"Filename too long(>240 bytes), skipping: {filename}",
-                    )
-                    continue
-                if filename in listdir:
-                    c_images += 1
-                if f"{filename}.desc" in listdir:
-                    c_desc += 1
-                c_checked += 1
-                if c_checked % 100000 == 0:
-                    print(f"checked {c_checked}/{len(images)} records", end="\r")
+            if indexComplete:
+                c_images, c_desc = index.countSavedImages()
+            else:
+                # checking images directory
+                listdir = []
+                try:
+                    listdir = os.listdir(f"{config.path}/images")
+                except OSError:
+                    pass  # probably directory does not exist
+                listdir = set(listdir)
+                c_desc = 0
+                c_images = 0
+                c_checked = 0
+                for filename, url, uploader, size, sha1 in images:
+                    lastfilename = filename
+                    if other["filenamelimit"] < len(filename.encode("utf-8")):
+                        logerror(
+                            config=config,
+                            to_stdout=True,
+                            text=f"Filename too long(>240 bytes), skipping: {filename}",
+                        )
+                        continue
+                    if filename in listdir:
+                        c_images += 1
+                    if f"{filename}.desc" in listdir:
+                        c_desc += 1
+                    c_checked += 1
+                    if c_checked % 100000 == 0:
+                        print(f"checked {c_checked}/{len(images)} records", end="\r")
+            index.close()
             print(
                 f"{len(images)} records in images.txt, {c_images} images and {c_desc} .desc were saved in the previous session"
             )
@@ -1,7 +1,10 @@
+import contextlib
+import hashlib
 import os
 import random
 import re
 import sys
+import threading
 import time
 import urllib.parse
 from typing import Dict, List, Optional
@@ -9,13 +12,22 @@ from typing import Dict, List, Optional
 import requests
 
 from wikiteam3.dumpgenerator.api import getJSON, handleStatusCode
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 from wikiteam3.dumpgenerator.dump.image.html_regexs import R_NEXT, REGEX_CANDIDATES
 from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml import getXMLPage
-from wikiteam3.dumpgenerator.exceptions import FileSizeError, PageMissingError
+from wikiteam3.dumpgenerator.exceptions import (
+    FileSha1Error,
+    FileSizeError,
+    PageMissingError,
+)
+from wikiteam3.dumpgenerator.index import DumpIndex
 from wikiteam3.dumpgenerator.log import logerror
 from wikiteam3.utils import cleanHTML, domain2prefix, sha1File, undoHTMLEntities
+from wikiteam3.utils.rate_limit import describeRate
+from wikiteam3.utils.thread_pool import threadMap
+from wikiteam3.utils.traffic import setPhase
+
+IMAGE_CHUNK_SIZE = 1024 * 1024  # bytes held in memory while downloading a file
 
 
 class Image:
@@ -44,8 +56,16 @@ class Image:
             print(f'Creating "{imagepath}" directory')
             os.makedirs(imagepath)
 
+        setPhase(session, "images")
         c_savedImageFiles = 0
         c_savedImageDescs = 0
+        counter_lock = threading.Lock()
+
+        index = DumpIndex(config)
+        # images whose file and .desc were both saved by a previous session
+        savedImages = index.getSavedImages()
+
+        image_workers: int = other.get("image_workers", 1)
 
         bypass_cdn_image_compression: bool = other["bypass_cdn_image_compression"]
         disable_image_verify: bool = other["disable_image_verify"]
@@ -67,7 +87,8 @@ class Image:
                 "cf-polished", ""
             ), "Found cf-polished header in response, use --bypass-cdn-image-compression to bypass it"
 
-        for filename, url, uploader, size, sha1 in images:
+        def save_image(filename, url, uploader, size, sha1) -> None:
+            nonlocal c_savedImageFiles, c_savedImageDescs
             toContinue = 0
 
             # saving file
@@ -78,9 +99,18 @@ class Image:
                     to_stdout=True,
                     text=f"Filename is too long(>240 bytes), skipping: '{filename2}'",
                 )
-                continue
+                return
             filename3 = f"{imagepath}/{filename2}"
 
+            if (
+                filename in savedImages
+                and os.path.isfile(filename3)
+                and os.path.isfile(f"{filename3}.desc")
+            ):
+                with counter_lock:
+                    c_savedImageFiles += 1
+                return
+
             # check if file already exists and has the same size and sha1
             if (
                 size != "False"
@@ -90,8 +120,10 @@ class Image:
             ) or (sha1 == "False" and os.path.isfile(filename3)):
                 # sha1 is 'False' if file not in original wiki (probably deleted,
                 # you will get a 404 error if you try to download it)
-                c_savedImageFiles += 1
+                with counter_lock:
+                    c_savedImageFiles += 1
                 toContinue += 1
+                index.markImage(filename, file_saved=True)
                 print_msg = f"    {c_savedImageFiles}|sha1 matched: {filename2}"
                 print(print_msg[:70], end="\r")
                 if sha1 == "False":
@@ -102,7 +134,6 @@ class Image:
                         + "we will not try to download it...",
                     )
             else:
-                Delay(config=config, session=session)
                 original_url = url
                 r = session.head(url=url, params=modify_params(), allow_redirects=True)
                 check_response(r)
@@ -113,7 +144,9 @@ class Image:
                     original_url = url
                     url = r.url
 
-                r = session.get(url=url, params=modify_params(), allow_redirects=False)
+                r = session.get(
+                    url=url, params=modify_params(), allow_redirects=False, stream=True
+                )
                 check_response(r)
 
                 # Try to fix a broken HTTP to HTTPS redirect
@@ -124,24 +157,27 @@ class Image:
                     ):
                         url = "https://" + original_url.split("://")[1]
                         # print 'Maybe a broken http to https redirect, trying ', url
+                        r.close()
                         r = session.get(
-                            url=url, params=modify_params(), allow_redirects=False
+                            url=url,
+                            params=modify_params(),
+                            allow_redirects=False,
+                            stream=True,
                         )
                         check_response(r)
 
                 if r.status_code == 200:
                     try:
-                        if (
-                            size == "False"
-                            or len(r.content) == int(size)
-                            or disable_image_verify
-                        ):
-                            # size == 'False' means size is unknown
-                            with open(filename3, "wb") as imagefile:
-                                imagefile.write(r.content)
+                        Image.saveImageFile(
+                            r,
+                            filename=filename3,
+                            size=size,
+                            sha1=sha1,
+                            verify=not disable_image_verify,
+                        )
+                        with counter_lock:
                             c_savedImageFiles += 1
-                        else:
-                            raise FileSizeError(file=filename3, size=size)
+                        index.markImage(filename, file_saved=True)
                     except OSError:
                         logerror(
                             config=config,
@@ -149,13 +185,21 @@ class Image:
                             text=f"File '{filename3}' could not be created by OS",
                         )
                     except FileSizeError as e:
-                        # TODO: add a --force-download-image or --nocheck-image-size option to download anyway
                         logerror(
                             config=config,
                             to_stdout=True,
                             text=f"File '{e.file}' size is not match '{e.size}', skipping",
                         )
+                    except FileSha1Error as e:
+                        logerror(
+                            config=config,
+                            to_stdout=True,
+                            text=f"File '{e.file}' sha1 is not match '{e.sha1}', skipping",
+                        )
+                    finally:
+                        r.close()
                 else:
+                    r.close()
                     logerror(
                         config=config,
                         to_stdout=True,
@@ -164,8 +208,8 @@ class Image:
 
             if os.path.isfile(f"{filename3}.desc"):
                 toContinue += 1
+                index.markImage(filename, desc_saved=True)
             else:
-                Delay(config=config, session=session)
                 # saving description if any
                 title = f"Image:{filename}"
                 try:
@@ -208,7 +252,9 @@ class Image:
                         f"{imagepath}/{filename2}.desc", "w", encoding="utf-8"
                     ) as f:
                         f.write(xmlfiledesc)
-                    c_savedImageDescs += 1
+                    with counter_lock:
+                        c_savedImageDescs += 1
+                    index.markImage(filename, desc_saved=True)
 
                     if not xmlfiledesc:
                         logerror(
@@ -225,21 +271,72 @@ class Image:
                     )
 
             if toContinue == 2:  # skip printing
-                continue
+                return
             print_msg = (
                 f"              | {len(images) - c_savedImageFiles}=>{filename2[:50]}"
+                f" [{describeRate(session, url)}]"
             )
             print(print_msg, " " * (73 - len(print_msg)), end="\r")
 
+        if image_workers <= 1:
+            for filename, url, uploader, size, sha1 in images:
+                save_image(filename, url, uploader, size, sha1)
+        else:
+            print(f"Using {image_workers} workers to download images")
+            # Don't queue every image at once, some wikis have millions
+            for _ in threadMap(
+                session,
+                lambda image: save_image(*image),
+                images,
+                window=image_workers,
+                ordered=False,
+            ):
+                pass  # re-raises errors from the workers
+        index.close()
+
         print(
             f"Downloaded {c_savedImageFiles} images and {c_savedImageDescs} .desc files."
         )
 
+    @staticmethod
+    def saveImageFile(
+        r: requests.Response, filename="", size="False", sha1="False", verify=True
+    ) -> int:
+        """Stream a `stream=True` response to `filename`, return its size\n
+        The data is written in chunks to a temporary file, hashed on the fly
+        and checked against `size` and `sha1` ('False' means unknown) before
+        being renamed to `filename`, so a partial or wrong file never takes
+        the place of a good one."""
+
+        tmpfilename = f"{filename}.part"
+        hasher = hashlib.sha1()
+        written = 0
+        try:
+            with open(tmpfilename, "wb") as imagefile:
+                for chunk in r.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                    imagefile.write(chunk)
+                    hasher.update(chunk)
+                    written += len(chunk)
+                    if verify and size != "False" and written > int(size):
+                        # no need to download the rest of a file we will discard
+                        raise FileSizeError(file=filename, size=size)
+            if verify and size != "False" and written != int(size):
+                raise FileSizeError(file=filename, size=size)
+            if verify and sha1 != "False" and hasher.hexdigest() != sha1:
+                raise FileSha1Error(file=filename, sha1=sha1)
+            os.replace(tmpfilename, filename)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmpfilename)
+            raise
+        return written
+
     @staticmethod
     def getImageNames(config: Config = None, session: requests.Session = None):
         """Get list of image names"""
 
         print(")Retrieving image filenames")
+        setPhase(session, "image list")
         images = []
         if config.api:
             print("Using API to retrieve image names...")
@@ -273,7 +370,6 @@ class Image:
                 timeout=30,
             )
             raw = r.text
-            Delay(config=config, session=session)
             # delicate wiki
             if re.search(
                 r"(?i)(allowed memory size of \d+ bytes exhausted|Call to a member function getURL)",
@@ -382,7 +478,6 @@ class Image:
             r = session.get(url=config.api, params=params, timeout=30)
             handleStatusCode(r)
             jsonimages = getJSON(r)
-            Delay(config=config, session=session)
 
             if "query" in jsonimages:
                 countImages += len(jsonimages["query"]["allimages"])
@@ -470,7 +565,6 @@ class Image:
                 r = session.get(url=config.api, params=params, timeout=30)
                 handleStatusCode(r)
                 jsonimages = getJSON(r)
-                Delay(config=config, session=session)
 
                 if "query" not in jsonimages:
                     # if the API doesn't return query data, then we're done
@@ -547,6 +641,9 @@ class Image:
                     + "\n"
                 )
             imagesfile.write("--END--")
+        with DumpIndex(config) as index:
+            index.replaceImages(images)
+            index.setComplete("images")
         print("Image filenames and URLs saved at...", imagesfilename)
 
     @staticmethod
@@ -0,0 +1,68 @@
+import hashlib
+import os
+
+import pytest
+
+from wikiteam3.dumpgenerator.exceptions import FileSha1Error, FileSizeError
+
+from .image import Image
+
+
+class FakeStreamResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+
+CONTENT = b"GIF89a" + bytes(range(256)) * 10
+SHA1 = hashlib.sha1(CONTENT).hexdigest()
+
+
+def test_save_image_file(tmp_path):
+    filename = str(tmp_path / "Example.gif")
+    size = Image.saveImageFile(
+        FakeStreamResponse(CONTENT), filename=filename, size=len(CONTENT), sha1=SHA1
+    )
+    assert size == len(CONTENT)
+    with open(filename, "rb") as f:
+        assert f.read() == CONTENT
+    assert os.listdir(tmp_path) == ["Example.gif"]
+
+
+def test_save_image_file_unknown_size_and_sha1(tmp_path):
+    filename = str(tmp_path / "Example.gif")
+    Image.saveImageFile(FakeStreamResponse(CONTENT), filename=filename)
+    assert os.path.getsize(filename) == len(CONTENT)
+
+
+@pytest.mark.parametrize(
+    "size, sha1, error",
+    [
+        (len(CONTENT) - 1, SHA1, FileSizeError),
+        (len(CONTENT) + 1, SHA1, FileSizeError),
+        (len(CONTENT), "0" * 40, FileSha1Error),
+    ],
+)
+def test_save_image_file_mismatch(tmp_path, size, sha1, error):
+    filename = str(tmp_path / "Example.gif")
+    with pytest.raises(error):
+        Image.saveImageFile(
+            FakeStreamResponse(CONTENT), filename=filename, size=size, sha1=sha1
+        )
+    # neither the file nor its temporary download is left behind
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_image_file_no_verify(tmp_path):
+    filename = str(tmp_path / "Example.gif")
+    Image.saveImageFile(
+        FakeStreamResponse(CONTENT),
+        filename=filename,
+        size=1,
+        sha1="0" * 40,
+        verify=False,
+    )
+    assert os.path.getsize(filename) == len(CONTENT)
@@ -1,6 +1,5 @@
 import os
 
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 from wikiteam3.utils import removeIP
 
@@ -14,7 +13,6 @@ def saveIndexPHP(config: Config = None, session=None):
         print("Downloading index.php (Main Page) as index.html")
         r = session.post(url=config.index, params=None, timeout=10)
         raw = str(r.text)
-        Delay(config=config, session=session)
         raw = removeIP(raw=raw)
         with open(f"{config.path}/index.html", "w", encoding="utf-8") as outfile:
             outfile.write(raw)
@@ -2,7 +2,6 @@ import json
 import os
 
 from wikiteam3.dumpgenerator.api import getJSON
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 
 
@@ -53,6 +52,5 @@ def saveSiteInfo(config: Config = None, session=None):
                 timeout=10,
             )
         result = getJSON(r)
-        Delay(config=config, session=session)
         with open(f"{config.path}/siteinfo.json", "w", encoding="utf-8") as outfile:
             outfile.write(json.dumps(result, indent=4, sort_keys=True))
@@ -1,4 +1,3 @@
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 
 
@@ -20,4 +19,3 @@ def saveLogs(config: Config = None, session=None):
     <option value="">Todos los registros</option>
     </select>
 """
-    Delay(config=config, session=session)
@@ -1,6 +1,5 @@
 import os
 
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
 from wikiteam3.utils import removeIP
 
@@ -16,7 +15,6 @@ def saveSpecialVersion(config: Config = None, session=None):
             url=config.index, params={"title": "Special:Version"}, timeout=10
         )
         raw = str(r.text)
-        Delay(config=config, session=session)
         raw = str(removeIP(raw=raw))
         with open(
             f"{config.path}/SpecialVersion.html", "w", encoding="utf-8"
@@ -0,0 +1,152 @@
+from typing import *
+
+import lxml.etree
+
+EXPORT_CHUNK_SIZE = 64 * 1024  # bytes of a Special:Export response parsed at once
+
+
+def localName(element) -> str:
+    """Tag of `element` without the export schema namespace"""
+    return lxml.etree.QName(element).localname
+
+
+def removeElement(element) -> None:
+    """Removes `element` but not the indentation that follows it"""
+    previous = element.getprevious()
+    if previous is not None:
+        previous.tail = element.tail
+    else:
+        element.getparent().text = element.tail
+    element.getparent().remove(element)
+
+
+def serializeElement(element, indent: str) -> str:
+    """Serializes a complete element of the <page>, without the export
+    schema namespace and without the <sha1>s Special:Export adds"""
+    # Detached from the tree, so that it neither carries the namespace
+    # declarations of <mediawiki> nor is kept in memory once serialized
+    parent = element.getparent()
+    if parent is not None:
+        parent.remove(element)
+    for child in element.iter():
+        child.tag = localName(child)
+    for sha1 in list(element.iter("sha1")):
+        if sha1 is not element:
+            removeElement(sha1)
+    lxml.etree.cleanup_namespaces(element)
+    return indent + lxml.etree.tostring(element, encoding="unicode", with_tail=False)
+
+
+class ExportReader:
+    """Incremental reader of the Special:Export responses for one page
+
+    The response body is fed as it arrives, and the page comes out piece by
+    piece: first its opening (title, ns, id...), then every <revision> once
+    it is complete. Only the revision being parsed is held in memory.
+
+    A page may take several responses (offset continuation, or a retry after
+    a broken response), so the reader remembers the last revision it read
+    and skips the ones that are not newer."""
+
+    closing = "  </page>\n"
+
+    def __init__(self):
+        self.preamble = ""  # <mediawiki> and <siteinfo> of the first response
+        self.pageStarted = False  # the opening of the <page> was returned
+        self.revisions = 0  # revisions returned so far
+        self.timestamp = None  # of the last revision returned
+        self.revids = set()  # of the revisions returned
+        self.start()
+
+    def start(self):
+        """Gets ready for a new response"""
+        self.parser = lxml.etree.XMLPullParser(events=("end",), huge_tree=True)
+        self.pages = 0  # <page>s in this response
+        self.complete = False  # </mediawiki> was read
+        self.repeated = False  # a revision that was already returned came again
+        self.offset = self.timestamp  # what the request asks to start after
+        self.afterRevisions = False  # a <revision> of this response was read
+        self.opening = []  # elements of the <page> before its first revision
+        self.raw = None if self.pageStarted or self.preamble else bytearray()
+
+    def feed(self, data: bytes) -> Iterator[str]:
+        """Parses the next chunk of the response, yields the parts of the
+        page it completes"""
+        if self.raw is not None:
+            self.keepPreamble(data)
+        self.parser.feed(data)
+        for _, element in self.parser.read_events():
+            parent = element.getparent()
+            if parent is None:  # </mediawiki>
+                self.complete = True
+                continue
+            tag = localName(element)
+            if tag == "page" or tag == "siteinfo":
+                # only the first <page> is dumped, e.g. not the --templates
+                if tag == "page" and not self.pages:
+                    if not self.pageStarted:
+                        yield self.getOpening()
+                    self.pages += 1
+                parent.remove(element)
+                continue
+            if localName(parent) != "page" or self.pages:
+                continue  # the end of something inside a <revision> or so
+
+            if tag != "revision":
+                if tag == "sha1":
+                    parent.remove(element)
+                elif self.afterRevisions:  # e.g. <upload>s
+                    yield serializeElement(element, "    ") + "\n"
+                elif not self.pageStarted:
+                    self.opening.append(element)
+                else:  # already in the opening returned for a past response
+                    parent.remove(element)
+                continue
+            self.afterRevisions = True
+            if not self.pageStarted:
+                yield self.getOpening()
+            timestamp = element.findtext("{*}timestamp")
+            if not self.isNew(element.findtext("{*}id"), timestamp):
+                parent.remove(element)
+                continue
+            yield serializeElement(element, "    ") + "\n"
+            self.revisions += 1
+            self.timestamp = timestamp or self.timestamp
+
+    def isNew(self, revid: Optional[str], timestamp: Optional[str]) -> bool:
+        """Whether the revision was not returned yet, by its id: timestamps
+        only go to the second, several revisions may share one. A revision
+        returned again at or before the offset means the wiki ignored it"""
+        if revid is None:
+            return True
+        if revid in self.revids:
+            if self.offset and timestamp and timestamp <= self.offset:
+                self.repeated = True
+            return False
+        self.revids.add(revid)
+        return True
+
+    def keepPreamble(self, data: bytes) -> None:
+        """Keeps the raw bytes of the response until the end of <siteinfo>:
+        they are the header of the XML dump, as the wiki wrote it"""
+        self.raw += data
+        end = self.raw.find(b"</siteinfo>")
+        if end < 0 and b"<page>" not in self.raw:
+            return
+        if end < 0:  # no <siteinfo>
+            end = len(self.raw[: self.raw.find(b"<page>")].rstrip(b" "))
+        elif self.raw.find(b"\n", end) < 0:
+            return  # cleanXML() cuts the dump header at "</siteinfo>\n"
+        else:
+            end = self.raw.find(b"\n", end) + 1
+        self.preamble = self.raw[:end].decode("utf-8", errors="replace")
+        self.raw = None
+
+    def getOpening(self) -> str:
+        """Opening of the <page>, after the <mediawiki> preamble"""
+        opening = self.preamble + "  <page>\n"
+        for element in self.opening:
+            opening += serializeElement(element, "    ") + "\n"
+        self.opening = []
+        self.pageStarted = True
+        return opening
@@ -0,0 +1,220 @@
+import pytest
+import requests
+
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.exceptions import PageMissingError
+from wikiteam3.utils import cleanXML
+
+from .export_reader import ExportReader
+from .export_stream import ExportStream
+from .page_xml_export import getXMLPageWithExport
+
+PREAMBLE = (
+    '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">\n'
+    "  <siteinfo>\n    <sitename>Wiki</sitename>\n  </siteinfo>\n"
+)
+
+
+def makeRevision(i: int, day: int = None) -> str:
+    return (
+        "    <revision>\n"
+        f"      <id>{i}</id>\n"
+        f"      <timestamp>2024-01-{day or i:02d}T00:00:00Z</timestamp>\n"
+        f'      <text xml:space="preserve" bytes="9">R&amp;D &lt;{i}&gt;</text>\n'
+        "      <sha1>abc</sha1>\n"
+        "    </revision>\n"
+    )
+
+
+def makeExport(revisions, title="Main Page") -> bytes:
+    page = f"  <page>\n    <title>{title}</title>\n    <ns>0</ns>\n    <id>100</id>\n"
+    page += "".join(makeRevision(i) for i in revisions) + "  </page>\n"
+    return (PREAMBLE + page + "</mediawiki>\n").encode("utf-8")
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes, brokenAt: int = None):
+        self.body = body
+        self.brokenAt = brokenAt
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), 7):
+            if self.brokenAt is not None and i >= self.brokenAt:
+                raise requests.exceptions.ChunkedEncodingError("connection broken")
+            yield self.body[i : i + 7]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """Special:Export of a page with `count` revisions, `limit` at a time"""
+
+    def __init__(
+        self, count: int, maxLimit=1000, honorOffset=True, brokenAt=None, failAt=None
+    ):
+        self.count = count
+        self.maxLimit = maxLimit
+        self.honorOffset = honorOffset
+        self.brokenAt = brokenAt
+        self.failAt = failAt  # request that gets a connection error
+        self.requests = []
+
+    def post(self, url, params, headers, timeout, stream):
+        self.requests.append(dict(params))
+        if len(self.requests) - 1 == self.failAt:
+            raise requests.exceptions.ConnectionError("connection refused")
+        first = 1
+        if self.honorOffset and params.get("offset", "1") != "1":
+            first = int(params["offset"][8:10]) + 1
+        if params.get("curonly"):
+            first = self.count
+        limit = min(int(params["limit"]), self.maxLimit)
+        last = min(first + limit - 1, self.count)
+        brokenAt, self.brokenAt = self.brokenAt, None
+        return FakeResponse(makeExport(range(first, last + 1)), brokenAt)
+
+
+def getConfig(**kwargs) -> Config:
+    return Config(index="http://wiki/index.php", retries=3, **kwargs)
+
+
+def dumpPage(session, config, reader=None) -> str:
+    if isinstance(reader, ExportStream):
+        chunks = getXMLPageWithExport(
+            config=config, title="Main Page", session=session, reader=reader
+        )
+        return b"".join(chunks).decode("utf-8")
+    return "".join(
+        cleanXML(xml=xml)
+        for xml in getXMLPageWithExport(
+            config=config, title="Main Page", session=session, reader=reader
+        )
+    )
+
+
+def test_export_reader_chunks():
+    reader = ExportReader()
+    parts = []
+    for byte in makeExport([1, 2]):
+        parts += reader.feed(bytes([byte]))
+    assert reader.complete and reader.pages == 1
+    assert reader.preamble == PREAMBLE
+    assert parts[0] == (
+        PREAMBLE
+        + "  <page>\n    <title>Main Page</title>\n    <ns>0</ns>\n    <id>100</id>\n"
+    )
+    # namespaces and sha1s are gone, the rest is as the wiki wrote it
+    assert parts[1:] == [
+        makeRevision(i).replace("      <sha1>abc</sha1>\n", "") for i in (1, 2)
+    ]
+    assert (reader.revisions, reader.timestamp) == (2, "2024-01-02T00:00:00Z")
+
+
+def test_export_stream_same_as_reader():
+    export = makeExport([1, 2]).decode("utf-8")
+    # a page level <sha1>, an <upload> and a page of --templates
+    export = export.replace("<id>100</id>\n", "<id>100</id>\n    <sha1/>\n")
+    export = export.replace(
+        "  </page>\n",
+        "    <upload>\n      <filename>A.png</filename>\n    </upload>\n  </page>\n"
+        "  <page>\n    <title>Template:A</title>\n  </page>\n",
+    )
+    reader, stream = ExportReader(), ExportStream()
+    read, streamed = "", b""
+    for i in range(0, len(export.encode("utf-8")), 5):
+        chunk = export.encode("utf-8")[i : i + 5]
+        read += "".join(reader.feed(chunk))
+        streamed += b"".join(stream.feed(chunk))
+    assert stream.complete and stream.pages == 1 and stream.revisions == 2
+    assert stream.preamble == PREAMBLE
+    assert streamed.decode("utf-8") == cleanXML(xml=read)
+    assert "<sha1" not in read and "A.png" in read and "Template:A" not in read
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_offset_continuation(Reader):
+    session = FakeSession(count=5)
+    xml = dumpPage(session, getConfig(), Reader())
+    assert [r["offset"] for r in session.requests] == [
+        "1",
+        "2024-01-05T00:00:00Z",
+    ]
+    assert xml.count("<revision>") == 5
+    assert xml.count("<title>") == 1
+    assert xml.endswith("    </revision>\n  </page>\n")
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_limit_continuation(Reader):
+    # a wiki with $wgExportMaxHistory = 2
+    session = FakeSession(count=5, maxLimit=2)
+    xml = dumpPage(session, getConfig(), Reader())
+    assert [xml.count(f"<id>{i}</id>") for i in range(1, 6)] == [1] * 5
+    assert len(session.requests) == 4  # the last one has no newer revisions
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_offset_ignored(Reader):
+    session = FakeSession(count=3, honorOffset=False)
+    xml = dumpPage(session, getConfig(), Reader())
+    assert xml.count("<revision>") == 3
+    assert len(session.requests) == 2
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_broken_response(monkeypatch, Reader):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    body = makeExport(range(1, 4)).decode("utf-8")
+    session = FakeSession(count=3, brokenAt=body.index("<id>3</id>"))
+    xml = dumpPage(session, getConfig(), Reader())
+    # the retry only asks for the revisions after the last complete one
+    assert session.requests[1]["offset"] == "2024-01-02T00:00:00Z"
+    assert [xml.count(f"<id>{i}</id>") for i in (1, 2, 3)] == [1, 1, 1]
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_continuation_connection_error(monkeypatch, Reader):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    session = FakeSession(count=5, maxLimit=2, failAt=1)
+    xml = dumpPage(session, getConfig(), Reader())
+    # the continuation request is retried, no revision is lost
+    assert [xml.count(f"<id>{i}</id>") for i in range(1, 6)] == [1] * 5
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_same_timestamp(Reader):
+    def feed(reader, revisions) -> str:
+        reader.start()
+        page = "  <page>\n    <title>Main Page</title>\n"
+        page += "".join(makeRevision(i, day) for i, day in revisions)
+        xml = (PREAMBLE + page + "  </page>\n</mediawiki>\n").encode("utf-8")
+        parts = reader.feed(xml)
+        return "".join(p if isinstance(p, str) else p.decode() for p in parts)
+
+    reader = Reader()
+    # revisions saved within the same second
+    xml = feed(reader, [(1, 1), (2, 2), (3, 2)])
+    assert xml.count("<revision>") == 3 and not reader.repeated
+    # the next ones, after the offset
+    xml = feed(reader, [(4, 3), (5, 3)])
+    assert xml.count("<revision>") == 2 and not reader.repeated
+    # a wiki that ignores the offset
+    assert feed(reader, [(1, 1), (2, 2)]) == "" and reader.repeated
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_export_missing_page(Reader):
+    session = FakeSession(count=0)
+    session.post = lambda *args, **kwargs: FakeResponse(
+        (PREAMBLE + "</mediawiki>\n").encode("utf-8")
+    )
+    with pytest.raises(PageMissingError) as e:
+        dumpPage(session, getConfig(curonly=True), Reader())
+    assert e.value.xml == PREAMBLE + "</mediawiki>\n"
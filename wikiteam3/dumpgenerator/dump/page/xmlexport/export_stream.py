@@ -0,0 +1,129 @@
+import re
+from typing import *
+
+from .export_reader import ExportReader
+
+SHA1_LINE = re.compile(rb"\n\s*<sha1(?:>\w+</sha1>|/>)\s*\n")
+TIMESTAMP = re.compile(rb"<timestamp>([^<]+)</timestamp>")
+REVID = re.compile(rb"<id>(\d+)</id>")  # the first one of a <revision>
+
+
+def stripSha1s(xml: bytes) -> bytes:
+    """Strips the <sha1> lines Special:Export adds, looking only after the
+    <text>, which is most of a revision"""
+    text = xml.rfind(b"</text>")
+    if text < 0:
+        return SHA1_LINE.sub(b"\n", xml)
+    return xml[:text] + SHA1_LINE.sub(b"\n", xml[text:])
+
+
+class ExportStream(ExportReader):
+    """Byte level reader of the Special:Export responses for one page
+
+    Like ExportReader, but instead of parsing the XML it only looks for the
+    tags around the <page> and its <revision>s: in the body of the response
+    a "<" always starts a tag, as text is escaped. The parts of the page
+    come out as the bytes the wiki sent, without <mediawiki>, <siteinfo>
+    and <sha1>s, ready to be written to the dump. Only the revision being
+    read is held in memory."""
+
+    closing = b"  </page>\n"
+
+    def start(self):
+        """Gets ready for a new response"""
+        self.buffer = bytearray()  # bytes of the response not returned yet
+        self.scanned = 0  # the buffer was searched for the next tag up to here
+        self.state = "preamble"
+        self.pages = 0  # <page>s in this response
+        self.complete = False  # </mediawiki> was read
+        self.repeated = False  # a revision that was already returned came again
+        self.offset = self.timestamp  # what the request asks to start after
+        self.raw = None if self.pageStarted or self.preamble else bytearray()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Scans the next chunk of the response, yields the parts of the
+        page it completes"""
+        if self.raw is not None:
+            self.keepPreamble(data)
+        self.buffer += data
+        while True:
+            if self.state == "preamble":
+                pos, tag = self.find(b"<page>", b"</mediawiki>")
+                if tag == b"<page>":
+                    self.consume(self.lineStart(pos))
+                    self.state = "opening"
+                    continue
+            elif self.state == "opening" or self.state == "page":
+                pos, tag = self.find(b"<revision>", b"</page>")
+                if not tag:
+                    return
+                part = bytes(self.buffer[: self.lineStart(pos)])
+                self.consume(len(part))
+                if self.state == "page" and part.strip():  # e.g. <upload>s
+                    yield part
+                elif self.state == "opening" and not self.pageStarted:
+                    self.pageStarted = True
+                    yield SHA1_LINE.sub(b"\n", part)
+                if tag == b"<revision>":
+                    self.state = "revision"
+                else:
+                    self.state = "rest"
+                    self.pages += 1
+                continue
+            elif self.state == "revision":
+                pos, tag = self.find(b"</revision>")
+                end = pos + len(tag or b"")
+                if not tag or end == len(self.buffer):
+                    return  # wait for the newline that may follow
+                end += self.buffer[end : end + 1] == b"\n"
+                revision = bytes(self.buffer[:end])
+                self.consume(end)
+                self.state = "page"
+                yield from self.getRevision(revision)
+                continue
+            elif self.state == "rest":  # e.g. the pages of --templates
+                pos, tag = self.find(b"</mediawiki>")
+            else:
+                self.consume(len(self.buffer))
+                return
+            # before or after the <page> there is nothing to keep
+            if tag == b"</mediawiki>":
+                self.complete = True
+                self.state = "done"
+                continue
+            self.consume(max(0, len(self.buffer) - 64))
+            return
+
+    def getRevision(self, revision: bytes) -> Iterator[bytes]:
+        """Yields `revision` unless it was already returned"""
+        timestamp = TIMESTAMP.search(revision)
+        timestamp = timestamp and timestamp.group(1).decode("utf-8")
+        revid = REVID.search(revision)
+        if not self.isNew(revid and revid.group(1).decode("utf-8"), timestamp):
+            return
+        yield stripSha1s(revision)
+        self.revisions += 1
+        self.timestamp = timestamp or self.timestamp
+
+    def find(self, *tags: bytes) -> Tuple[int, Optional[bytes]]:
+        """Position of the first of `tags` in the buffer, and which one"""
+        found = []
+        for tag in tags:
+            pos = self.buffer.find(tag, self.scanned)
+            if pos >= 0:
+                found.append((pos, tag))
+        if found:
+            return min(found)
+        # a tag may be cut at the end of the buffer
+        self.scanned = max(0, len(self.buffer) - max(map(len, tags)) + 1)
+        return -1, None
+
+    def lineStart(self, pos: int) -> int:
+        """Start of the line of the tag at `pos`, if it is alone in it"""
+        start = self.buffer.rfind(b"\n", 0, pos) + 1
+        return pos if self.buffer[start:pos].strip() else start
+
+    def consume(self, size: int) -> None:
+        """Drops the first `size` bytes of the buffer"""
+        del self.buffer[:size]
+        self.scanned = 0
@@ -15,77 +15,100 @@ try:
 except ImportError:
     import xml.etree.ElementTree as ET
 
-import xml.dom.minidom as MD
 
+def escapeXML(text: str) -> str:
+    """Escapes text and attribute values like minidom's toprettyxml() did"""
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
 
-def reconstructRevisions(root=None):
-    # print ET.tostring(rev)
-    page = ET.Element("stub")
-    edits = 0
+
+def serializeElement(indent: str, tag: str, text=None, attrib: Dict = None) -> str:
+    """One line of export XML, with `text` as the content of the element"""
+    xml = indent + "<" + tag
+    for name, value in (attrib or {}).items():
+        xml += f' {name}="{escapeXML(value)}"'
+    if text:
+        return xml + ">" + escapeXML(text) + "</" + tag + ">\n"
+    return xml + "/>\n"
+
+
+def reconstructRevisions(root=None) -> Tuple[str, int]:
+    """Serializes the <rev>s of an API:Revisions response straight into
+    indented <revision>s of a MediaWiki export, returns them and how many
+    there are"""
+    revisions = []
     for rev in (
         root.find("query").find("pages").find("page").find("revisions").findall("rev")
     ):
         try:
-            rev_ = ET.SubElement(page, "revision")
+            rev_ = "    <revision>\n"
             # id
-            ET.SubElement(rev_, "id").text = rev.attrib["revid"]
+            rev_ += serializeElement("      ", "id", rev.attrib["revid"])
             # parentid (optional, export-0.7+)
             if "parentid" in rev.attrib:
-                ET.SubElement(rev_, "parentid").text = rev.attrib["parentid"]
+                rev_ += serializeElement("      ", "parentid", rev.attrib["parentid"])
             # timestamp
-            ET.SubElement(rev_, "timestamp").text = rev.attrib["timestamp"]
+            rev_ += serializeElement("      ", "timestamp", rev.attrib["timestamp"])
             # contributor
-            contributor = ET.SubElement(rev_, "contributor")
             if "userhidden" not in rev.attrib:
-                ET.SubElement(contributor, "username").text = rev.attrib["user"]
-                ET.SubElement(contributor, "id").text = rev.attrib["userid"]
+                rev_ += "      <contributor>\n"
+                rev_ += serializeElement("        ", "username", rev.attrib["user"])
+                rev_ += serializeElement("        ", "id", rev.attrib["userid"])
+                rev_ += "      </contributor>\n"
             else:
-                contributor.set("deleted", "deleted")
+                rev_ += serializeElement(
+                    "      ", "contributor", attrib={"deleted": "deleted"}
+                )
             # comment (optional)
             if "commenthidden" in rev.attrib:
                 print("commenthidden")
-                comment = ET.SubElement(rev_, "comment")
-                comment.set("deleted", "deleted")
+                rev_ += serializeElement(
+                    "      ", "comment", attrib={"deleted": "deleted"}
+                )
             elif "comment" in rev.attrib and rev.attrib["comment"]:  # '' is empty
-                comment = ET.SubElement(rev_, "comment")
-                comment.text = rev.attrib["comment"]
+                rev_ += serializeElement("      ", "comment", rev.attrib["comment"])
             # minor edit (optional)
             if "minor" in rev.attrib:
-                ET.SubElement(rev_, "minor")
+                rev_ += serializeElement("      ", "minor")
             # model and format (optional, export-0.8+)
             if "contentmodel" in rev.attrib:
-                ET.SubElement(rev_, "model").text = rev.attrib[
-                    "contentmodel"
-                ]  # default: 'wikitext'
+                rev_ += serializeElement(
+                    "      ", "model", rev.attrib["contentmodel"]
+                )  # default: 'wikitext'
             if "contentformat" in rev.attrib:
-                ET.SubElement(rev_, "format").text = rev.attrib[
-                    "contentformat"
-                ]  # default: 'text/x-wiki'
+                rev_ += serializeElement(
+                    "      ", "format", rev.attrib["contentformat"]
+                )  # default: 'text/x-wiki'
             # text
-            text = ET.SubElement(rev_, "text")
             if "texthidden" not in rev.attrib:
-                text.attrib["xml:space"] = "preserve"
-                text.attrib["bytes"] = rev.attrib["size"]
-                text.text = rev.text
+                rev_ += serializeElement(
+                    "      ",
+                    "text",
+                    rev.text,
+                    {"xml:space": "preserve", "bytes": rev.attrib["size"]},
+                )
             else:
                 # NOTE: this is not the same as the text being empty
-                text.set("deleted", "deleted")
+                rev_ += serializeElement(
+                    "      ", "text", attrib={"deleted": "deleted"}
+                )
             # sha1
             if "sha1" in rev.attrib:
-                sha1 = ET.SubElement(rev_, "sha1")
-                sha1.text = rev.attrib["sha1"]
+                rev_ += serializeElement("      ", "sha1", rev.attrib["sha1"])
 
             elif "sha1hidden" in rev.attrib:
-                ET.SubElement(rev_, "sha1")  # stub
-            edits += 1
+                rev_ += serializeElement("      ", "sha1")  # stub
+            revisions.append(rev_ + "    </revision>\n")
         except Exception as e:
             # logerror(config=config, text='Error reconstructing revision, xml:%s' % (ET.tostring(rev)))
             print(ET.tostring(rev))
             traceback.print_exc()
-            page = None
-            edits = 0
             raise e
-    return page, edits
+    return "".join(revisions), len(revisions)
 
 
 def getXMLPageCoreWithApi(
@@ -245,11 +268,7 @@ def getXMLPageWithApi(config: Config = None, title="", verbose=True, session=Non
                 edits = 0
 
                 # transform the revision
-                rev_, edits = reconstructRevisions(root=root)
-                xmldom = MD.parseString(b"<stub1>" + ET.tostring(rev_) + b"</stub1>")
-                # convert it into text in case it throws MemoryError
-                # delete the first three line and last two line,which is for setting the indent
-                ret += "".join(xmldom.toprettyxml(indent="  ").splitlines(True)[3:-2])
+                ret, edits = reconstructRevisions(root=root)
                 yield ret
                 numberofedits += edits
                 if config.curonly or continueVal is None:  # no continue
@@ -0,0 +1,51 @@
+import xml.etree.ElementTree as ET
+
+from .page_xml_api import reconstructRevisions
+
+API = """<api><query><pages><page pageid="1" ns="0" title="A"><revisions>
+<rev revid="2" parentid="1" minor="" user="Ann &amp; &quot;Bo&quot;" userid="3" timestamp="2020-01-01T00:00:00Z" size="17" sha1="abc" contentmodel="wikitext" contentformat="text/x-wiki" comment="&lt;b&gt;" xml:space="preserve">one
+  &lt;b&gt; &amp; "q"</rev>
+<rev revid="3" parentid="0" userhidden="" timestamp="2020-01-02T00:00:00Z" size="0" sha1hidden="" comment="" xml:space="preserve"></rev>
+<rev revid="4" user="C" userid="5" timestamp="2020-01-03T00:00:00Z" size="3" texthidden="" commenthidden=""/>
+</revisions></page></pages></query></api>"""
+
+REVISIONS = """    <revision>
+      <id>2</id>
+      <parentid>1</parentid>
+      <timestamp>2020-01-01T00:00:00Z</timestamp>
+      <contributor>
+        <username>Ann &amp; &quot;Bo&quot;</username>
+        <id>3</id>
+      </contributor>
+      <comment>&lt;b&gt;</comment>
+      <minor/>
+      <model>wikitext</model>
+      <format>text/x-wiki</format>
+      <text xml:space="preserve" bytes="17">one
+  &lt;b&gt; &amp; &quot;q&quot;</text>
+      <sha1>abc</sha1>
+    </revision>
+    <revision>
+      <id>3</id>
+      <parentid>0</parentid>
+      <timestamp>2020-01-02T00:00:00Z</timestamp>
+      <contributor deleted="deleted"/>
+      <text xml:space="preserve" bytes="0"/>
+      <sha1/>
+    </revision>
+    <revision>
+      <id>4</id>
+      <timestamp>2020-01-03T00:00:00Z</timestamp>
+      <contributor>
+        <username>C</username>
+        <id>5</id>
+      </contributor>
+      <comment deleted="deleted"/>
+      <text deleted="deleted"/>
+    </revision>
+"""
+
+
+def test_reconstruct_revisions():
+    # the same XML minidom's toprettyxml() gave for the ElementTree we built
+    assert reconstructRevisions(root=ET.fromstring(API)) == (REVISIONS, 3)
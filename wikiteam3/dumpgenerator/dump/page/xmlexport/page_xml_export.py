@@ -3,42 +3,63 @@ import sys
 import time
 from typing import *
 
+import lxml.etree
 import requests
 
 from wikiteam3.dumpgenerator.api import handleStatusCode
 from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_reader import (
+    EXPORT_CHUNK_SIZE,
+    ExportReader,
+)
 from wikiteam3.dumpgenerator.exceptions import ExportAbortedError, PageMissingError
 from wikiteam3.dumpgenerator.log import logerror
 from wikiteam3.utils import uprint
+from wikiteam3.utils.rate_limit import AdaptiveTokenBucket, describeRate, getRetryAfter
 
 
 def getXMLPageCore(
-    headers: Dict = None, params: Dict = None, config: Config = None, session=None
-) -> str:
+    headers: Dict = None,
+    params: Dict = None,
+    config: Config = None,
+    session=None,
+    reader: ExportReader = None,
+) -> Iterator[str]:
     """"""
-    # returns a XML containing params['limit'] revisions (or current only), ending in </mediawiki>
-    # if retrieving params['limit'] revisions fails, returns a current only version
-    # if all fail, returns the empty string
-    xml = ""
+    # yields the <page> in a XML containing params['limit'] revisions (or
+    # current only) piece by piece, as `reader` parses the response
+    # if retrieving params['limit'] revisions fails, yields a current only version
+    # if all fail, raises ExportAbortedError
+    reader = reader or ExportReader()
     c = 0
     maxseconds = 100  # max seconds to wait in a single sleeping
     maxretries = config.retries  # x retries and skip
-    increment = 20  # increment every retry
+    retry_after = None  # Retry-After of the last response
+    limiter = getattr(session, "rate_limiter", None)
 
-    while not re.search(r"</mediawiki>", xml):
+    while c == 0 or not reader.complete:
         if c > 0 and c < maxretries:
-            wait = (
-                increment if increment * c < maxseconds else maxseconds
-            )  # incremental until maxseconds
-            print(
-                '    In attempt %d, XML for "%s" is wrong. Waiting %d seconds and reloading...'
-                % (c, params["pages"], wait)
-            )
-            time.sleep(wait)
+            if isinstance(limiter, AdaptiveTokenBucket):
+                # the next request waits for the slowed down rate limiter
+                limiter.throttle(config.index, retry_after)
+                print(
+                    '    In attempt %d, XML for "%s" is wrong. Slowing down to %s and reloading...'
+                    % (c, params["pages"], describeRate(session, config.index))
+                )
+            else:
+                wait = min(retry_after or 2**c, maxseconds)
+                print(
+                    '    In attempt %d, XML for "%s" is wrong. Waiting %d seconds and reloading...'
+                    % (c, params["pages"], wait)
+                )
+                time.sleep(wait)
             # reducing server load requesting smallest chunks (if curonly then
             # limit = 1 from mother function)
             if params["limit"] > 1:
                 params["limit"] = params["limit"] / 2  # half
+            # continue after the revisions we already got
+            if "offset" in params and reader.timestamp:
+                params["offset"] = reader.timestamp
         if c >= maxretries:
             print("    We have retried %d times" % (c))
             print(
@@ -60,9 +81,14 @@ def getXMLPageCore(
                     to_stdout=True,
                     text=f'Error while retrieving the full history of "{params["pages"]}". Trying to save only the last revision for this page',
                 )
-                return getXMLPageCore(
-                    headers=headers, params=params, config=config, session=session
+                yield from getXMLPageCore(
+                    headers=headers,
+                    params=params,
+                    config=config,
+                    session=session,
+                    reader=reader,
                 )
+                return
             else:
                 print("    Saving in the errors log, and skipping...")
                 logerror(
@@ -72,27 +98,43 @@ def getXMLPageCore(
                 )
                 raise ExportAbortedError(config.index)
         # FIXME HANDLE HTTP Errors HERE
+        # not complete until this response says so, a failed request of an
+        # offset continuation must not pass for the complete past response
+        reader.complete = False
         try:
-            r = session.post(
-                url=config.index, params=params, headers=headers, timeout=10
-            )
-            handleStatusCode(r)
-            xml = r.text
+            with session.post(
+                url=config.index,
+                params=params,
+                headers=headers,
+                timeout=10,
+                stream=True,
+            ) as r:
+                retry_after = getRetryAfter(r)
+                handleStatusCode(r)
+                reader.start()
+                for chunk in r.iter_content(chunk_size=EXPORT_CHUNK_SIZE):
+                    yield from reader.feed(chunk)
         except requests.exceptions.ConnectionError as e:
             print(f"    Connection error: {str(e.args[0])}")
-            xml = ""
         except requests.exceptions.ReadTimeout as e:
             print(f"    Read timeout: {str(e.args[0])}")
-            xml = ""
+        except requests.exceptions.ChunkedEncodingError as e:
+            print(f"    Broken response: {str(e.args[0])}")
+        except lxml.etree.XMLSyntaxError as e:
+            print(f"    Invalid XML: {e}")
         c += 1
 
-    return xml
 
+def getXMLPageWithExport(
+    config: Config = None,
+    title="",
+    verbose=True,
+    session=None,
+    reader: ExportReader = None,
+):
+    """Get the full history (or current only) of a page, as strings or, with
+    an ExportStream as `reader`, as the bytes the wiki sent"""
 
-def getXMLPageWithExport(config: Config = None, title="", verbose=True, session=None):
-    """Get the full history (or current only) of a page"""
-
-    truncated = False
     title_ = title
     title_ = re.sub(" ", "_", title_)
     # do not convert & into %26, title_ = re.sub('&', '%26', title_)
@@ -114,77 +156,34 @@ def getXMLPageWithExport(config: Config = None, title="", verbose=True, session=
     if config.templates:
         params["templates"] = 1
 
-    xml = getXMLPageCore(params=params, config=config, session=session)
-    if xml == "":
-        raise ExportAbortedError(config.index)
-    if "</page>" not in xml:
-        raise PageMissingError(params["title"], xml)
-    # strip these sha1s sums which keep showing up in the export and
-    # which are invalid for the XML schema (they only apply to
-    # revisions)
-    xml = re.sub(r"\n\s*<sha1>\w+</sha1>\s*\n", "\n", xml)
-    xml = re.sub(r"\n\s*<sha1/>\s*\n", "\n", xml)
-
-    yield xml.split("</page>")[0]
+    reader = reader or ExportReader()
+    yield from getXMLPageCore(
+        params=params, config=config, session=session, reader=reader
+    )
+    if not reader.pages:
+        raise PageMissingError(params["title"], reader.preamble + "</mediawiki>\n")
 
     # if complete history, check if this page history has > limit edits, if so, retrieve all using offset if available
     # else, warning about Special:Export truncating large page histories
-    r_timestamp = "<timestamp>([^<]+)</timestamp>"
-
-    edit_count = 0 + len(re.findall(r_timestamp, xml))
-    # search for timestamps in xml to avoid analysing empty pages like
-    # Special:Allpages and the random one
-    if not config.curonly and re.search(r_timestamp, xml):
-        while not truncated and params["offset"]:  # next chunk
-            # get the last timestamp from the acum XML
-            params["offset"] = re.findall(r_timestamp, xml)[-1]
-            try:
-                xml2 = getXMLPageCore(params=params, config=config, session=session)
-            except MemoryError:
-                print("The page's history exceeds our memory, halving limit.")
-                params["limit"] /= 2
-                continue
-
-            # are there more edits in this next XML chunk or no <page></page>?
-            if re.findall(r_timestamp, xml2):
-                if re.findall(r_timestamp, xml2)[-1] == params["offset"]:
-                    # again the same XML, this wiki does not support params in
-                    # Special:Export, offer complete XML up to X edits (usually
-                    # 1000)
-                    print(
-                        "ATTENTION: This wiki does not allow some parameters in Special:Export, therefore pages with large histories may be truncated"
-                    )
-                    truncated = True
-                    break
-                else:
-                    """</namespaces>
-                    </siteinfo>
-                    <page>
-                    <title>Main Page</title>
-                    <id>15580374</id>
-                    <restrictions>edit=sysop:move=sysop</restrictions> (?)
-                    <revision>
-                        <id>418009832</id>
-                        <timestamp>2011-03-09T19:57:06Z</timestamp>
-                        <contributor>
-                    """
-                    # offset is OK in this wiki, merge with the previous chunk
-                    # of this page history and continue
-                    try:
-                        xml2 = xml2.split("</page>")[0]
-                        yield "  <revision>" + (
-                            "<revision>".join(xml2.split("<revision>")[1:])
-                        )
-                    except MemoryError:
-                        "The page's history exceeds our memory, halving limit."
-                        params["limit"] /= 2
-                        continue
-                    xml = xml2
-                    edit_count += len(re.findall(r_timestamp, xml))
-            else:
-                params["offset"] = ""  # no more edits in this page history
-    yield "</page>\n"
+    edit_count = 0
+    while not config.curonly and edit_count < reader.revisions:  # next chunk
+        edit_count = reader.revisions
+        # only the revisions after the offset are yielded by the reader
+        params["offset"] = reader.timestamp
+        yield from getXMLPageCore(
+            params=params, config=config, session=session, reader=reader
+        )
+        if reader.repeated:
+            # again the same XML, this wiki does not support params in
+            # Special:Export, offer complete XML up to X edits (usually
+            # 1000)
+            print(
+                "ATTENTION: This wiki does not allow some parameters in Special:Export, therefore pages with large histories may be truncated"
+            )
+            break
+    yield reader.closing
 
+    edit_count = reader.revisions
     if verbose:
         if edit_count == 1:
             uprint(f"    {title.strip()}, 1 edit")
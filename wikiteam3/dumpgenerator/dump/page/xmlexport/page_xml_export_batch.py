@@ -0,0 +1,208 @@
+import re
+import time
+from typing import *
+
+import requests
+
+from wikiteam3.dumpgenerator.api import handleStatusCode
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_reader import EXPORT_CHUNK_SIZE
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_stream import (
+    SHA1_LINE,
+    ExportStream,
+)
+from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml_export import (
+    getXMLPageWithExport,
+)
+from wikiteam3.dumpgenerator.exceptions import PageMissingError
+from wikiteam3.utils import undoHTMLEntities, uprint
+from wikiteam3.utils.rate_limit import AdaptiveTokenBucket
+
+EXPORT_BATCH_SIZE = 20  # titles in the first Special:Export request
+EXPORT_BATCH_MAX = 500  # titles in a Special:Export request, at most
+EXPORT_BATCH_BYTES = 1024 * 1024  # size of a response the batches aim at
+
+PAGE = re.compile(rb"^[ \t]*<page>.*?</page>[ \t]*\n?", re.DOTALL | re.MULTILINE)
+TITLE = re.compile(rb"<title>([^<]*)</title>")
+
+
+class ExportBatcher:
+    """Number of titles of the next Special:Export request of --curonly
+
+    It follows the size of the pages: the batches grow until a response is
+    around EXPORT_BATCH_BYTES, and are halved when a response fails."""
+
+    def __init__(self, size=EXPORT_BATCH_SIZE):
+        self.size = size
+
+    def batches(self, titles: Iterable[str]) -> Iterator[List[str]]:
+        """Groups `titles`, each batch as large as the size is when it is taken"""
+        batch = []
+        for title in titles:
+            batch.append(title)
+            if len(batch) >= self.size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def update(self, pages: int, size: int) -> None:
+        """After a complete response of `size` bytes with `pages` pages"""
+        if not pages:
+            return
+        target = EXPORT_BATCH_BYTES * pages // max(size, 1)
+        self.size = max(1, min(target, self.size * 2, EXPORT_BATCH_MAX))
+
+    def shrink(self) -> None:
+        """After a failed response"""
+        self.size = max(1, self.size // 2)
+
+
+def splitExportPages(xml: bytes) -> Iterator[Tuple[str, bytes]]:
+    """Title and bytes of every complete <page> of a Special:Export response,
+    without the <sha1>s, as ExportStream writes them"""
+    for match in PAGE.finditer(xml):
+        page = match.group()
+        title = TITLE.search(page)
+        if title:
+            title = undoHTMLEntities(text=title.group(1).decode("utf-8"))
+            yield title, SHA1_LINE.sub(b"\n", page.rstrip(b" \t\n") + b"\n")
+
+
+class ExportPageSplitter:
+    """Splits a Special:Export response of several pages as it comes, as
+    splitExportPages() does: only the page being read is held in memory"""
+
+    def __init__(self):
+        self.buffer = bytearray()  # from the end of the last complete page
+        self.scanned = 0  # no </page> in the buffer up to here
+
+    def feed(self, data: bytes) -> Iterator[Tuple[str, bytes]]:
+        """Title and bytes of the pages `data` completes"""
+        self.buffer += data
+        end = self.buffer.rfind(b"</page>", self.scanned)
+        if end < 0:
+            self.scanned = max(0, len(self.buffer) - len(b"</page>"))
+            return
+        end = self.buffer.find(b"\n", end)  # the end of its line
+        if end < 0:
+            return
+        xml = bytes(self.buffer[: end + 1])
+        del self.buffer[: end + 1]
+        self.scanned = 0
+        yield from splitExportPages(xml)
+
+    def close(self) -> Iterator[Tuple[str, bytes]]:
+        """The last page, if the response ends right after it"""
+        yield from splitExportPages(bytes(self.buffer))
+
+    @property
+    def complete(self) -> bool:
+        return b"</mediawiki>" in self.buffer
+
+
+def getXMLPagesCore(
+    config: Config = None, titles: List[str] = None, session=None
+) -> Tuple[Dict[str, bytes], bool]:
+    """Asks Special:Export for the current revision of `titles` at once.
+    Returns the complete pages that came, by title, and whether the
+    response was complete"""
+    params = {
+        "title": config.export or "Special:Export",
+        "pages": "\n".join(title.replace(" ", "_") for title in titles),
+        "action": "submit",
+        "curonly": 1,
+        "limit": 1,
+    }
+    if config.templates:
+        params["templates"] = 1
+    # the pages of --templates are not asked for
+    asked = set(titles)
+    pages = {}
+    splitter = ExportPageSplitter()
+    try:
+        # in the body: hundreds of titles are too long for the URL
+        with session.post(url=config.index, data=params, timeout=10, stream=True) as r:
+            handleStatusCode(r)
+            for chunk in r.iter_content(chunk_size=EXPORT_CHUNK_SIZE):
+                for title, page in splitter.feed(chunk):
+                    if title in asked:
+                        pages[title] = page
+    except requests.exceptions.ConnectionError as e:
+        print(f"    Connection error: {str(e.args[0])}")
+    except requests.exceptions.ReadTimeout as e:
+        print(f"    Read timeout: {str(e.args[0])}")
+    except requests.exceptions.ChunkedEncodingError as e:
+        print(f"    Broken response: {str(e.args[0])}")
+    pages.update((t, page) for t, page in splitter.close() if t in asked)
+    complete = splitter.complete
+    limiter = getattr(session, "rate_limiter", None)
+    if not complete and isinstance(limiter, AdaptiveTokenBucket):
+        limiter.throttle(config.index)
+    return pages, complete
+
+
+def fetchXMLPages(
+    config: Config = None,
+    titles: List[str] = None,
+    session=None,
+    batcher: ExportBatcher = None,
+) -> Dict[str, Optional[bytes]]:
+    """<page> of every title, None for the missing ones"""
+    pages = {}
+    rest = titles
+    tries = 0
+    while True:
+        got, complete = getXMLPagesCore(config=config, titles=rest, session=session)
+        pages.update(got)
+        rest = [title for title in rest if title not in pages]
+        tries += 1
+        if complete or len(rest) <= 1 or tries >= config.retries:
+            break
+        # the error may be a passing one: the same batch once more, first
+        print(f"    In attempt {tries}, Special:Export of {len(rest)} pages is broken")
+        if not isinstance(getattr(session, "rate_limiter", None), AdaptiveTokenBucket):
+            time.sleep(min(2**tries, 100))  # else slowed down by getXMLPagesCore
+    if complete:
+        batcher.update(len(pages), sum(map(len, pages.values())))
+    else:
+        batcher.shrink()
+    if not complete and len(rest) > 1:
+        # the pages that did not come get smaller batches
+        half = len(rest) // 2
+        pages.update(fetchXMLPages(config, rest[:half], session, batcher))
+        pages.update(fetchXMLPages(config, rest[half:], session, batcher))
+        return pages
+
+    for title in rest:
+        # not in a complete response: the wiki may write the title
+        # differently, or the page may be missing, ask for it alone
+        try:
+            pages[title] = b"".join(
+                getXMLPageWithExport(
+                    config=config,
+                    title=title,
+                    verbose=False,
+                    session=session,
+                    reader=ExportStream(),
+                )
+            )
+        except PageMissingError:
+            pages[title] = None
+    return pages
+
+
+def getXMLPagesWithExport(
+    config: Config = None,
+    titles: List[str] = None,
+    session=None,
+    batcher: ExportBatcher = None,
+) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """Current revision of several pages, with as few Special:Export
+    requests as `batcher` allows. Yields every title in the order of
+    `titles` with its <page> as bytes, or None if the page is missing"""
+    pages = fetchXMLPages(config, titles, session, batcher or ExportBatcher())
+    for title in titles:
+        if pages[title] is not None:
+            uprint(f"    {title.strip()}, 1 edit")
+        yield title, pages[title]
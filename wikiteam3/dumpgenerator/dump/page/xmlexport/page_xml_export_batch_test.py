@@ -0,0 +1,165 @@
+import requests
+
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.test.fake_wiki import Corpus, FakeWiki
+
+from .export_stream import ExportStream
+from .page_xml_export_batch import (
+    EXPORT_BATCH_MAX,
+    ExportBatcher,
+    ExportPageSplitter,
+    getXMLPagesWithExport,
+    splitExportPages,
+)
+
+PREAMBLE = (
+    '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">\n'
+    "  <siteinfo>\n    <sitename>Wiki</sitename>\n  </siteinfo>\n"
+)
+
+
+def makePage(title: str) -> str:
+    return (
+        f"  <page>\n    <title>{title.replace('&', '&amp;')}</title>\n"
+        "    <ns>0</ns>\n    <id>1</id>\n"
+        "    <revision>\n      <id>7</id>\n"
+        "      <timestamp>2024-01-01T00:00:00Z</timestamp>\n"
+        '      <text xml:space="preserve" bytes="5">Hello</text>\n'
+        "      <sha1>abc</sha1>\n    </revision>\n  </page>\n"
+    )
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes, brokenAt: int = None):
+        self.body = body
+        self.brokenAt = brokenAt
+
+    def iter_content(self, chunk_size=1):
+        if self.brokenAt is not None:
+            yield self.body[: self.brokenAt]
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+        yield self.body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """Special:Export of the pages asked for, but the `missing` ones"""
+
+    def __init__(self, missing=(), brokenAt=None, broken=1):
+        self.missing = missing
+        self.brokenAt = brokenAt
+        self.broken = broken  # responses cut at `brokenAt`
+        self.requests = []
+
+    def post(self, url, timeout, stream, params=None, data=None, headers=None):
+        # the batches in the body, a page alone in the URL
+        titles = (data or params)["pages"].replace("_", " ").split("\n")
+        self.requests.append(titles)
+        body = PREAMBLE
+        body += "".join(makePage(t) for t in titles if t not in self.missing)
+        body = (body + "</mediawiki>\n").encode("utf-8")
+        brokenAt = self.brokenAt if len(self.requests) <= self.broken else None
+        return FakeResponse(body, brokenAt and body.index(brokenAt.encode("utf-8")))
+
+
+def getConfig() -> Config:
+    return Config(index="http://wiki/index.php", retries=3, curonly=True)
+
+
+def test_split_export_pages_as_export_stream():
+    xml = (PREAMBLE + makePage("A & B") + makePage("C") + "</mediawiki>\n").encode()
+    pages = list(splitExportPages(xml))
+    assert [title for title, _ in pages] == ["A & B", "C"]
+    stream = ExportStream()
+    single = b"".join(stream.feed(PREAMBLE.encode() + makePage("C").encode()))
+    assert pages[1][1] == single + stream.closing
+    assert b"<sha1>" not in pages[0][1]
+
+
+def test_export_page_splitter():
+    xml = (PREAMBLE + makePage("A & B") + makePage("C") + "</mediawiki>\n").encode()
+    splitter = ExportPageSplitter()
+    pages = []
+    for i in range(0, len(xml), 7):
+        pages += splitter.feed(xml[i : i + 7])
+        # nothing is held but the page being read
+        assert len(splitter.buffer) < len(makePage("A & B")) + len(PREAMBLE)
+    pages += splitter.close()
+    assert pages == list(splitExportPages(xml))
+    assert splitter.complete
+
+
+def test_export_batch_in_order():
+    session = FakeSession()
+    titles = ["A", "B & C", "D"]
+    pages = list(getXMLPagesWithExport(getConfig(), titles, session))
+    assert [title for title, _ in pages] == titles
+    assert all(page.startswith(b"  <page>") for _, page in pages)
+    assert session.requests == [titles]
+
+
+def test_export_batch_missing_pages():
+    session = FakeSession(missing=["B"])
+    pages = dict(getXMLPagesWithExport(getConfig(), ["A", "B", "C"], session))
+    assert pages["B"] is None and pages["A"] and pages["C"]
+    # the page that did not come is asked for alone
+    assert session.requests == [["A", "B", "C"], ["B"]]
+
+
+def test_export_batch_broken_response(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    session = FakeSession(brokenAt="<title>C</title>")
+    titles = ["A", "B", "C", "D", "E"]
+    batcher = ExportBatcher(size=5)
+    pages = dict(getXMLPagesWithExport(getConfig(), titles, session, batcher))
+    assert all(pages[title] for title in titles)
+    # the complete pages are kept, the rest is asked again
+    assert session.requests == [titles, ["C", "D", "E"]]
+    assert batcher.size >= 5  # not shrunk
+
+
+def test_export_batch_broken_responses(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    session = FakeSession(brokenAt="<title>C</title>", broken=3)
+    titles = ["A", "B", "C", "D", "E"]
+    batcher = ExportBatcher(size=5)
+    pages = dict(getXMLPagesWithExport(getConfig(), titles, session, batcher))
+    assert all(pages[title] for title in titles)
+    # split in halves once the retries are spent
+    rest = ["C", "D", "E"]
+    assert session.requests == [titles, rest, rest, ["C"], ["D", "E"]]
+
+
+def test_export_batcher_adapts():
+    batcher = ExportBatcher(size=10)
+    batches = batcher.batches(str(i) for i in range(100))
+    assert len(next(batches)) == 10
+    batcher.update(pages=10, size=10 * 1000)  # small pages: twice as many
+    assert len(next(batches)) == 20
+    batcher.update(pages=20, size=20 * 500 * 1024)  # 2 pages are 1 MiB
+    assert len(next(batches)) == 2
+    batcher.shrink()
+    assert len(next(batches)) == 1
+    batcher.size = EXPORT_BATCH_MAX
+    batcher.update(pages=1, size=1)
+    assert batcher.size == EXPORT_BATCH_MAX
+
+
+def test_export_batch_in_body():
+    corpus = Corpus(pages=EXPORT_BATCH_MAX, revisions=1, images=0, textSize=10)
+    titles = [corpus.getPage(i).title for i in range(corpus.pages)]
+    with FakeWiki(corpus) as wiki:
+        config = Config(index=wiki.index, retries=3, curonly=True)
+        batcher = ExportBatcher(size=EXPORT_BATCH_MAX)
+        pages = dict(getXMLPagesWithExport(config, titles, requests.Session(), batcher))
+    # too long for the URL of a single request
+    assert all(pages[title] for title in titles)
+    assert wiki.hits["index Special:Export"] == 1
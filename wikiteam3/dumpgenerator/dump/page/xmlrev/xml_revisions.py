@@ -12,8 +12,9 @@ from wikiteam3.dumpgenerator.api.namespaces import getNamespacesAPI
 from wikiteam3.dumpgenerator.api.page_titles import readTitles
 from wikiteam3.dumpgenerator.config import Config
 from wikiteam3.dumpgenerator.dump.page.xmlrev.xml_revisions_page import (
+    getPagesFromRaw,
     makeXmlFromPage,
-    makeXmlPageFromRaw,
+    makeXmlFromPageElement,
 )
 from wikiteam3.dumpgenerator.exceptions import PageMissingError
 from wikiteam3.dumpgenerator.log import logerror
@@ -35,6 +36,8 @@ def getXMLRevisionsByAllRevisions(
         namespaces = [ALL_NAMESPACE]  # magic number refers to "all"
     _nscontinue = nscontinue
     _arvcontinue = arvcontinue
+    # revids= accepts 50 IDs per request, 500 with apihighlimits
+    exportlimit = 500 if "apihighlimits" in site.rights else 50
 
     for namespace in namespaces:
         # Skip retrived namespace
@@ -113,7 +116,7 @@ def getXMLRevisionsByAllRevisions(
         else:
             # FIXME: this is not curonly, just different strategy to do all revisions
             # Just cycle through revision IDs and use the XML as is
-            print("Trying to list the revisions and to export them one by one")
+            print("Trying to list the revisions and to export them in batches")
             # We only need the revision ID, all the rest will come from the raw export
             arvparams["arvprop"] = "ids"
             try:
@@ -124,10 +127,6 @@ def getXMLRevisionsByAllRevisions(
                 print("POST request to the API failed, retrying with GET")
                 config.http_method = "GET"
                 continue
-            exportparams = {
-                "action": "query",
-                "export": "1",
-            }
             # Skip the namespace if it's empty
             if len(arvrequest["query"]["allrevisions"]) < 1:
                 continue
@@ -139,39 +138,20 @@ def getXMLRevisionsByAllRevisions(
                     revids.extend(
                         str(revision["revid"]) for revision in page["revisions"]
                     )
-                print(
-                    "        %d more revisions listed, until %s"
-                    % (len(revids), revids[-1])
-                )
-
-                # We can now get the XML for one revision at a time
-                # FIXME: we can actually get them in batches as we used to
-                # but need to figure out the continuation and avoid that the API
-                # chooses to give us only the latest for each page
-                for revid in revids:
-                    exportparams["revids"] = revid
-                    try:
-                        exportrequest = site.api(
-                            http_method=config.http_method, **exportparams
-                        )
-                    except requests.exceptions.HTTPError as e:
-                        if (
-                            e.response.status_code != 405
-                            or config.http_method != "POST"
-                        ):
-                            raise
+                if revids:
+                    print(
+                        "        %d more revisions listed, until %s"
+                        % (len(revids), revids[-1])
+                    )
 
-                        print("POST request to the API failed, retrying with GET")
-                        config.http_method = "GET"
-                        exportrequest = site.api(
-                            http_method=config.http_method, **exportparams
-                        )
-                    # This gives us a self-standing <mediawiki> element
-                    # but we only need the inner <page>: we can live with
-                    # duplication and non-ordering of page titles, but the
-                    # repeated header is confusing and would not even be valid
-                    xml = exportrequest["query"]["export"]["*"]  # type(xml) == str
-                    yield makeXmlPageFromRaw(xml, arvparams.get("arvcontinue", ""))
+                # Export the revisions as many at a time as the API allows
+                for i in range(0, len(revids), exportlimit):
+                    yield from getXMLRevisionsByIds(
+                        config,
+                        site,
+                        revids[i : i + exportlimit],
+                        arvparams.get("arvcontinue", ""),
+                    )
 
                 if "continue" not in arvrequest:
                     # End of continuation. We are done with this namespace.
@@ -196,40 +176,112 @@ def getXMLRevisionsByAllRevisions(
                     arvrequest["query"]["allrevisions"] = []
 
 
+def siteAPI(config: Config = None, site: mwclient.Site = None, **params):
+    """Call the API, falling back to GET if the wiki refuses POST"""
+    try:
+        return site.api(http_method=config.http_method, **params)
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code != 405 or config.http_method != "POST":
+            raise
+        print("POST request to the API failed, retrying with GET")
+        config.http_method = "GET"
+        return site.api(http_method=config.http_method, **params)
+
+
+def getXMLRevisionsByIds(
+    config: Config = None,
+    site: mwclient.Site = None,
+    revids: List[str] = None,
+    arvcontinue=None,
+):
+    """Export a batch of revisions by ID, yield one <page> per page
+
+    The revisions come from prop=revisions, following continuation until
+    every revision ID is either exported or logged as missing. They are
+    grouped by page, pages and revisions in the order they were listed.
+    (The raw export would only hold the latest revision of each page.)"""
+    requested = set(revids)
+    order = {revid: i for i, revid in enumerate(revids)}
+    pages = {}  # by page ID, the revisions of all the continuations
+    pparams = {
+        "action": "query",
+        "revids": "|".join(revids),
+        "prop": "revisions",
+        "rvprop": "ids|timestamp|user|userid|size|sha1|contentmodel|comment|content|flags",
+    }
+    while True:
+        prequest = siteAPI(config, site, **pparams)
+        for badrevid in prequest["query"].get("badrevids", {}):
+            if str(badrevid) not in requested:
+                continue  # again in every continuation
+            requested.discard(str(badrevid))
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f"Error: revision {badrevid} is missing in the wiki, could not export it",
+            )
+        for page in prequest["query"].get("pages", {}).values():
+            revisions = page.get("revisions") or []
+            if page["pageid"] in pages:
+                pages[page["pageid"]]["revisions"] += revisions
+            elif revisions:
+                pages[page["pageid"]] = page
+        # Content-heavy batches are cut by the API result size limit
+        if "continue" in prequest:
+            pparams.update(prequest["continue"])
+        else:
+            break
+
+    def firstListed(revision) -> int:
+        return order.get(str(revision["revid"]), len(order))
+
+    for page in pages.values():
+        page["revisions"].sort(key=firstListed)
+    for page in sorted(pages.values(), key=lambda p: firstListed(p["revisions"][0])):
+        try:
+            yield makeXmlFromPage(page, arvcontinue)
+        except PageMissingError:
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f'Error: empty revision from API. Could not export page: {page["title"]}',
+            )
+        finally:
+            for revision in page["revisions"]:
+                requested.discard(str(revision["revid"]))
+
+    for revid in requested:
+        logerror(
+            config=config,
+            to_stdout=True,
+            text=f"Error: revision {revid} was not returned by the API, could not export it",
+        )
+
+
 def getXMLRevisionsByTitles(
     config: Config = None, session=None, site: mwclient.Site = None, start=None
 ):
     c = 0
     if config.curonly:
-        # The raw XML export in the API gets a title and gives the latest revision.
+        # The raw XML export in the API gets titles and gives the latest
+        # revision of each, as many titles at once as the API takes.
         # We could also use the allpages API as generator but let's be consistent.
         print("Getting titles to export the latest revision for each")
+        titlelimit = 500 if "apihighlimits" in site.rights else 50
+        batchsize = max(1, min(config.api_chunksize, titlelimit))
+        titlelist = []
         for title in readTitles(config, session=session, start=start):
-            # TODO: respect verbose flag, reuse output from getXMLPage
-            print(f"    {title}")
-            # TODO: as we're doing one page and revision at a time, we might
-            # as well use xml format and exportnowrap=1 to use the string of,
-            # XML as is, but need to check how well the library handles it.
-            exportparams = {
-                "action": "query",
-                "titles": title,
-                "export": "1",
-            }
-            try:
-                exportrequest = site.api(http_method=config.http_method, **exportparams)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code != 405 or config.http_method != "POST":
-                    raise
-
-                print("POST request to the API failed, retrying with GET")
-                config.http_method = "GET"
-                exportrequest = site.api(http_method=config.http_method, **exportparams)
-            xml = str(exportrequest["query"]["export"]["*"])
-            c += 1
-            if c % 10 == 0:
-                print(f"\n->  Downloaded {c} pages\n")
-            # Because we got the fancy XML from the JSON format, clean it:
-            yield makeXmlPageFromRaw(xml, None)
+            titlelist.append(title)
+            if len(titlelist) < batchsize:
+                continue
+            yield from getXMLRevisionsExportByTitleList(config, site, titlelist)
+            c += len(titlelist)
+            titlelist = []
+            print(f"\n->  Downloaded {c} pages\n")
+        if titlelist:
+            yield from getXMLRevisionsExportByTitleList(config, site, titlelist)
+            c += len(titlelist)
+            print(f"\n->  Downloaded {c} pages\n")
     else:
         # This is the closest to what we usually do with Special:Export:
         # take one title at a time and try to get all revisions exported.
@@ -238,90 +290,202 @@ def getXMLRevisionsByTitles(
         # The XML needs to be made manually because the export=1 option
         # refuses to return an arbitrary number of revisions (see above).
         print("Getting titles to export all the revisions of each")
+        # Many titles can be asked at once, but then the API only gives the
+        # latest revision of each page. For pages with a single revision
+        # that is the whole history; the others are exported one by one.
+        titlelimit = 500 if "apihighlimits" in site.rights else 50
+        batchsize = max(1, min(config.api_chunksize, titlelimit))
         titlelist = []
-        # TODO: Decide a suitable number of a batched request. Careful:
-        # batched responses may not return all revisions.
-        for titlelist in readTitles(config, session=session, start=start, batch=False):
-            if type(titlelist) is not list:
-                titlelist = [titlelist]
-            for title in titlelist:
-                print(f"    {title}")
-            # Try and ask everything. At least on MediaWiki 1.16, uknown props are discarded:
-            # "warnings":{"revisions":{"*":"Unrecognized values for parameter 'rvprop': userid, sha1, contentmodel"}}}
-            pparams = {
-                "action": "query",
-                "titles": "|".join(titlelist),
-                "prop": "revisions",
-                "rvlimit": config.api_chunksize,
-                "rvprop": "ids|timestamp|user|userid|size|sha1|contentmodel|comment|content|flags",
-            }
+        for title in readTitles(config, session=session, start=start):
+            titlelist.append(title)
+            if len(titlelist) < batchsize:
+                continue
+            yield from getXMLRevisionsByTitleList(config, site, titlelist)
+            c += len(titlelist)
+            titlelist = []
+            print(f"\n->  Downloaded {c} pages\n")
+        if titlelist:
+            yield from getXMLRevisionsByTitleList(config, site, titlelist)
+            c += len(titlelist)
+            print(f"\n->  Downloaded {c} pages\n")
+
+
+def getXMLRevisionsExportByTitleList(
+    config: Config = None, site: mwclient.Site = None, titlelist: List[str] = None
+):
+    """Export the latest revision of a list of titles at once, yield one
+    <page> per page in the order of `titlelist`"""
+    for title in titlelist:
+        print(f"    {title}")
+    try:
+        exportrequest = siteAPI(
+            config, site, action="query", titles="|".join(titlelist), export="1"
+        )
+    except mwclient.errors.InvalidResponse:
+        logerror(
+            config=config,
+            to_stdout=True,
+            text=f'Error: page inaccessible? Could not export page: {"; ".join(titlelist)}',
+        )
+        return
+    query = exportrequest["query"]
+    # The titles the API answers for are not always the ones asked for
+    renamed = {}
+    for key in ("normalized", "converted", "redirects"):
+        for n in query.get(key, []):
+            renamed[n["from"]] = n["to"]
+    missing = set()
+    for page in query.get("pages", {}).values():
+        if "missing" in page or "invalid" in page:
+            missing.add(page["title"])
+    # Because we got the fancy XML from the JSON format, clean it:
+    pages = {}
+    for page in getPagesFromRaw(str(query["export"]["*"])):
+        pages[page.findtext("{*}title")] = page
+
+    for title in titlelist:
+        name = renamed.get(title, title)
+        name = renamed.get(name, name)
+        if name in pages:
+            yield makeXmlFromPageElement(pages.pop(name), None)
+        elif name in missing or title in missing or len(titlelist) == 1:
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f'The page "{title}" was missing in the wiki (probably deleted)',
+            )
+        else:
+            # Not in the export, though the page exists: ask for it alone
+            yield from getXMLRevisionsExportByTitleList(config, site, [title])
+
+
+def getXMLRevisionsByTitleList(
+    config: Config = None, site: mwclient.Site = None, titlelist: List[str] = None
+):
+    """Export the history of a list of titles, yield one <page> per page
+    in the order of `titlelist`.
+
+    The latest revision of every page is asked without its content, only
+    to know from its parentid whether it is the whole history: those pages
+    are exported together by revision ID, the others one by one."""
+    for title in titlelist:
+        print(f"    {title}")
+    pparams = {
+        "action": "query",
+        "titles": "|".join(titlelist),
+        "prop": "revisions",
+        "rvprop": "ids",
+    }
+    pages = {}
+    normalized = {}
+    while True:
+        try:
+            prequest = siteAPI(config, site, **pparams)
+        except mwclient.errors.InvalidResponse:
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f'Error: page inaccessible? Could not export page: {"; ".join(titlelist)}',
+            )
+            return
+        query = prequest.get("query", {})
+        for n in query.get("normalized", []):
+            normalized[n["from"]] = n["to"]
+        for page in query.get("pages", {}).values():
+            # Pages the API had no room for come back without revisions
+            if "revisions" in page or page["title"] not in pages:
+                pages[page["title"]] = page
+        if "continue" in prequest:
+            pparams.update(prequest["continue"])
+        elif "query-continue" in prequest:
+            pparams.update(prequest["query-continue"]["revisions"])
+        else:
+            break
+
+    revids = []  # of the pages in a row that have a single revision
+    for title in titlelist:
+        page = pages.get(normalized.get(title, title))
+        if page is None or "missing" in page or "invalid" in page:
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f'The page "{title}" was missing in the wiki (probably deleted)',
+            )
+            continue
+        revisions = page.get("revisions", [])
+        if len(revisions) == 1 and revisions[0].get("parentid") == 0:
+            # The latest revision is the first one: it is the whole history
+            revids.append(str(revisions[0]["revid"]))
+            continue
+        if revids:
+            yield from getXMLRevisionsByIds(config, site, revids)
+            revids = []
+        yield from getXMLRevisionsByTitle(config, site, title)
+    if revids:
+        yield from getXMLRevisionsByIds(config, site, revids)
+
+
+def getXMLRevisionsByTitle(
+    config: Config = None, site: mwclient.Site = None, title: str = ""
+):
+    """Export all the revisions of one page, following rvcontinue"""
+    # Try and ask everything. At least on MediaWiki 1.16, uknown props are discarded:
+    # "warnings":{"revisions":{"*":"Unrecognized values for parameter 'rvprop': userid, sha1, contentmodel"}}}
+    pparams = {
+        "action": "query",
+        "titles": title,
+        "prop": "revisions",
+        "rvlimit": config.api_chunksize,
+        "rvprop": "ids|timestamp|user|userid|size|sha1|contentmodel|comment|content|flags",
+    }
+    try:
+        prequest = siteAPI(config, site, **pparams)
+    except mwclient.errors.InvalidResponse:
+        logerror(
+            config=config,
+            to_stdout=True,
+            text=f"Error: page inaccessible? Could not export page: {title}",
+        )
+        return
+
+    # Be ready to iterate if there is continuation.
+    while True:
+        # Get the revision data returned by the API: prequest is the initial request
+        # or the new one after continuation at the bottom of this while loop.
+        # The array is called "pages" even if there's only one.
+        try:
+            pages = prequest["query"]["pages"]
+        except KeyError:
+            logerror(
+                config=config,
+                to_stdout=True,
+                text=f"Error: page inaccessible? Could not export page: {title}",
+            )
+            break
+        # Go through the data we got to build the XML.
+        for pageid in pages:
             try:
-                prequest = site.api(http_method=config.http_method, **pparams)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code != 405 or config.http_method != "POST":
-                    raise
-                print("POST request to the API failed, retrying with GET")
-                config.http_method = "GET"
-                prequest = site.api(http_method=config.http_method, **pparams)
-            except mwclient.errors.InvalidResponse:
+                yield makeXmlFromPage(pages[pageid], None)
+            except PageMissingError:
                 logerror(
                     config=config,
                     to_stdout=True,
-                    text=f'Error: page inaccessible? Could not export page: {"; ".join(titlelist)}',
+                    text=f"Error: empty revision from API. Could not export page: {title}",
                 )
                 continue
 
-            # Be ready to iterate if there is continuation.
-            while True:
-                # Get the revision data returned by the API: prequest is the initial request
-                # or the new one after continuation at the bottom of this while loop.
-                # The array is called "pages" even if there's only one.
-                try:
-                    pages = prequest["query"]["pages"]
-                except KeyError:
-                    logerror(
-                        config=config,
-                        to_stdout=True,
-                        text=f'Error: page inaccessible? Could not export page: {"; ".join(titlelist)}',
-                    )
-                    break
-                # Go through the data we got to build the XML.
-                for pageid in pages:
-                    try:
-                        yield makeXmlFromPage(pages[pageid], None)
-                    except PageMissingError:
-                        logerror(
-                            config=config,
-                            to_stdout=True,
-                            text=f'Error: empty revision from API. Could not export page: {"; ".join(titlelist)}',
-                        )
-                        continue
-
-                # Get next batch of revisions if there's more.
-                if "continue" in prequest.keys():
-                    print("Getting more revisions for the page")
-                    for key, value in prequest["continue"].items():
-                        pparams[key] = value
-                elif "query-continue" in prequest.keys():
-                    rvstartid = prequest["query-continue"]["revisions"]["rvstartid"]
-                    pparams["rvstartid"] = rvstartid
-                else:
-                    break
-
-                try:
-                    prequest = site.api(http_method=config.http_method, **pparams)
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 405 and config.http_method == "POST":
-                        print("POST request to the API failed, retrying with GET")
-                        config.http_method = "GET"
-                        prequest = site.api(http_method=config.http_method, **pparams)
+        # Get next batch of revisions if there's more.
+        if "continue" in prequest.keys():
+            print("Getting more revisions for the page")
+            for key, value in prequest["continue"].items():
+                pparams[key] = value
+        elif "query-continue" in prequest.keys():
+            rvstartid = prequest["query-continue"]["revisions"]["rvstartid"]
+            pparams["rvstartid"] = rvstartid
+        else:
+            break
 
-            # We're done iterating for this title or titles.
-            c += len(titlelist)
-            # Reset for the next batch.
-            titlelist = []
-            if c % 10 == 0:
-                print(f"\n->  Downloaded {c} pages\n")
+        prequest = siteAPI(config, site, **pparams)
 
 
 def getXMLRevisions(
@@ -336,6 +500,7 @@ def getXMLRevisions(
         apiurl.path.replace("api.php", ""),
         scheme=apiurl.scheme,
         pool=session,
+        compress=False,  # the session asks for its own encodings
     )
 
     if useAllrevision:
@@ -372,7 +537,7 @@ def getXMLRevisions(
         # Find last title
         if lastPage is not None:
             try:
-                start = lastPage.find("title")
+                start = lastPage.find("title").text
             except Exception:
                 print(
                     f"Failed to find title in last trunk XML: {lxml.etree.tostring(lastPage)}"
@@ -1,14 +1,28 @@
+import re
+from typing import *
+
 from lxml import etree
-from lxml.builder import E
 
 from wikiteam3.dumpgenerator.exceptions import PageMissingError
 
+# What lxml refuses to serialize: the characters XML 1.0 does not allow
+NOT_XML = re.compile(r"[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
 
-def makeXmlPageFromRaw(xml, arvcontinue) -> str:
-    """Discard the metadata around a <page> element in <mediawiki> string"""
+
+def getPagesFromRaw(xml) -> List[etree._Element]:
+    """Return the <page> elements of a <mediawiki> string"""
     root = etree.XML(xml)
     find = etree.XPath("//*[local-name() = 'page']")
-    page = find(root)[0]
+    return find(root)
+
+
+def makeXmlPageFromRaw(xml, arvcontinue) -> str:
+    """Discard the metadata around a <page> element in <mediawiki> string"""
+    return makeXmlFromPageElement(getPagesFromRaw(xml)[0], arvcontinue)
+
+
+def makeXmlFromPageElement(page: etree._Element, arvcontinue) -> str:
+    """Output a <page> element of a raw export as a string"""
     if arvcontinue is not None:
         page.attrib["arvcontinue"] = arvcontinue
     # The tag will inherit the namespace, like:
@@ -17,25 +31,57 @@ def makeXmlPageFromRaw(xml, arvcontinue) -> str:
     return etree.tostring(page, pretty_print=True, encoding="unicode")
 
 
+def escapeXmlText(text: str) -> str:
+    """Escapes the text of an element as lxml does"""
+    if NOT_XML.search(text):
+        raise ValueError(
+            "All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters"
+        )
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace("\r", "&#13;")
+    )
+
+
+def escapeXmlAttribute(value: str) -> str:
+    """Escapes the value of an attribute as lxml does"""
+    return (
+        escapeXmlText(value)
+        .replace('"', "&quot;")
+        .replace("\n", "&#10;")
+        .replace("\t", "&#9;")
+    )
+
+
+def makeXmlElement(indent: str, tag: str, text: str = None, attrib: Dict = None):
+    """One element of a pretty printed <page>, `text` being its content"""
+    xml = indent + "<" + tag
+    for name, value in (attrib or {}).items():
+        xml += f' {name}="{escapeXmlAttribute(value)}"'
+    if text is None:
+        return xml + "/>\n"
+    return xml + ">" + escapeXmlText(text) + "</" + tag + ">\n"
+
+
 def makeXmlFromPage(page: dict, arvcontinue) -> str:
-    """Output an XML document as a string from a page as in the API JSON"""
+    """Output an XML document as a string from a page as in the API JSON
+
+    The revisions are written out directly in mwcli's dump.xml order, the
+    same as etree.tostring(pretty_print=True) of the page would be"""
     try:
-        p = E.page(
-            E.title(str(page["title"])),
-            E.ns(str(page["ns"])),
-            E.id(str(page["pageid"])),
-        )
         if arvcontinue is not None:
-            p.attrib["arvcontinue"] = arvcontinue
+            xml = ['<page arvcontinue="%s">\n' % escapeXmlAttribute(arvcontinue)]
+        else:
+            xml = ["<page>\n"]
+        xml.append(makeXmlElement("  ", "title", str(page["title"])))
+        xml.append(makeXmlElement("  ", "ns", str(page["ns"])))
+        xml.append(makeXmlElement("  ", "id", str(page["pageid"])))
         for rev in page["revisions"]:
             # Older releases like MediaWiki 1.16 do not return all fields.
             userid = rev["userid"] if "userid" in rev else 0
             size = rev["size"] if "size" in rev else 0
-            # Create rev object
-            revision = [
-                E.id(str(rev["revid"])),
-                E.timestamp(rev["timestamp"]),
-            ]
 
             # The text, user, comment, sha1 may be deleted/suppressed
             if ("texthidden" in rev) or ("textmissing" in rev):
@@ -43,25 +89,11 @@ def makeXmlFromPage(page: dict, arvcontinue) -> str:
                     "Warning: text missing/hidden in pageid %d revid %d"
                     % (page["pageid"], rev["revid"])
                 )
-                revision.append(
-                    E.text(
-                        **{
-                            "bytes": str(size),
-                            "deleted": "deleted",
-                        }
-                    )
-                )
+                attrib = {"bytes": str(size), "deleted": "deleted"}
+                text = makeXmlElement("    ", "text", None, attrib)
             else:
-                text = str(rev["*"])
-                revision.append(
-                    E.text(
-                        text,
-                        **{
-                            "bytes": str(size),
-                            "{http://www.w3.org/XML/1998/namespace}space": "preserve",
-                        }
-                    )
-                )
+                attrib = {"bytes": str(size), "xml:space": "preserve"}
+                text = makeXmlElement("    ", "text", str(rev["*"]), attrib)
 
             if "user" not in rev:
                 if "userhidden" not in rev:
@@ -69,59 +101,41 @@ def makeXmlFromPage(page: dict, arvcontinue) -> str:
                         "Warning: user not hidden but missing user in pageid %d revid %d"
                         % (page["pageid"], rev["revid"])
                     )
-                revision.append(E.contributor(deleted="deleted"))
+                attrib = {"deleted": "deleted"}
+                contributor = makeXmlElement("    ", "contributor", None, attrib)
             else:
-                revision.append(
-                    E.contributor(
-                        E.username(str(rev["user"])),
-                        E.id(str(userid)),
-                    )
+                contributor = (
+                    "    <contributor>\n"
+                    + makeXmlElement("      ", "username", str(rev["user"]))
+                    + makeXmlElement("      ", "id", str(userid))
+                    + "    </contributor>\n"
                 )
 
-            if "sha1" in rev:
-                revision.append(E.sha1(rev["sha1"]))
-
-            elif "sha1hidden" in rev:
-                revision.append(E.sha1())  # stub
+            xml.append("  <revision>\n")
+            xml.append(makeXmlElement("    ", "id", str(rev["revid"])))
+            # Sometimes a missing parentid is not replaced with a 0 as it should.
+            if "parentid" in rev:
+                xml.append(makeXmlElement("    ", "parentid", str(rev["parentid"])))
+            xml.append(makeXmlElement("    ", "timestamp", rev["timestamp"]))
+            xml.append(contributor)
+            if "minor" in rev:
+                xml.append("    <minor/>\n")
             if "commenthidden" in rev:
-                revision.append(E.comment(deleted="deleted"))
+                xml.append('    <comment deleted="deleted"/>\n')
             elif "comment" in rev and rev["comment"]:
-                revision.append(E.comment(str(rev["comment"])))
-
+                xml.append(makeXmlElement("    ", "comment", str(rev["comment"])))
             if "contentmodel" in rev:
-                revision.append(E.model(rev["contentmodel"]))
+                xml.append(makeXmlElement("    ", "model", rev["contentmodel"]))
             if "contentformat" in rev:
-                revision.append(E.format(rev["contentformat"]))
-            # Sometimes a missing parentid is not replaced with a 0 as it should.
-            if "parentid" in rev:
-                revision.append(E.parentid(str(rev["parentid"])))
-
-            if "minor" in rev:
-                revision.append(E.minor())
-
-            # mwcli's dump.xml order
-            revisionTags = [
-                "id",
-                "parentid",
-                "timestamp",
-                "contributor",
-                "minor",
-                "comment",
-                "origin",
-                "model",
-                "format",
-                "text",
-                "sha1",
-            ]
-            revisionElementsDict = {elem.tag: elem for elem in revision}
-            _revision = E.revision()
-            for tag in revisionTags:
-                if tag in revisionElementsDict:
-                    _revision.append(revisionElementsDict.pop(tag))
-            for elem in revisionElementsDict.values():
-                _revision.append(elem)
-            p.append(_revision)
+                xml.append(makeXmlElement("    ", "format", rev["contentformat"]))
+            xml.append(text)
+            if "sha1" in rev:
+                xml.append(makeXmlElement("    ", "sha1", rev["sha1"]))
+            elif "sha1hidden" in rev:
+                xml.append("    <sha1/>\n")  # stub
+            xml.append("  </revision>\n")
+        xml.append("</page>\n")
     except KeyError as e:
         print(e)
         raise PageMissingError(page["title"], e)
-    return etree.tostring(p, pretty_print=True, encoding="unicode")
+    return "".join(xml)
@@ -0,0 +1,76 @@
+import pytest
+
+from .xml_revisions_page import makeXmlFromPage
+
+PAGE = {
+    "title": "A & B",
+    "ns": 0,
+    "pageid": 7,
+    "revisions": [
+        {
+            "revid": 1,
+            "parentid": 0,
+            "minor": "",
+            "timestamp": "2020-01-01T00:00:00Z",
+            "user": "Ann",
+            "userid": 3,
+            "size": 12,
+            "sha1": "abc",
+            "comment": "<b>",
+            "contentmodel": "wikitext",
+            "contentformat": "text/x-wiki",
+            "*": 'one\r\n"two" & <three>',
+        },
+        {
+            "revid": 2,
+            "timestamp": "2020-01-02T00:00:00Z",
+            "userhidden": "",
+            "texthidden": "",
+            "sha1hidden": "",
+            "commenthidden": "",
+        },
+    ],
+}
+
+# etree.tostring(pretty_print=True) of the page built with lxml.builder
+XML = """<page arvcontinue="20200102000000|2">
+  <title>A &amp; B</title>
+  <ns>0</ns>
+  <id>7</id>
+  <revision>
+    <id>1</id>
+    <parentid>0</parentid>
+    <timestamp>2020-01-01T00:00:00Z</timestamp>
+    <contributor>
+      <username>Ann</username>
+      <id>3</id>
+    </contributor>
+    <minor/>
+    <comment>&lt;b&gt;</comment>
+    <model>wikitext</model>
+    <format>text/x-wiki</format>
+    <text bytes="12" xml:space="preserve">one&#13;
+"two" &amp; &lt;three&gt;</text>
+    <sha1>abc</sha1>
+  </revision>
+  <revision>
+    <id>2</id>
+    <timestamp>2020-01-02T00:00:00Z</timestamp>
+    <contributor deleted="deleted"/>
+    <comment deleted="deleted"/>
+    <text bytes="0" deleted="deleted"/>
+    <sha1/>
+  </revision>
+</page>
+"""
+
+
+def test_make_xml_from_page():
+    assert makeXmlFromPage(PAGE, "20200102000000|2") == XML
+    assert makeXmlFromPage(PAGE, None).startswith("<page>\n  <title>")
+
+
+def test_make_xml_from_page_not_xml():
+    page = dict(PAGE, title="A\x00B")
+    with pytest.raises(ValueError):
+        makeXmlFromPage(page, None)
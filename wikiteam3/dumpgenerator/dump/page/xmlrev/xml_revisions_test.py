@@ -0,0 +1,88 @@
+import html
+import re
+
+import mwclient
+
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.test.fake_wiki import Corpus, FakeWiki
+
+from .xml_revisions import (
+    getXMLRevisionsByIds,
+    getXMLRevisionsByTitleList,
+    getXMLRevisionsExportByTitleList,
+)
+
+
+def test_export_by_title_list(tmp_path):
+    corpus = Corpus(pages=10, revisions=3, images=0)
+    config = Config(api="", path=str(tmp_path), http_method="POST")
+    with FakeWiki(corpus) as wiki:
+        site = mwclient.Site(wiki.url[len("http://") :], "/", scheme="http")
+        titles = [
+            "Page 0000001",
+            "page_0000000",
+            "Page 9999999",
+            "Talk:Page 0000003 & Ça va",
+        ]
+        pages = list(getXMLRevisionsExportByTitleList(config, site, titles))
+    # one request for them all, in the order asked, the missing one logged
+    assert wiki.hits["api userinfo+export"] == 1
+    assert [re.search(r"<title>(.*)</title>", page).group(1) for page in pages] == [
+        "Page 0000001",
+        "Page 0000000",
+        "Talk:Page 0000003 &amp; Ça va",
+    ]
+    for page, index in zip(pages, (1, 0, 3)):
+        latest = corpus.getPage(index).first + corpus.getPage(index).count - 1
+        assert re.findall(r"<revision>\s*<id>(\d+)</id>", page) == [str(latest)]
+    with open(tmp_path / "errors.log", encoding="utf-8") as f:
+        assert 'The page "Page 9999999" was missing' in f.read()
+
+
+def test_revisions_by_ids(tmp_path):
+    corpus = Corpus(pages=4, revisions=4, images=0, textSize=2000)
+    config = Config(api="", path=str(tmp_path), http_method="POST")
+    first, second = corpus.getPage(1), corpus.getPage(2)
+    # interleaved as allrevisions may list them, and one missing
+    revids = [second.first, first.first, first.first + 1, 999999]
+    revids += [second.first + 1, first.first + 2]
+    with FakeWiki(corpus, apiMaxResultSize=3000) as wiki:
+        site = mwclient.Site(wiki.url[len("http://") :], "/", scheme="http")
+        pages = list(
+            getXMLRevisionsByIds(config, site, [str(revid) for revid in revids])
+        )
+    # one <page> per page, in the listing order, its revisions in order too
+    assert [re.search(r"<id>(\d+)</id>", page).group(1) for page in pages] == [
+        str(second.id),
+        str(first.id),
+    ]
+    assert re.findall(r"<revision>\s*<id>(\d+)</id>", pages[0]) == [
+        str(second.first),
+        str(second.first + 1),
+    ]
+    assert re.findall(r"<revision>\s*<id>(\d+)</id>", pages[1]) == [
+        str(first.first + i) for i in range(3)
+    ]
+    with open(tmp_path / "errors.log", encoding="utf-8") as f:
+        assert "revision 999999 is missing" in f.read()
+
+
+def test_revisions_by_title_list(tmp_path):
+    corpus = Corpus(pages=12, revisions=2, images=0)
+    config = Config(api="", path=str(tmp_path), http_method="POST", api_chunksize=50)
+    titles = [corpus.getPage(i).title for i in (0, 3, 1, 6, 9)]
+    with FakeWiki(corpus) as wiki:
+        site = mwclient.Site(wiki.url[len("http://") :], "/", scheme="http")
+        wiki.hits.clear()
+        pages = list(getXMLRevisionsByTitleList(config, site, titles))
+    assert [re.search(r"<title>(.*)</title>", page).group(1) for page in pages] == [
+        html.escape(title, quote=False) for title in titles
+    ]
+    for page, index in zip(pages, (0, 3, 1, 6, 9)):
+        first, count = corpus.getPage(index).first, corpus.getPage(index).count
+        revids = re.findall(r"<revision>\s*<id>(\d+)</id>", page)
+        assert sorted(map(int, revids)) == list(range(first, first + count))
+    # the titles without their content, the pages of a single revision in
+    # a row at once, and the others alone
+    assert [corpus.getPage(i).count for i in (0, 3, 1, 6, 9)] == [1, 1, 2, 1, 1]
+    assert wiki.hits["api userinfo+revisions"] == 4
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+from typing import *
+
+import lxml.etree
+
+from wikiteam3.dumpgenerator.dump.xmldump.xml_compress import FramedXMLFile
+from wikiteam3.utils import undoHTMLEntities
+
+
+def getCheckpointFilename(xmlfilename: str) -> str:
+    """Returns the name of the checkpoint file kept next to a XML dump"""
+
+    return f"{xmlfilename}.checkpoint.json"
+
+
+def writeCheckpoint(xmlfilename: str, state: Dict) -> None:
+    """Atomically replaces the checkpoint of a XML dump"""
+
+    checkpointfilename = getCheckpointFilename(xmlfilename)
+    with open(f"{checkpointfilename}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(f"{checkpointfilename}.tmp", checkpointfilename)
+
+
+def saveCheckpoint(xmlfile=None, pageOffset: int = 0, page: str = "") -> None:
+    """Records the <page> just written to `xmlfile`, which started at byte
+    `pageOffset`: everything before it is known to be complete"""
+
+    # A compressed dump can only be cut back to the start of a frame: the
+    # checkpoint stays on the first page of the frame
+    if isinstance(xmlfile, FramedXMLFile) and not xmlfile.endPage(page):
+        return
+    title = re.search(r"<title>([^<]+)</title>", page)
+    ns = re.search(r"<ns>(-?\d+)</ns>", page)
+    revids = re.findall(r"<revision>\s*<id>(\d+)</id>", page)
+    arvcontinue = re.search(r'<page arvcontinue="(.*?)">', page)
+
+    xmlfile.flush()
+    writeCheckpoint(
+        xmlfile.name,
+        {
+            "offset": xmlfile.tell(),
+            "page_offset": pageOffset,
+            "title": title and undoHTMLEntities(text=title.group(1)),
+            "ns": ns and int(ns.group(1)),
+            "revid": revids and int(revids[-1]) or None,
+            "arvcontinue": arvcontinue and arvcontinue.group(1),
+            "complete": False,
+        },
+    )
+
+
+def completeCheckpoint(xmlfile=None) -> None:
+    """Marks the XML dump as complete, once its footer is written"""
+
+    state = loadCheckpoint(xmlfile.name) or {}
+    xmlfile.flush()
+    state.update(offset=xmlfile.tell(), complete=True)
+    writeCheckpoint(xmlfile.name, state)
+
+
+def loadCheckpoint(xmlfilename: str) -> Optional[Dict]:
+    """Returns the checkpoint of a XML dump, or None if there is none that
+    matches the file on disk"""
+
+    try:
+        with open(getCheckpointFilename(xmlfilename), encoding="utf-8") as f:
+            state = json.load(f)
+        if os.path.getsize(xmlfilename) < state["offset"]:
+            print(f"Checkpoint of {xmlfilename} is ahead of the file, ignoring it")
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return state
+
+
+def removeCheckpoint(xmlfilename: str) -> None:
+    """Removes the checkpoint of a XML dump, if any"""
+
+    try:
+        os.remove(getCheckpointFilename(xmlfilename))
+    except FileNotFoundError:
+        pass
+
+
+def truncateXMLDumpToCheckpoint(xmlfilename: str) -> Optional[lxml.etree._Element]:
+    """Truncates the XML dump right before the last page of its checkpoint and
+    returns that page as a stub <page> element with the title, ns and
+    arvcontinue to resume from, like parseLastPageChunk() does"""
+
+    state = loadCheckpoint(xmlfilename)
+    if state is None or state["complete"] or not state["title"]:
+        return None
+
+    with open(xmlfilename, "r+b") as f:
+        f.truncate(state["page_offset"])
+
+    lastPage = lxml.etree.Element("page")
+    if state["arvcontinue"] is not None:
+        lastPage.set("arvcontinue", state["arvcontinue"])
+    lxml.etree.SubElement(lastPage, "title").text = state["title"]
+    if state["ns"] is not None:
+        lxml.etree.SubElement(lastPage, "ns").text = str(state["ns"])
+    return lastPage
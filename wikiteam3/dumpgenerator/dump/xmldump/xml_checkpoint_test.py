@@ -0,0 +1,76 @@
+import os
+
+from .xml_checkpoint import (
+    completeCheckpoint,
+    loadCheckpoint,
+    saveCheckpoint,
+    truncateXMLDumpToCheckpoint,
+)
+
+HEADER = "<mediawiki>\n"
+
+
+def makePage(title: str, ns: int, revid: int, arvcontinue: str) -> str:
+    return (
+        f'  <page arvcontinue="{arvcontinue}">\n'
+        f"    <title>{title}</title>\n"
+        f"    <ns>{ns}</ns>\n"
+        f"    <revision>\n      <id>{revid}</id>\n    </revision>\n"
+        "  </page>\n"
+    )
+
+
+def writePages(filename: str, pages):
+    with open(filename, "w", encoding="utf-8") as xmlfile:
+        xmlfile.write(HEADER)
+        for page in pages:
+            pageOffset = xmlfile.tell()
+            xmlfile.write(page)
+            saveCheckpoint(xmlfile, pageOffset, page)
+        return xmlfile.tell()
+
+
+def test_checkpoint_resume(tmp_path):
+    filename = str(tmp_path / "wiki-history.xml")
+    first = makePage("Main Page", 0, 1, "")
+    last = makePage("Talk:Ä &amp; B", 1, 42, "20240101|7")
+    offset = writePages(filename, [first, last])
+    # an incomplete page left by an interrupted session
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write("  <page>\n    <title>Cut")
+
+    checkpoint = loadCheckpoint(filename)
+    assert checkpoint["offset"] == offset
+    assert checkpoint["title"] == "Talk:Ä & B"
+    assert (checkpoint["ns"], checkpoint["revid"]) == (1, 42)
+    assert not checkpoint["complete"]
+
+    lastPage = truncateXMLDumpToCheckpoint(filename)
+    assert lastPage.find("title").text == "Talk:Ä & B"
+    assert lastPage.find("ns").text == "1"
+    assert lastPage.attrib["arvcontinue"] == "20240101|7"
+    with open(filename, encoding="utf-8") as f:
+        assert f.read() == HEADER + first
+
+
+def test_checkpoint_complete(tmp_path):
+    filename = str(tmp_path / "wiki-history.xml")
+    writePages(filename, [makePage("Main Page", 0, 1, "")])
+    with open(filename, "a", encoding="utf-8") as xmlfile:
+        xmlfile.write("</mediawiki>\n")
+        completeCheckpoint(xmlfile)
+
+    checkpoint = loadCheckpoint(filename)
+    assert checkpoint["complete"]
+    assert checkpoint["offset"] == os.path.getsize(filename)
+    assert truncateXMLDumpToCheckpoint(filename) is None
+
+
+def test_checkpoint_ahead_of_dump(tmp_path):
+    filename = str(tmp_path / "wiki-history.xml")
+    writePages(filename, [makePage("Main Page", 0, 1, "")])
+    with open(filename, "r+b") as f:
+        f.truncate(len(HEADER))
+
+    assert loadCheckpoint(filename) is None
+    assert truncateXMLDumpToCheckpoint(filename) is None
@@ -0,0 +1,339 @@
+import lzma
+import os
+import re
+import struct
+import zlib
+from typing import *
+
+from wikiteam3.utils import undoHTMLEntities
+
+XML_FRAME_SIZE = 16 * 1024 * 1024  # uncompressed bytes of a frame, at least
+XML_COMPRESSIONS = {"xz": ".xz", "zstd": ".zst"}  # and their file suffixes
+XML_MULTISTREAM_PAGES = 100  # pages of a frame of a multistream dump, at most
+
+PAGE = re.compile(r"^[ \t]*<page[ >].*?</page>[ \t]*\n?", re.DOTALL | re.MULTILINE)
+PAGE_TITLE = re.compile(r"<title>([^<]*)</title>")
+PAGE_ID = re.compile(r"<id>(\d+)</id>")
+
+XZ_FOOTER_MAGIC = b"YZ"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def getCompressor(compression: str):
+    """A compressor for one frame, with compress() and flush() to end it"""
+    if compression == "xz":
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ)
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=9).compressobj()
+
+
+def getDecompressor(compression: str):
+    """A decompressor for one frame, with decompress() and eof once it ends"""
+    if compression == "xz":
+        return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def decompressFrame(compression: str, data: bytes) -> bytes:
+    return getDecompressor(compression).decompress(data)
+
+
+class FramedXMLFile:
+    """XML dump compressed as it is written, in independent frames
+
+    Every frame is a whole xz stream or zstd frame: the file as a whole is
+    what xz -d or zstd -d expect, and a frame can be decompressed on its
+    own. Frames end between <page>s once they hold XML_FRAME_SIZE bytes,
+    so a dump can be cut back to the start of any frame to resume it. It
+    takes str and bytes, as the text file of a plain dump and its .buffer.
+
+    With an `index`, a multistream dump: frames of `pagesPerFrame` pages
+    at most, and a line offset:id:title in the index for every page, the
+    offset being the one of its frame in the dump."""
+
+    def __init__(
+        self,
+        filename: str,
+        mode: str,
+        compression: str,
+        index: TextIO = None,
+        pagesPerFrame: int = 0,
+    ):
+        self.name = filename
+        self.compression = compression
+        self.raw = open(filename, mode + "b")
+        self.raw.seek(0, 2)
+        self.frameStart = self.raw.tell()  # where the current frame starts
+        self.frameSize = 0  # uncompressed bytes in the current frame
+        self.pages = 0  # complete pages in the current frame
+        self.compressor = None
+        self.index = index
+        self.indexLines = []  # of the current frame, written once it ends
+        self.pagesPerFrame = pagesPerFrame
+
+    @property
+    def buffer(self) -> "FramedXMLFile":
+        return self
+
+    def write(self, data: Union[str, bytes]) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.compressor is None:
+            self.compressor = getCompressor(self.compression)
+        self.raw.write(self.compressor.compress(data))
+        self.frameSize += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        """Where the dump can be cut back to: the start of the current frame"""
+        return self.frameStart
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def endFrame(self) -> None:
+        if self.compressor is not None:
+            self.raw.write(self.compressor.flush())
+            self.raw.flush()
+            self.compressor = None
+        if self.index is not None and self.indexLines:
+            # only once the frame is on disk, the index never gets ahead
+            self.index.writelines(self.indexLines)
+            self.index.flush()
+        self.indexLines = []
+        self.frameStart = self.raw.tell()
+        self.frameSize = 0
+        self.pages = 0
+
+    def endPage(self, page: Union[str, bytes] = "") -> bool:
+        """After a complete <page>: ends the frame if it is large enough.
+        Returns whether the page was the first one of its frame"""
+        if self.index is not None:
+            self.indexLines.append(makeIndexLine(self.frameStart, page))
+        first = self.pages == 0
+        self.pages += 1
+        if self.frameSize >= XML_FRAME_SIZE or 0 < self.pagesPerFrame <= self.pages:
+            self.endFrame()
+        return first
+
+    def close(self) -> None:
+        self.endFrame()
+        self.raw.close()
+        if self.index is not None:
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def openXMLFile(filename: str, mode: str, compression: str = "", indexfilename=""):
+    """The XML dump, to write to it as text, compressed or not. With an
+    `indexfilename`, a multistream dump and its index"""
+    if indexfilename:
+        index = open(indexfilename, mode, encoding="utf-8")
+        return FramedXMLFile(
+            filename, mode, compression, index, pagesPerFrame=XML_MULTISTREAM_PAGES
+        )
+    if compression:
+        return FramedXMLFile(filename, mode, compression)
+    return open(filename, mode, encoding="utf-8")
+
+
+def makeIndexLine(offset: int, page: Union[str, bytes]) -> str:
+    """offset:id:title of a <page> of a multistream dump, as in the index of
+    the multistream dumps of Wikimedia"""
+    # the title and id come first, no need to decode all of a large page
+    head = page[:4096]
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", errors="ignore")
+    title = PAGE_TITLE.search(head)
+    pageid = PAGE_ID.search(head)
+    title = undoHTMLEntities(text=title.group(1)) if title else ""
+    return f"{offset}:{pageid.group(1) if pageid else ''}:{title}\n"
+
+
+def readXMLIndex(indexfilename: str) -> Iterator[Tuple[int, Optional[int], str]]:
+    """Offset of the frame, id and title of every page of a multistream dump"""
+    with open(indexfilename, encoding="utf-8") as f:
+        for line in f:
+            if line.endswith("\n"):
+                offset, pageid, title = line[:-1].split(":", 2)
+                yield int(offset), pageid and int(pageid) or None, title
+
+
+def truncateXMLIndex(indexfilename: str, size: int) -> None:
+    """Drops from the index of a multistream dump the pages of the frames
+    past `size`, once the dump is cut back to it"""
+    if not os.path.exists(indexfilename):
+        return
+    with open(indexfilename, encoding="utf-8") as f:
+        lines = [
+            line
+            for line in f
+            if line.endswith("\n") and int(line.split(":", 1)[0]) < size
+        ]
+    with open(f"{indexfilename}.tmp", "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(f"{indexfilename}.tmp", indexfilename)
+
+
+def readFrame(filename: str, compression: str, offset: int) -> str:
+    """The XML of the frame at `offset`, decompressing nothing else"""
+    decompressor = getDecompressor(compression)
+    xml = bytearray()
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        while not decompressor.eof:
+            data = f.read(64 * 1024)
+            if not data:
+                raise EOFError(f"{filename} ends in the frame at {offset}")
+            xml += decompressor.decompress(data)
+    return xml.decode("utf-8")
+
+
+def readXMLPage(
+    filename: str, compression: str, offset: int, pageid: int = None, title=""
+) -> Optional[str]:
+    """The <page> of a multistream dump with `pageid` or `title`, from the
+    frame at `offset` the index gives for it"""
+    for match in PAGE.finditer(readFrame(filename, compression, offset)):
+        page = match.group()
+        head = page[:4096]
+        if pageid is not None:
+            found = PAGE_ID.search(head)
+            if found and int(found.group(1)) == pageid:
+                return page
+        else:
+            found = PAGE_TITLE.search(head)
+            if found and undoHTMLEntities(text=found.group(1)) == title:
+                return page
+    return None
+
+
+def readMultibyte(data: bytes, pos: int) -> Tuple[int, int]:
+    """An integer of the xz index, and the position after it"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def findLastXzStream(f, end: int) -> Optional[Tuple[int, int]]:
+    """Start and end of the last complete xz stream before `end`, reading
+    only its footer and index"""
+    window = 64 * 1024
+    while end >= 32:
+        # the footer of a complete stream is its last 12 bytes
+        f.seek(max(0, end - window))
+        data = f.read(end - max(0, end - window))
+        base = end - len(data)
+        pos = data.rfind(XZ_FOOTER_MAGIC)
+        while pos >= 10:
+            footer = data[pos - 10 : pos + 2]
+            crc, backwardSize = struct.unpack("<II", footer[:8])
+            if zlib.crc32(footer[4:10]) == crc:
+                streamEnd = base + pos + 2
+                indexSize = (backwardSize + 1) * 4
+                indexStart = streamEnd - 12 - indexSize
+                f.seek(indexStart)
+                index = f.read(indexSize)
+                records, i = readMultibyte(index, 1)
+                blocks = 0
+                for _ in range(records):
+                    unpadded, i = readMultibyte(index, i)
+                    _, i = readMultibyte(index, i)
+                    blocks += (unpadded + 3) // 4 * 4
+                return indexStart - blocks - 12, streamEnd
+            pos = data.rfind(XZ_FOOTER_MAGIC, 0, pos)
+        if base == 0:
+            break
+        end = base + 11  # a footer may be cut at the start of the window
+    return None
+
+
+def findLastZstdFrame(f, end: int) -> Optional[Tuple[int, int]]:
+    """Start and end of the last complete zstd frame before `end`, walking
+    the frame and block headers from the start of the file"""
+    last = None
+    pos = 0
+    while pos + 6 <= end:
+        f.seek(pos)
+        header = f.read(14)
+        if header[:4] != ZSTD_MAGIC:
+            break
+        descriptor = header[4]
+        singleSegment = descriptor & 0x20
+        contentSize = (descriptor >> 6) & 3
+        size = 5 + (0 if singleSegment else 1)
+        size += (0, 1, 2, 4)[descriptor & 3]
+        size += (1 if singleSegment else 0, 2, 4, 8)[contentSize]
+        block = pos + size
+        while True:
+            f.seek(block)
+            blockHeader = f.read(3)
+            if len(blockHeader) < 3:
+                return last
+            value = int.from_bytes(blockHeader, "little")
+            blockType = (value >> 1) & 3
+            block += 3 + (1 if blockType == 1 else value >> 3)
+            if value & 1:  # the last block
+                break
+        frameEnd = block + (4 if descriptor & 4 else 0)
+        if frameEnd > end:
+            break
+        last = pos, frameEnd
+        pos = frameEnd
+    return last
+
+
+def findLastFrame(filename: str, compression: str) -> Optional[Tuple[int, int]]:
+    """Start and end of the last complete frame of a compressed XML dump,
+    without decompressing the rest"""
+    with open(filename, "rb") as f:
+        f.seek(0, 2)
+        end = f.tell()
+        if compression == "xz":
+            return findLastXzStream(f, end)
+        return findLastZstdFrame(f, end)
+
+
+def readLastFrame(filename: str, compression: str) -> str:
+    """The XML of the last complete frame of a compressed XML dump"""
+    frame = findLastFrame(filename, compression)
+    if frame is None:
+        return ""
+    with open(filename, "rb") as f:
+        f.seek(frame[0])
+        data = f.read(frame[1] - frame[0])
+    return decompressFrame(compression, data).decode("utf-8")
+
+
+def truncateCompressedXMLDump(filename: str, compression: str) -> str:
+    """Cuts a compressed XML dump back to the start of its last complete
+    frame, like truncateXMLDump() does to a plain one. Returns the XML of
+    the frame from its first <page>: the dump resumes from that page.
+
+    With the header as the last complete frame, returns "". Without any
+    complete frame, cuts nothing and raises EOFError."""
+    frame = findLastFrame(filename, compression)
+    if frame is None:
+        raise EOFError(f"{filename} has no complete frame, not even the header")
+    xml = readLastFrame(filename, compression)
+    start = xml.find("<page")
+    if start < 0:  # the header
+        with open(filename, "r+b") as f:
+            f.truncate(frame[1])
+        return ""
+    with open(filename, "r+b") as f:
+        f.truncate(frame[0])
+    return xml[xml.rfind("\n", 0, start) + 1 :]
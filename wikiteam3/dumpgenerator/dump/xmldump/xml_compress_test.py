@@ -0,0 +1,160 @@
+import lzma
+import os
+
+import pytest
+
+from wikiteam3.dumpgenerator.dump.xmldump import xml_compress
+from wikiteam3.dumpgenerator.dump.xmldump.xml_checkpoint import (
+    loadCheckpoint,
+    saveCheckpoint,
+    truncateXMLDumpToCheckpoint,
+)
+
+from .xml_compress import (
+    FramedXMLFile,
+    findLastFrame,
+    findLastZstdFrame,
+    openXMLFile,
+    readLastFrame,
+    readXMLIndex,
+    readXMLPage,
+    truncateCompressedXMLDump,
+    truncateXMLIndex,
+)
+
+HEADER = "<mediawiki>\n  <siteinfo>\n  </siteinfo>\n"
+
+
+def makePage(i: int) -> str:
+    return (
+        f"  <page>\n    <title>Page {i} &amp; co</title>\n    <ns>0</ns>\n"
+        f"    <id>{i + 1}</id>\n  </page>\n"
+    )
+
+
+def writeDump(filename, compression, pages, indexfilename="") -> FramedXMLFile:
+    xmlfile = openXMLFile(filename, "w", compression, indexfilename)
+    xmlfile.write(HEADER)
+    xmlfile.endFrame()
+    for i in range(pages):
+        pageOffset = xmlfile.tell()
+        xmlfile.write(makePage(i))
+        saveCheckpoint(xmlfile, pageOffset, makePage(i))
+    return xmlfile
+
+
+@pytest.fixture(autouse=True)
+def smallFrames(monkeypatch):
+    # frames of 3 pages, or 2 in a multistream dump
+    monkeypatch.setattr(xml_compress, "XML_FRAME_SIZE", 200)
+    monkeypatch.setattr(xml_compress, "XML_MULTISTREAM_PAGES", 2)
+
+
+def test_xz_frames(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    with writeDump(filename, "xz", pages=10) as xmlfile:
+        xmlfile.write("</mediawiki>\n")
+    # one xz file as a whole, every frame a stream of its own
+    with lzma.open(filename, "rt", encoding="utf-8") as f:
+        xml = f.read()
+    assert xml == HEADER + "".join(map(makePage, range(10))) + "</mediawiki>\n"
+    assert readLastFrame(filename, "xz").endswith("</mediawiki>\n")
+    with open(filename, "rb") as f:
+        assert findLastFrame(filename, "xz")[1] == len(f.read())
+
+
+def test_xz_truncate(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    xmlfile = writeDump(filename, "xz", pages=10)
+    xmlfile.flush()  # interrupted in the middle of a frame
+    lastPageChunk = truncateCompressedXMLDump(filename, "xz")
+    assert lastPageChunk.startswith(makePage(6))
+    with lzma.open(filename, "rt", encoding="utf-8") as f:
+        assert f.read() == HEADER + "".join(map(makePage, range(6)))
+
+
+def test_xz_truncate_to_checkpoint(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    xmlfile = writeDump(filename, "xz", pages=10)
+    xmlfile.flush()
+    # the checkpoint is on the first page of the last frame
+    assert loadCheckpoint(filename)["page_offset"] == xmlfile.frameStart
+    assert truncateXMLDumpToCheckpoint(filename).findtext("title") == "Page 9 & co"
+    with lzma.open(filename, "rt", encoding="utf-8") as f:
+        assert f.read() == HEADER + "".join(map(makePage, range(9)))
+
+
+def test_xz_truncate_header(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    xmlfile = writeDump(filename, "xz", pages=1)
+    xmlfile.flush()
+    assert truncateCompressedXMLDump(filename, "xz") == ""
+    with lzma.open(filename, "rt", encoding="utf-8") as f:
+        assert f.read() == HEADER
+    with open(filename, "r+b") as f:
+        f.truncate(5)
+    # not even the header: nothing is cut, it is up to the caller
+    with pytest.raises(EOFError):
+        truncateCompressedXMLDump(filename, "xz")
+    assert os.path.getsize(filename) == 5
+
+
+def test_multistream(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    indexfilename = str(tmp_path / "dump-index.txt")
+    with writeDump(filename, "xz", 5, indexfilename) as xmlfile:
+        xmlfile.write("</mediawiki>\n")
+    index = list(readXMLIndex(indexfilename))
+    assert [(pageid, title) for _, pageid, title in index] == [
+        (i + 1, f"Page {i} & co") for i in range(5)
+    ]
+    # frames of 2 pages after the header
+    offsets = [offset for offset, _, _ in index]
+    assert offsets[0] > 0 and offsets[0] == offsets[1] < offsets[2] == offsets[3]
+    for i, (offset, pageid, title) in enumerate(index):
+        assert readXMLPage(filename, "xz", offset, pageid) == makePage(i)
+        assert readXMLPage(filename, "xz", offset, title=title) == makePage(i)
+    assert readXMLPage(filename, "xz", offsets[0], 3) is None
+
+
+def test_multistream_truncate(tmp_path):
+    filename = str(tmp_path / "dump.xml.xz")
+    indexfilename = str(tmp_path / "dump-index.txt")
+    xmlfile = writeDump(filename, "xz", 5, indexfilename)
+    xmlfile.flush()
+    # the page of the incomplete frame is not in the index yet
+    assert len(list(readXMLIndex(indexfilename))) == 4
+    assert truncateCompressedXMLDump(filename, "xz").startswith(makePage(2))
+    with open(indexfilename, "a", encoding="utf-8") as f:
+        f.write("123")  # a line cut short
+    truncateXMLIndex(indexfilename, os.path.getsize(filename))
+    assert [pageid for _, pageid, _ in readXMLIndex(indexfilename)] == [1, 2]
+
+
+def makeZstdFrame(data: bytes) -> bytes:
+    """A zstd frame with a single raw block, content size in one byte"""
+    block = (len(data) << 3 | 1).to_bytes(3, "little")
+    return xml_compress.ZSTD_MAGIC + bytes([0x20, len(data)]) + block + data
+
+
+def test_zstd_frame_walker(tmp_path):
+    frames = [makeZstdFrame(b"header"), makeZstdFrame(b"page 1"), b"\x28\xb5"]
+    with open(tmp_path / "dump.xml.zst", "wb") as f:
+        f.write(b"".join(frames))
+        end = f.tell()
+    with open(tmp_path / "dump.xml.zst", "rb") as f:
+        assert findLastZstdFrame(f, end) == (len(frames[0]), end - 2)
+        assert findLastZstdFrame(f, end - 3) == (0, len(frames[0]))
+        assert findLastZstdFrame(f, 5) is None
+
+
+def test_zstd_truncate(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    filename = str(tmp_path / "dump.xml.zst")
+    with writeDump(filename, "zstd", pages=10) as xmlfile:
+        xmlfile.write("</mediawiki>\n")
+    with open(filename, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        assert reader.read().decode().endswith(makePage(9) + "</mediawiki>\n")
+    assert truncateCompressedXMLDump(filename, "zstd").startswith(makePage(9))
+    assert readLastFrame(filename, "zstd").endswith(makePage(8))
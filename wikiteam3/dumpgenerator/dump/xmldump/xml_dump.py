@@ -1,14 +1,41 @@
+import dataclasses
+import io
+import os
 import re
+import shutil
 import sys
+import tempfile
 from typing import *
 
 import lxml.etree
 
+from wikiteam3.dumpgenerator.api.namespaces import getNamespacesAPI
 from wikiteam3.dumpgenerator.api.page_titles import readTitles
-from wikiteam3.dumpgenerator.cli import Delay
 from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_stream import ExportStream
 from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml import getXMLPage
+from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml_export import (
+    getXMLPageWithExport,
+)
+from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml_export_batch import (
+    ExportBatcher,
+    getXMLPagesWithExport,
+)
 from wikiteam3.dumpgenerator.dump.page.xmlrev.xml_revisions import getXMLRevisions
+from wikiteam3.dumpgenerator.dump.xmldump.xml_checkpoint import (
+    completeCheckpoint,
+    removeCheckpoint,
+    saveCheckpoint,
+    truncateXMLDumpToCheckpoint,
+    writeCheckpoint,
+)
+from wikiteam3.dumpgenerator.dump.xmldump.xml_compress import (
+    XML_COMPRESSIONS,
+    FramedXMLFile,
+    openXMLFile,
+    truncateCompressedXMLDump,
+    truncateXMLIndex,
+)
 from wikiteam3.dumpgenerator.dump.xmldump.xml_header import getXMLHeader
 from wikiteam3.dumpgenerator.dump.xmldump.xml_truncate import (
     parseLastPageChunk,
@@ -17,6 +44,11 @@ from wikiteam3.dumpgenerator.dump.xmldump.xml_truncate import (
 from wikiteam3.dumpgenerator.exceptions import PageMissingError
 from wikiteam3.dumpgenerator.log import logerror
 from wikiteam3.utils import cleanXML, domain2prefix, undoHTMLEntities
+from wikiteam3.utils.rate_limit import describeRate
+from wikiteam3.utils.thread_pool import threadMap
+from wikiteam3.utils.traffic import setPhase
+
+XML_SPOOL_SIZE = 8 * 1024 * 1024  # bytes of a page a worker keeps in memory
 
 
 def doXMLRevisionDump(
@@ -28,9 +60,7 @@ def doXMLRevisionDump(
 ):
     try:
         r_timestamp = "<timestamp>([^<]+)</timestamp>"
-        r_arvcontinue = '<page arvcontinue="(.*?)">'
 
-        lastArvcontinue = None
         for xml in getXMLRevisions(
             config=config,
             session=session,
@@ -38,19 +68,16 @@ def doXMLRevisionDump(
             useAllrevision=useAllrevisions,
         ):
             numrevs = len(re.findall(r_timestamp, xml))
-            if arvcontinueRe := re.findall(r_arvcontinue, xml):
-                curArvcontinue = arvcontinueRe[0]
-                if lastArvcontinue != curArvcontinue:
-                    Delay(config=config, session=session)
-                    lastArvcontinue = curArvcontinue
             # Due to how generators work, it's expected this may be less
             xml = cleanXML(xml=xml)
+            pageOffset = xmlfile.tell()
             xmlfile.write(xml)
+            saveCheckpoint(xmlfile, pageOffset, xml)
 
             xmltitle = re.search(r"<title>([^<]+)</title>", xml)
             title = undoHTMLEntities(text=xmltitle.group(1))
-            print(f"{title}, {numrevs} edits (--xmlrevisions)")
-            # Delay(config=config, session=session)
+            rate = describeRate(session, config.api)
+            print(f"{title}, {numrevs} edits (--xmlrevisions) [{rate}]")
     except AttributeError as e:
         print(e)
         print("This API library version is not working")
@@ -59,6 +86,155 @@ def doXMLRevisionDump(
         print(e)
 
 
+def getXMLShardFilename(xmlfilename: str, namespace: int, done=False) -> str:
+    """Shard of the XML dump holding one namespace, `.part` until complete"""
+    return f"{xmlfilename}.ns{namespace}" + ("" if done else ".part")
+
+
+def doXMLRevisionShard(
+    config: Config = None, session=None, xmlfilename="", namespace: int = 0
+):
+    """Dump the revisions of one namespace into its own shard, resuming it
+    from its last page if a previous session left it incomplete"""
+    shardfilename = getXMLShardFilename(xmlfilename, namespace)
+    donefilename = getXMLShardFilename(xmlfilename, namespace, done=True)
+    if os.path.exists(donefilename):
+        print(f"Namespace {namespace} was completed in the previous session")
+        return
+
+    lastPage = truncateXMLDumpToCheckpoint(shardfilename)
+    if lastPage is not None:
+        print(f"Resuming the shard of namespace {namespace} from its checkpoint")
+    elif os.path.exists(shardfilename) and os.path.getsize(shardfilename) > 0:
+        size = os.path.getsize(shardfilename)
+        lastPageChunk = truncateXMLDump(shardfilename)
+        if lastPageChunk.strip():
+            lastPage = parseLastPageChunk(lastPageChunk)
+        # A shard holding a single page can't be truncated, start it again
+        if (
+            lastPage is None
+            or "arvcontinue" not in lastPage.attrib
+            or os.path.getsize(shardfilename) >= size
+        ):
+            print(f"Restarting the incomplete shard of namespace {namespace}")
+            lastPage = None
+            open(shardfilename, "w").close()
+            removeCheckpoint(shardfilename)
+        else:
+            print(f"Resuming the shard of namespace {namespace}")
+
+    # Each worker has its own copy, e.g. for the POST to GET fallback
+    shardconfig = dataclasses.replace(config, namespaces=[namespace])
+    with open(shardfilename, "a", encoding="utf-8") as shardfile:
+        doXMLRevisionDump(
+            shardconfig, session, shardfile, lastPage, useAllrevisions=True
+        )
+    os.replace(shardfilename, donefilename)
+    removeCheckpoint(shardfilename)
+
+
+def doXMLRevisionDumpSharded(
+    config: Config = None, session=None, xmlfilename="", header="", footer=""
+):
+    """Dump several namespaces at the same time, one shard per namespace,
+    then merge the shards into the XML dump in namespace order"""
+    if "all" in config.namespaces:
+        namespaces, _ = getNamespacesAPI(config=config, session=session)
+    else:
+        namespaces = config.namespaces
+    namespaces = sorted(ns for ns in namespaces if ns not in config.exnamespaces)
+
+    print(f"Dumping {len(namespaces)} namespaces with {config.xml_workers} workers")
+    for _ in threadMap(
+        session,
+        lambda ns: doXMLRevisionShard(config, session, xmlfilename, ns),
+        namespaces,
+        window=config.xml_workers,
+    ):
+        pass  # re-raises errors from the workers
+
+    # the shards are not compressed, the XML dump may be
+    mergedfilename = xmlfilename + XML_COMPRESSIONS.get(config.xml_compression, "")
+    print("Merging the namespace shards into", mergedfilename)
+    indexfilename = getXMLIndexFilename(config)
+    with openXMLFile(
+        mergedfilename, "w", config.xml_compression, indexfilename
+    ) as xmlfile:
+        xmlfile.write(header)
+        if isinstance(xmlfile, FramedXMLFile):
+            # a frame of its own, as in generateXMLDump()
+            xmlfile.endFrame()
+        xmlfile.flush()  # before the shards go to its buffer
+        for ns in namespaces:
+            with open(getXMLShardFilename(xmlfilename, ns, done=True), "rb") as f:
+                copyXMLPages(f, xmlfile.buffer)
+        xmlfile.write(footer)
+        writeCheckpoint(mergedfilename, {"offset": xmlfile.tell(), "complete": True})
+    for ns in namespaces:
+        os.remove(getXMLShardFilename(xmlfilename, ns, done=True))
+
+
+def copyXMLPages(src, xmlfile) -> None:
+    """Copies the <page>s of `src` to the XML dump, ending the frames of a
+    compressed one between pages"""
+    if not isinstance(xmlfile, FramedXMLFile):
+        shutil.copyfileobj(src, xmlfile)
+        return
+    end = b"</page>\n"
+    pending = b""  # the start of a page, until its end comes
+    for chunk in iter(lambda: src.read(1024 * 1024), b""):
+        # the end of a page may be cut between the chunks
+        pos = max(0, len(pending) - len(end))
+        pending += chunk
+        start = 0
+        while (pos := pending.find(end, pos)) >= 0:
+            pos += len(end)
+            xmlfile.write(pending[start:pos])
+            xmlfile.endPage(pending[start:pos])
+            start = pos
+        pending = pending[start:]
+    xmlfile.write(pending)
+
+
+def writeXMLPage(config: Config = None, session=None, title="", out=None) -> bytes:
+    """Writes the <page> of `title` to the binary file `out` as it comes, and
+    returns the parts of it the checkpoint needs"""
+    if config.xmlapiexport:
+        chunks = (
+            cleanXML(xml=xml).encode("utf-8")
+            for xml in getXMLPage(config=config, title=title, session=session)
+        )
+    else:
+        # the bytes of Special:Export go to the file as they come
+        chunks = getXMLPageWithExport(
+            config=config, title=title, session=session, reader=ExportStream()
+        )
+    firstxml = prevxml = xml = b""
+    for chunk in chunks:
+        prevxml, xml = xml, chunk
+        out.write(xml)
+        firstxml = firstxml or xml
+    # title and ns are in the first chunk, the last revision in one of the
+    # last two (the last one may only close the <page>)
+    return xml if xml is firstxml else firstxml + prevxml + xml
+
+
+def spoolXMLPage(config: Config = None, session=None, title=""):
+    """Downloads the <page> of `title` into a temporary file, in memory
+    unless it is large, for a worker of doXMLExportDump(). Returns the file
+    and the parts of the page the checkpoint needs, or None and the
+    PageMissingError if the page is missing"""
+    out = tempfile.SpooledTemporaryFile(max_size=XML_SPOOL_SIZE)
+    try:
+        return out, writeXMLPage(config, session, title, out)
+    except PageMissingError as e:
+        out.close()
+        return None, e
+    except BaseException:
+        out.close()
+        raise
+
+
 def doXMLExportDump(config: Config = None, session=None, xmlfile=None, lastPage=None):
     print("\nRetrieving the XML for every page\n")
 
@@ -76,21 +252,65 @@ def doXMLExportDump(config: Config = None, session=None, xmlfile=None, lastPage=
         # requested complete xml dump
         lock = False
 
+    def titlesToDump(lock):
+        for title in readTitles(config, session=session, start=start):
+            if not title:
+                continue
+            if title == start:  # start downloading from start, included
+                lock = False
+            if not lock:
+                yield title
+
+    if config.curonly and config.export_batch and not config.xmlapiexport:
+        # a revision per page: Special:Export can take many pages at once
+        batcher = ExportBatcher()
+        batches = threadMap(
+            session,
+            lambda titles: list(
+                getXMLPagesWithExport(config, titles, session, batcher)
+            ),
+            batcher.batches(titlesToDump(lock)),
+            window=config.xml_workers,
+        )
+        pages = (
+            (
+                title,
+                (io.BytesIO(xml), xml) if xml else (None, PageMissingError(title, "")),
+            )
+            for batch in batches
+            for title, xml in batch
+        )
+    elif config.xml_workers > 1:
+        print(f"Downloading {config.xml_workers} pages at a time")
+        # pages are written in the order of the titles, whichever comes first:
+        # the checkpoint and the resume from the last <title> stay the same
+        pages = threadMap(
+            session,
+            lambda title: (title, spoolXMLPage(config, session, title)),
+            titlesToDump(lock),
+            window=config.xml_workers,
+        )
+    else:
+        pages = ((title, None) for title in titlesToDump(lock))
+
     c = 1
-    for title in readTitles(config, session=session, start=start):
-        if not title:
-            continue
-        if title == start:  # start downloading from start, included
-            lock = False
-        if lock:
-            continue
-        Delay(config=config, session=session)
+    for title, spooled in pages:
         if c % 10 == 0:
-            print(f"\n->  Downloaded {c} pages\n")
+            rate = describeRate(session, config.index)
+            print(f"\n->  Downloaded {c} pages [{rate}]\n")
         try:
-            for xml in getXMLPage(config=config, title=title, session=session):
-                xml = cleanXML(xml=xml)
-                xmlfile.write(xml)
+            pageOffset = xmlfile.tell()
+            if spooled is None:
+                page = writeXMLPage(config, session, title, xmlfile.buffer)
+            else:
+                out, page = spooled
+                if out is None:
+                    raise page
+                with out:
+                    out.seek(0)
+                    shutil.copyfileobj(out, xmlfile.buffer)
+            if page:
+                saveCheckpoint(xmlfile, pageOffset, page.decode("utf-8"))
         except PageMissingError:
             logerror(
                 config=config,
@@ -104,42 +324,105 @@ def doXMLExportDump(config: Config = None, session=None, xmlfile=None, lastPage=
         c += 1
 
 
+def getXMLFilename(config: Config = None, session=None, compressed=True) -> str:
+    """Name of the XML dump, with the suffix of its compression if any"""
+    xmlfilename = "{}-{}-{}.xml".format(
+        domain2prefix(config=config, session=session),
+        config.date,
+        "current" if config.curonly else "history",
+    )
+    if compressed:
+        xmlfilename += XML_COMPRESSIONS.get(config.xml_compression, "")
+    return xmlfilename
+
+
+def getXMLIndexFilename(config: Config = None, session=None) -> str:
+    """Index of the pages of a multistream XML dump, "" if it is not one"""
+    if not config.xml_multistream:
+        return ""
+    xmlfilename = getXMLFilename(config, session, compressed=False)
+    return "{}/{}-index.txt".format(config.path, xmlfilename[: -len(".xml")])
+
+
 def generateXMLDump(config: Config = None, resume=False, session=None):
     """Generates a XML dump for a list of titles or from revision IDs"""
 
+    setPhase(session, "xml")
     header, config = getXMLHeader(config=config, session=session)
     footer = "</mediawiki>\n"  # new line at the end
-    xmlfilename = "{}-{}-{}.xml".format(
-        domain2prefix(config=config),
-        config.date,
-        "current" if config.curonly else "history",
-    )
+    xmlfilename = getXMLFilename(config)
+    indexfilename = getXMLIndexFilename(config)
     xmlfile = None
 
+    if config.xmlrevisions and not config.xmlrevisions_page and config.xml_workers > 1:
+        # Shards keep their own progress, whether or not we are resuming
+        doXMLRevisionDumpSharded(
+            config,
+            session,
+            f"{config.path}/{getXMLFilename(config, compressed=False)}",
+            header,
+            footer,
+        )
+        print("XML dump saved at...", xmlfilename)
+        return
+
     lastPage = None
     lastPageChunk = None
     # start != None, means we are resuming a XML dump
     if resume:
-        print("Removing the last chunk of past XML dump: it is probably incomplete.")
-        # truncate XML dump if it already exists
-        lastPageChunk = truncateXMLDump(f"{config.path}/{xmlfilename}")
-        if not lastPageChunk.strip():
-            print("Last page chunk is NULL, we'll directly start a new dump!")
-            resume = False
-            lastPage = None
+        # the checkpoint knows where the last page starts, no need to scan for it
+        lastPage = truncateXMLDumpToCheckpoint(f"{config.path}/{xmlfilename}")
+        if lastPage is not None:
+            print("Removing the last page of past XML dump, as of its checkpoint.")
         else:
-            lastPage = parseLastPageChunk(lastPageChunk)
-            if lastPage is None:
-                print("Failed to parse last page chunk: \n%s" % lastPageChunk)
-                print("Cannot resume, exiting now!")
-                sys.exit(1)
+            print(
+                "Removing the last chunk of past XML dump: it is probably incomplete."
+            )
+            # truncate XML dump if it already exists
+            if config.xml_compression:
+                try:
+                    lastPageChunk = truncateCompressedXMLDump(
+                        f"{config.path}/{xmlfilename}", config.xml_compression
+                    )
+                except EOFError as e:
+                    # nothing to keep, the header gets written again
+                    print(e)
+                    open(f"{config.path}/{xmlfilename}", "wb").close()
+                    lastPageChunk = ""
+            else:
+                lastPageChunk = truncateXMLDump(f"{config.path}/{xmlfilename}")
+            if not lastPageChunk.strip():
+                print("Last page chunk is NULL, we'll directly start a new dump!")
+                resume = False
+                lastPage = None
+            else:
+                lastPage = parseLastPageChunk(lastPageChunk)
+                if lastPage is None:
+                    print("Failed to parse last page chunk: \n%s" % lastPageChunk)
+                    print("Cannot resume, exiting now!")
+                    sys.exit(1)
+
+        if indexfilename:
+            # the pages cut from the dump go from its index too
+            truncateXMLIndex(
+                indexfilename, os.path.getsize(f"{config.path}/{xmlfilename}")
+            )
 
         print("WARNING: will try to start the download...")
-        xmlfile = open(f"{config.path}/{xmlfilename}", "a", encoding="utf-8")
+        xmlfile = openXMLFile(
+            f"{config.path}/{xmlfilename}", "a", config.xml_compression, indexfilename
+        )
     else:
         print("\nRetrieving the XML for every page from the beginning\n")
-        xmlfile = open(f"{config.path}/{xmlfilename}", "w", encoding="utf-8")
+        removeCheckpoint(f"{config.path}/{xmlfilename}")
+        xmlfile = openXMLFile(
+            f"{config.path}/{xmlfilename}", "w", config.xml_compression, indexfilename
+        )
+    if xmlfile.tell() == 0:
         xmlfile.write(header)
+        if isinstance(xmlfile, FramedXMLFile):
+            # a frame of its own, never cut back
+            xmlfile.endFrame()
 
     if config.xmlrevisions and not config.xmlrevisions_page:
         doXMLRevisionDump(config, session, xmlfile, lastPage, useAllrevisions=True)
@@ -148,5 +431,6 @@ def generateXMLDump(config: Config = None, resume=False, session=None):
     else:  # --xml
         doXMLExportDump(config, session, xmlfile, lastPage)
     xmlfile.write(footer)
+    completeCheckpoint(xmlfile)
     xmlfile.close()
     print("XML dump saved at...", xmlfilename)
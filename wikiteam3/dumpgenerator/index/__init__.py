@@ -0,0 +1 @@
+from .dump_index import DumpIndex
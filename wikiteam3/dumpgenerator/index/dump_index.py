@@ -0,0 +1,199 @@
+import json
+import sqlite3
+import threading
+from typing import *
+
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.utils import domain2prefix
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS titles (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    namespace INTEGER
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    url TEXT,
+    uploader TEXT,
+    size TEXT,
+    sha1 TEXT,
+    file_saved INTEGER NOT NULL DEFAULT 0,
+    desc_saved INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class DumpIndex:
+    """SQLite index of the titles and images of a dump, with the download
+    state of every image\n
+    titles.txt and images.txt are still written for compatibility, the index
+    makes resuming a lookup instead of a scan of these files."""
+
+    # rows fetched per query when iterating over a table
+    PAGE_SIZE = 1000
+
+    def __init__(self, config: Config = None):
+        self.filename = "{}/{}-{}-index.sqlite3".format(
+            config.path, domain2prefix(config=config), config.date
+        )
+        # shared by the image download workers, serialized by the lock
+        self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def isComplete(self, name: str) -> bool:
+        """Whether the list `name` ("titles" or "images") was fully indexed"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (f"{name}_complete",)
+            ).fetchone()
+        return row is not None and row[0] == "1"
+
+    def setComplete(self, name: str, complete=True):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (f"{name}_complete", "1" if complete else "0"),
+            )
+            if name == "titles" and complete:
+                # nothing left to resume
+                self.conn.execute("DELETE FROM meta WHERE key = 'titles_progress'")
+
+    def clearTitles(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM titles")
+            self.conn.execute(
+                "DELETE FROM meta WHERE key IN ('titles_complete', 'titles_progress')"
+            )
+
+    def addTitles(
+        self, titles: Iterable[Tuple[str, Optional[int]]], progress: Dict = None
+    ):
+        """Add (title, namespace) pairs after the ones already indexed, and
+        record in the same transaction how far the title listing got"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO titles (title, namespace) VALUES (?, ?)",
+                titles,
+            )
+            if progress is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    ("titles_progress", json.dumps(progress)),
+                )
+
+    def getTitlesProgress(self) -> Optional[Dict]:
+        """How far an interrupted title listing got, as saved by addTitles()"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'titles_progress'"
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def iterTitles(self, start: Optional[str] = None) -> Iterator[str]:
+        """Titles in the order they were listed, from the title `start`"""
+        lastid = 0
+        if start is not None:
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT id FROM titles WHERE title = ?", (start,)
+                ).fetchone()
+            if row is None:
+                return
+            lastid = row[0] - 1
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, title FROM titles WHERE id > ? ORDER BY id LIMIT ?",
+                    (lastid, self.PAGE_SIZE),
+                ).fetchall()
+            if not rows:
+                return
+            for lastid, title in rows:
+                yield title
+
+    def replaceImages(self, images: List[List]):
+        """Index the image list, keeping the download state of known files"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM meta WHERE key = 'images_complete'")
+            self.conn.execute(
+                "CREATE TEMP TABLE saved AS"
+                " SELECT filename, file_saved, desc_saved FROM images"
+            )
+            self.conn.execute("DELETE FROM images")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO images (filename, url, uploader, size, sha1)"
+                " VALUES (?, ?, ?, ?, ?)",
+                ([str(field) for field in image[:5]] for image in images),
+            )
+            self.conn.execute(
+                "UPDATE images SET"
+                " file_saved = (SELECT file_saved FROM saved"
+                "  WHERE saved.filename = images.filename),"
+                " desc_saved = (SELECT desc_saved FROM saved"
+                "  WHERE saved.filename = images.filename)"
+                " WHERE filename IN (SELECT filename FROM saved)"
+            )
+            self.conn.execute("DROP TABLE saved")
+
+    def getImages(self) -> List[List]:
+        """The image list, as [filename, url, uploader, size, sha1] lists"""
+        with self.lock:
+            return [
+                list(row)
+                for row in self.conn.execute(
+                    "SELECT filename, url, uploader, size, sha1 FROM images"
+                    " ORDER BY id"
+                )
+            ]
+
+    def markImage(self, filename: str, file_saved=None, desc_saved=None):
+        """Record that the file and/or the .desc of an image were saved"""
+        with self.lock, self.conn:
+            if file_saved is not None:
+                self.conn.execute(
+                    "UPDATE images SET file_saved = ? WHERE filename = ?",
+                    (int(file_saved), filename),
+                )
+            if desc_saved is not None:
+                self.conn.execute(
+                    "UPDATE images SET desc_saved = ? WHERE filename = ?",
+                    (int(desc_saved), filename),
+                )
+
+    def getSavedImages(self) -> Set[str]:
+        """Filenames of the images whose file and .desc were both saved"""
+        with self.lock:
+            return {
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT filename FROM images WHERE file_saved AND desc_saved"
+                )
+            }
+
+    def countSavedImages(self) -> Tuple[int, int]:
+        """Number of saved image files and of saved .desc files"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COALESCE(SUM(file_saved), 0), COALESCE(SUM(desc_saved), 0)"
+                " FROM images"
+            ).fetchone()
@@ -0,0 +1,64 @@
+from wikiteam3.dumpgenerator.config import Config
+
+from .dump_index import DumpIndex
+
+
+def makeConfig(tmp_path) -> Config:
+    return Config(
+        api="https://wiki.example.org/w/api.php",
+        path=str(tmp_path),
+        date="20240101",
+    )
+
+
+def test_titles(tmp_path):
+    config = makeConfig(tmp_path)
+    with DumpIndex(config) as index:
+        assert not index.isComplete("titles")
+        index.addTitles([("Main Page", 0), ("Help:Contents", 12)])
+        index.addTitles([("Main Page", 0), ("Talk:Main Page", 1)], progress={})
+        assert index.getTitlesProgress() == {}
+        index.setComplete("titles")
+        assert index.getTitlesProgress() is None
+
+    # reopened, as when resuming
+    with DumpIndex(config) as index:
+        assert index.isComplete("titles")
+        assert list(index.iterTitles()) == [
+            "Main Page",
+            "Help:Contents",
+            "Talk:Main Page",
+        ]
+        assert list(index.iterTitles(start="Help:Contents")) == [
+            "Help:Contents",
+            "Talk:Main Page",
+        ]
+        assert list(index.iterTitles(start="Missing")) == []
+
+        index.clearTitles()
+        assert not index.isComplete("titles")
+        assert list(index.iterTitles()) == []
+
+
+def test_images(tmp_path):
+    images = [
+        ["A.png", "https://wiki.example.org/A.png", "Alice", 10, "a" * 40],
+        ["B.png", "https://wiki.example.org/B.png", "Bob", "False", "False"],
+    ]
+    with DumpIndex(makeConfig(tmp_path)) as index:
+        index.replaceImages(images)
+        assert index.getImages() == [
+            ["A.png", "https://wiki.example.org/A.png", "Alice", "10", "a" * 40],
+            ["B.png", "https://wiki.example.org/B.png", "Bob", "False", "False"],
+        ]
+
+        index.markImage("A.png", file_saved=True)
+        index.markImage("A.png", desc_saved=True)
+        index.markImage("B.png", desc_saved=True)
+        assert index.countSavedImages() == (1, 2)
+        assert index.getSavedImages() == {"A.png"}
+
+        # reloading the list keeps the state of the images already known
+        index.replaceImages(images[:1] + [["C.png", "", "Carol", "1", "c" * 40]])
+        assert index.countSavedImages() == (1, 1)
+        assert index.getSavedImages() == {"A.png"}
@@ -0,0 +1,12 @@
+def pytest_terminal_summary(terminalreporter, config):
+    """Shows the throughput the benchmarks report next to their timings"""
+    session = getattr(config, "_benchmarksession", None)
+    benchmarks = [b for b in getattr(session, "benchmarks", []) if b.extra_info]
+    if not benchmarks:
+        return
+    terminalreporter.section("benchmark throughput")
+    for bench in benchmarks:
+        terminalreporter.write_line(
+            f"{bench.name:<48}"
+            + "  ".join(f"{value:>12} {key}" for key, value in bench.extra_info.items())
+        )
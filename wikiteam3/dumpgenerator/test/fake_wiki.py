@@ -0,0 +1,1142 @@
+"""A stand-in MediaWiki, serving a synthetic corpus to dump offline
+
+    python -m wikiteam3.dumpgenerator.test.fake_wiki --pages 100000 --revisions 20
+
+serves api.php and index.php until interrupted, to load test a dump with:
+
+    wikiteam3dumpgenerator --api http://127.0.0.1:8080/api.php --xml --images
+
+The corpus is computed from the page and revision numbers on request, not
+stored, so that it can hold millions of revisions."""
+
+import argparse
+import bisect
+import collections
+import gzip
+import hashlib
+import html
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+
+NAMESPACES = {
+    -2: "Media",
+    -1: "Special",
+    0: "",
+    1: "Talk",
+    2: "User",
+    3: "User talk",
+    4: "Project",
+    6: "File",
+    10: "Template",
+    14: "Category",
+}
+NAMESPACE_ALIASES = {"Image": 6}
+# namespace of the page i is PAGE_NAMESPACES[i % 6], most pages are articles
+PAGE_NAMESPACES = (0, 0, 0, 1, 2, 10)
+FILE_NAMESPACE = 6
+START = 1577836800  # 2020-01-01T00:00:00Z, the revision r is saved a minute later
+URL_MAX = 8192  # bytes of a request line, as Apache and nginx by default
+LOREM = (
+    "Lorem ipsum dolor sit amet, ''consectetur'' adipiscing elit: "
+    '<ref name="a">{{cite web |url=https://example.org/?a=1&b=2 |title=Ça & "ça"}}</ref> '
+    "sed do eiusmod tempor [[Page 0000001|incididunt]] ut labore et dolore magna "
+    "aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco.\n\n"
+    '== Laboris ==\n{| class="wikitable"\n! a !! b\n|-\n| 1 < 2 || 3 > 2\n|}\n'
+)
+
+Page = collections.namedtuple("Page", "index id ns name title first count")
+
+
+def getTimestamp(revid: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(START + revid * 60))
+
+
+def toMwTimestamp(timestamp: str) -> str:
+    """2020-01-01T00:01:00Z as MediaWiki writes it in URLs: 20200101000100"""
+    return re.sub(r"\D", "", timestamp)
+
+
+def parseTimestamp(timestamp: str) -> str:
+    """Any timestamp of a request as ISO 8601, "" for the beginning of time"""
+    digits = re.sub(r"\D", "", timestamp)
+    if len(digits) != 14:
+        return ""
+    return "%s-%s-%sT%s:%s:%sZ" % (
+        digits[0:4],
+        digits[4:6],
+        digits[6:8],
+        digits[8:10],
+        digits[10:12],
+        digits[12:14],
+    )
+
+
+def toBase36(hexdigest: str) -> str:
+    """SHA-1 as Special:Export writes it"""
+    n, digits = int(hexdigest, 16), ""
+    while n:
+        n, d = divmod(n, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[d] + digits
+    return digits.rjust(31, "0")
+
+
+def escape(text: str) -> str:
+    """Escapes like MediaWiki's htmlspecialchars()"""
+    return html.escape(text, quote=True).replace("&#x27;", "'")
+
+
+def splitParam(value: Optional[str]) -> List[str]:
+    return [v for v in (value or "").split("|") if v]
+
+
+class Corpus:
+    """Pages, revisions and files of the fake wiki
+
+    `pages` pages spread over PAGE_NAMESPACES have on average `revisions`
+    revisions each, then every one of the `images` files has a description
+    page in the File namespace. Revision ids follow the page ids, and
+    everything else is computed from them."""
+
+    def __init__(
+        self,
+        pages=100,
+        revisions=5,
+        images=10,
+        textSize=2000,
+        imageSize=4096,
+    ):
+        self.pages = pages
+        self.revisions = revisions
+        self.images = images
+        self.textSize = textSize
+        self.imageSize = imageSize
+        counts = itertools.chain(
+            (self.countRevisions(i) for i in range(pages)), [1] * images
+        )
+        # first revision id of every page, and one past the last revision
+        self.firsts = array("q", itertools.accumulate(counts, initial=1))
+        self.lorem = LOREM * (textSize // len(LOREM) + 2)
+
+    def countRevisions(self, index: int) -> int:
+        if self.revisions <= 1:
+            return 1
+        return 1 + (index * 2654435761) % (2 * self.revisions - 1)
+
+    @property
+    def revisionCount(self) -> int:
+        return self.firsts[-1] - 1
+
+    @property
+    def pageCount(self) -> int:
+        return self.pages + self.images
+
+    def getNamespace(self, index: int) -> int:
+        if index >= self.pages:
+            return FILE_NAMESPACE
+        return PAGE_NAMESPACES[index % len(PAGE_NAMESPACES)]
+
+    def getPage(self, index: int) -> Page:
+        ns = self.getNamespace(index)
+        if ns == FILE_NAMESPACE:
+            name = f"Image {index - self.pages:06d}.png"
+        else:
+            name = f"Page {index:07d}" + (" & Ça va" if index % 7 == 3 else "")
+        first = self.firsts[index]
+        title = f"{NAMESPACES[ns]}:{name}" if ns else name
+        return Page(
+            index, index + 1, ns, name, title, first, self.firsts[index + 1] - first
+        )
+
+    def findPage(self, ns: int, name: str) -> Optional[Page]:
+        if ns == FILE_NAMESPACE:
+            m = re.fullmatch(r"Image (\d{6})\.png", name)
+            index = m and self.pages + int(m.group(1))
+        else:
+            m = re.fullmatch(r"Page (\d{7})(?: & Ça va)?", name)
+            index = m and int(m.group(1))
+        if index is None or not 0 <= index < self.pageCount:
+            return None
+        page = self.getPage(index)
+        return page if page.ns == ns and page.name == name else None
+
+    def getPageOfRevision(self, revid: int) -> Optional[Page]:
+        if not 0 < revid <= self.revisionCount:
+            return None
+        return self.getPage(bisect.bisect_right(self.firsts, revid) - 1)
+
+    def iterPages(self, ns: int, start: str = "") -> Iterator[Page]:
+        """Pages of the namespace `ns` in title order, from the title `start`"""
+        prefix = "Image " if ns == FILE_NAMESPACE else "Page "
+        if start < prefix:
+            first = 0
+        elif start.startswith(prefix) and re.match(r"\d+", start[len(prefix) :]):
+            first = int(re.match(r"\d+", start[len(prefix) :]).group())
+        else:
+            return
+        if ns == FILE_NAMESPACE:
+            indexes = range(self.pages + first, self.pageCount)
+        elif ns in PAGE_NAMESPACES:
+            step = len(PAGE_NAMESPACES)
+            residues = [i for i, n in enumerate(PAGE_NAMESPACES) if n == ns]
+            indexes = (
+                base + residue
+                for base in range(first - first % step, self.pages, step)
+                for residue in residues
+                if first <= base + residue < self.pages
+            )
+        else:
+            return
+        for index in indexes:
+            page = self.getPage(index)
+            if page.name >= start:
+                yield page
+
+    def getUser(self, revid: int) -> Tuple[str, int]:
+        """Name and id of the author of a revision, id 0 for IPs"""
+        if revid % 5 == 0:
+            return f"192.0.2.{revid % 250 + 1}", 0
+        return f"User {revid % 13}", revid % 13 + 1
+
+    def getText(self, page: Page, revid: int) -> str:
+        if page.ns == FILE_NAMESPACE:
+            return f"== Summary ==\nUploaded as [[{page.title}]], revision {revid}.\n"
+        start = revid % len(LOREM)
+        header = f"'''{page.title}''', revision {revid}.\n\n"
+        return header + self.lorem[start : start + self.textSize - len(header)]
+
+    def getRevision(self, revid: int, page: Page = None) -> Dict:
+        """A revision as in the API JSON, with every property"""
+        page = page or self.getPageOfRevision(revid)
+        nth = revid - page.first
+        user, userid = self.getUser(revid)
+        text = self.getText(page, revid)
+        revision = {
+            "revid": revid,
+            "parentid": revid - 1 if nth else 0,
+            "user": user,
+            "userid": userid,
+            "timestamp": getTimestamp(revid),
+            "size": len(text.encode("utf-8")),
+            "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            "contentmodel": "wikitext",
+            "comment": ""
+            if nth % 4 == 1
+            else f"Edit {nth} of [[{page.title}]] & <more>",
+            "contentformat": "text/x-wiki",
+            "*": text,
+        }
+        if nth % 3 == 2:
+            revision["minor"] = ""
+        if not userid:
+            revision["anon"] = ""
+        return revision
+
+    def getImageName(self, k: int) -> str:
+        return f"Image {k:06d}.png"
+
+    def getImage(self, k: int) -> bytes:
+        seed = hashlib.sha256(str(k).encode("utf-8")).digest()
+        data = b"\x89PNG\r\n\x1a\n" + seed * (self.imageSize // len(seed) + 1)
+        return data[: self.imageSize]
+
+    def getImagePath(self, k: int) -> str:
+        name = self.getImageName(k).replace(" ", "_")
+        md5 = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return f"/images/{md5[0]}/{md5[:2]}/{urllib.parse.quote(name)}"
+
+    def findImage(self, name: str) -> Optional[int]:
+        m = re.fullmatch(r"Image[ _](\d{6})\.png", name)
+        if m and int(m.group(1)) < self.images:
+            return int(m.group(1))
+        return None
+
+
+class FakeWiki:
+    """api.php and index.php of a MediaWiki `version`, serving `corpus`
+
+    The continuation and modules follow the version: "1.19.24" has
+    query-continue and no list=allrevisions, "1.39.7" has both continue
+    and list=allrevisions. Every response takes `latency` seconds, a share
+    `errorRate` of the requests get a 503, and a share `brokenRate` of the
+    Special:Export responses are cut short. `hits` counts the requests."""
+
+    def __init__(
+        self,
+        corpus: Corpus = None,
+        version="1.39.7",
+        latency=0.0,
+        errorRate=0.0,
+        brokenRate=0.0,
+        exportMaxHistory=1000,
+        apiMaxResultSize=8 * 1024 * 1024,
+        seed=0,
+        port=0,
+    ):
+        self.corpus = corpus or Corpus()
+        self.version = version
+        self.versionTuple = tuple(int(v) for v in re.findall(r"\d+", version)[:2])
+        self.latency = latency
+        self.errorRate = errorRate
+        self.brokenRate = brokenRate
+        self.exportMaxHistory = exportMaxHistory
+        self.apiMaxResultSize = apiMaxResultSize
+        self.random = random.Random(seed)
+        self.port = port
+        self.hits = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def api(self) -> str:
+        return f"{self.url}/api.php"
+
+    @property
+    def index(self) -> str:
+        return f"{self.url}/index.php"
+
+    def start(self) -> "FakeWiki":
+        self.server = Server(("127.0.0.1", self.port), Handler)
+        self.server.wiki = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def chance(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def count(self, kind: str):
+        with self.lock:
+            self.hits[kind] += 1
+
+    def handle(self, path: str, params: Dict[str, str]) -> Tuple[int, str, bytes]:
+        """Status, content type and body of the response to a request"""
+        if path.endswith("/api.php"):
+            return self.handleAPI(params)
+        if path.startswith("/images/"):
+            k = self.corpus.findImage(urllib.parse.unquote(path.split("/")[-1]))
+            self.count("image")
+            if k is None or path != self.corpus.getImagePath(k):
+                return 404, "text/plain", b"Not Found"
+            return 200, "image/png", self.corpus.getImage(k)
+        if path.endswith("/index.php") or "/index.php/" in path:
+            if "title" not in params and "/index.php/" in path:
+                params["title"] = urllib.parse.unquote(path.split("/index.php/", 1)[1])
+            return self.handleIndex(params)
+        return 404, "text/plain", b"Not Found"
+
+    # api.php
+
+    def handleAPI(self, params: Dict[str, str]) -> Tuple[int, str, bytes]:
+        action = params.get("action")
+        modules = [params.get(m) for m in ("meta", "list", "prop", "generator")]
+        modules.append("export" if "export" in params else None)
+        self.count("api " + ("+".join(m for m in modules if m) or str(action)))
+        if action != "query":
+            result = {
+                "error": {
+                    "code": "unknown_action",
+                    "info": f'Unrecognized value for parameter "action": {action}.',
+                }
+            }
+            return 200, "application/json; charset=utf-8", json.dumps(result).encode()
+        result = self.query(params)
+        if "exportnowrap" in params and "export" in params:
+            return (
+                200,
+                "text/xml; charset=utf-8",
+                result["query"]["export"]["*"].encode(),
+            )
+        if params.get("format") == "xml":
+            return 200, "text/xml; charset=utf-8", self.toXML(result).encode()
+        return 200, "application/json; charset=utf-8", json.dumps(result).encode()
+
+    def newContinue(self, params: Dict[str, str]) -> bool:
+        """Whether the continuation is the continue of MediaWiki 1.21+"""
+        if self.versionTuple >= (1, 26):
+            return True
+        return self.versionTuple >= (1, 21) and "continue" in params
+
+    def addContinue(self, result: Dict, params: Dict, module: str, key: str, value):
+        if self.newContinue(params):
+            result.setdefault("continue", {"continue": "-||"})[key] = str(value)
+        else:
+            result.setdefault("query-continue", {}).setdefault(module, {})[key] = value
+
+    def query(self, params: Dict[str, str]) -> Dict:
+        result = {"batchcomplete": ""}
+        query = result["query"] = {}
+        for meta in splitParam(params.get("meta")):
+            if meta == "siteinfo":
+                query.update(
+                    self.getSiteinfo(splitParam(params.get("siprop")) or ["general"])
+                )
+            elif meta == "userinfo":
+                query["userinfo"] = {
+                    "id": 0,
+                    "name": "127.0.0.1",
+                    "anon": "",
+                    "groups": ["*"],
+                    "rights": ["read"],
+                }
+        listName = params.get("list")
+        if listName == "allpages":
+            query["allpages"] = [
+                {"pageid": p.id, "ns": p.ns, "title": p.title}
+                for p in self.listPages(result, params, "ap", "allpages")
+            ]
+        elif listName == "allrevisions" and self.versionTuple >= (1, 27):
+            query["allrevisions"] = self.listAllRevisions(result, params)
+        elif listName == "allimages":
+            query["allimages"] = self.listAllImages(result, params)
+        elif listName:
+            result["warnings"] = {
+                "query": {"*": f'Unrecognized value for parameter "list": {listName}'}
+            }
+
+        pages = None
+        if params.get("generator") == "allpages":
+            pages = self.listPages(result, params, "gap", "allpages")
+        elif "titles" in params:
+            pages = self.getPagesByTitles(query, params["titles"].split("|"))
+        elif "pageids" in params:
+            pages = [
+                self.corpus.getPage(int(i) - 1)
+                if 0 < int(i) <= self.corpus.pageCount
+                else {"pageid": int(i), "missing": ""}
+                for i in params["pageids"].split("|")
+            ]
+        revids = None
+        if "revids" in params:
+            revids, pages = self.getPagesByRevids(query, params["revids"].split("|"))
+
+        if pages is not None:
+            entries = collections.OrderedDict()
+            for i, page in enumerate(pages):
+                if isinstance(page, Page):
+                    entries[str(page.id)] = {
+                        "pageid": page.id,
+                        "ns": page.ns,
+                        "title": page.title,
+                    }
+                else:
+                    entries[str(-1 - i)] = page
+            props = splitParam(params.get("prop"))
+            if "revisions" in props:
+                error = self.addRevisions(result, params, pages, entries, revids)
+                if error:
+                    return error
+            if "imageinfo" in props:
+                self.addImageinfo(pages, entries)
+            query["pages"] = dict(entries)
+            if "export" in params:
+                existing = [p for p in pages if isinstance(p, Page)]
+                query["export"] = {
+                    "*": self.export([(p, [p.first + p.count - 1]) for p in existing])
+                }
+        elif "export" in params:
+            query["export"] = {"*": self.export([])}
+        return result
+
+    def getSiteinfo(self, props: List[str]) -> Dict:
+        info = {}
+        if "general" in props:
+            info["general"] = {
+                "mainpage": "Main Page",
+                "base": f"{self.index}/Main_Page",
+                "sitename": "Fake Wiki",
+                "generator": f"MediaWiki {self.version}",
+                "case": "first-letter",
+                "lang": "en",
+                "dbname": "fakewiki",
+                "server": self.url,
+                "script": "/index.php",
+                "scriptpath": "",
+                "articlepath": "/index.php/$1",
+                "maxuploadsize": 104857600,
+            }
+        if "namespaces" in props:
+            info["namespaces"] = {
+                str(ns): {
+                    "id": ns,
+                    "case": "first-letter",
+                    "*": name,
+                    **({"canonical": name} if ns else {"content": ""}),
+                }
+                for ns, name in NAMESPACES.items()
+            }
+        if "namespacealiases" in props:
+            info["namespacealiases"] = [
+                {"id": ns, "*": alias} for alias, ns in NAMESPACE_ALIASES.items()
+            ]
+        if "statistics" in props:
+            info["statistics"] = {
+                "pages": self.corpus.pageCount,
+                "articles": sum(1 for ns in PAGE_NAMESPACES if ns == 0)
+                * self.corpus.pages
+                // len(PAGE_NAMESPACES),
+                "edits": self.corpus.revisionCount,
+                "images": self.corpus.images,
+                "users": 13,
+                "activeusers": 13,
+                "admins": 1,
+                "jobs": 0,
+            }
+        return info
+
+    def normalizeTitle(self, title: str) -> Tuple[int, str, str]:
+        """Namespace, name and title of a title as MediaWiki writes it"""
+        title = re.sub(r"[_\s]+", " ", title).strip()
+        ns = 0
+        if ":" in title:
+            prefix, rest = title.split(":", 1)
+            prefix = prefix.strip().capitalize()
+            names = {name: n for n, name in NAMESPACES.items() if name}
+            names.update(NAMESPACE_ALIASES)
+            if prefix in names:
+                ns, title = names[prefix], rest.strip()
+        name = title[:1].upper() + title[1:]
+        return ns, name, f"{NAMESPACES[ns]}:{name}" if ns else name
+
+    def getPagesByTitles(self, query: Dict, titles: List[str]) -> List:
+        pages = []
+        for title in titles:
+            ns, name, normalized = self.normalizeTitle(title)
+            if normalized != title:
+                query.setdefault("normalized", []).append(
+                    {"from": title, "to": normalized}
+                )
+            if not name or ns < 0:
+                pages.append({"title": title, "invalid": ""})
+            else:
+                pages.append(
+                    self.corpus.findPage(ns, name)
+                    or {"ns": ns, "title": normalized, "missing": ""}
+                )
+        return pages
+
+    def getPagesByRevids(self, query: Dict, revids: List[str]) -> Tuple[Dict, List]:
+        """Revisions asked for, by page, and their pages"""
+        byPage = collections.OrderedDict()
+        for revid in revids:
+            page = self.corpus.getPageOfRevision(int(revid))
+            if page is None:
+                query.setdefault("badrevids", {})[revid] = {
+                    "revid": int(revid),
+                    "missing": "",
+                }
+                continue
+            byPage.setdefault(page.index, (page, []))[1].append(int(revid))
+        # by revision id, as MediaWiki and its rvcontinue go
+        byPage = sorted(byPage.items())
+        return {i: sorted(r) for i, (_, r) in byPage}, [p for _, (p, _) in byPage]
+
+    def listPages(
+        self, result: Dict, params: Dict, prefix: str, module: str
+    ) -> List[Page]:
+        """allpages as a list or as a generator, with `prefix` for its parameters"""
+        ns = int(params.get(f"{prefix}namespace", 0))
+        limit = self.getLimit(params.get(f"{prefix}limit"), 10, 500)
+        start = params.get(f"{prefix}continue") or params.get(f"{prefix}from") or ""
+        pages = list(
+            itertools.islice(
+                self.corpus.iterPages(ns, start.replace("_", " ")), limit + 1
+            )
+        )
+        if len(pages) > limit:
+            if self.newContinue(params):
+                self.addContinue(
+                    result,
+                    params,
+                    module,
+                    f"{prefix}continue",
+                    pages[-1].name.replace(" ", "_"),
+                )
+            else:
+                self.addContinue(
+                    result, params, module, f"{prefix}from", pages[-1].name
+                )
+            pages = pages[:limit]
+        return pages
+
+    def getLimit(self, value: Optional[str], default: int, maximum: int) -> int:
+        if value == "max":
+            return maximum
+        return max(1, min(maximum, int(float(value)) if value else default))
+
+    def filterRevision(self, revision: Dict, props: Set[str]) -> Dict:
+        """Keeps the properties of `revision` that were asked for"""
+        keys = set()
+        if "ids" in props:
+            keys |= {"revid", "parentid"}
+        if "flags" in props:
+            keys.add("minor")
+        if "user" in props:
+            keys |= {"user", "anon"}
+        if "content" in props:
+            keys |= {"*", "contentformat", "contentmodel"}
+        keys |= props & {"timestamp", "userid", "size", "sha1", "comment"}
+        if "contentmodel" in props:
+            keys.add("contentmodel")
+        if self.versionTuple < (1, 21):
+            keys -= {"contentmodel", "contentformat"}
+        return {k: v for k, v in revision.items() if k in keys}
+
+    def addRevisions(self, result, params, pages, entries, revids) -> Optional[Dict]:
+        """prop=revisions of `pages`, the `revids` of each if asked by id"""
+        props = set(
+            splitParam(params.get("rvprop", "ids|timestamp|flags|comment|user"))
+        )
+        content = "content" in props
+        existing = [p for p in pages if isinstance(p, Page)]
+        # rvcontinue also continues the revisions asked by id, or the latest
+        # revision of several pages
+        enumerate_ = any(
+            k in params for k in ("rvlimit", "rvstartid", "rvdir", "rvstart")
+        ) or ("rvcontinue" in params and len(existing) == 1 and not revids)
+        if enumerate_ and (len(existing) > 1 or revids):
+            return {
+                "error": {
+                    "code": "multpages",
+                    "info": "titles, pageids or a generator was used to supply multiple pages, "
+                    "but the rvlimit, rvstartid, rvendid, rvdir, rvstart, and rvend parameters "
+                    "may only be used on a single page.",
+                }
+            }
+        size = 0
+        if enumerate_ and existing:
+            page = existing[0]
+            limit = self.getLimit(params.get("rvlimit"), 10, 50 if content else 500)
+            newer = params.get("rvdir") == "newer"
+            ids = range(page.first, page.first + page.count)
+            if not newer:
+                ids = ids[::-1]
+            start = params.get("rvcontinue") or params.get("rvstartid")
+            if start:
+                start = int(start.split("|")[-1])
+                ids = [i for i in ids if (i >= start if newer else i <= start)]
+            revisions = []
+            for revid in ids:
+                revision = self.corpus.getRevision(revid, page)
+                size += len(revision["*"]) if content else 0
+                if len(revisions) == limit or (
+                    revisions and size > self.apiMaxResultSize
+                ):
+                    if self.newContinue(params):
+                        self.addContinue(
+                            result,
+                            params,
+                            "revisions",
+                            "rvcontinue",
+                            f"{toMwTimestamp(revision['timestamp'])}|{revid}",
+                        )
+                    elif self.versionTuple >= (1, 21):
+                        self.addContinue(
+                            result, params, "revisions", "rvcontinue", revid
+                        )
+                    else:
+                        self.addContinue(
+                            result, params, "revisions", "rvstartid", revid
+                        )
+                    break
+                revisions.append(self.filterRevision(revision, props))
+            entries[str(page.id)]["revisions"] = revisions
+            return None
+
+        # the latest revision of every page, or the revisions asked by id,
+        # as many as fit in the result
+        start = int(params.get("rvcontinue", "0").split("|")[-1])
+        for page in existing:
+            ids = revids[page.index] if revids else [page.first + page.count - 1]
+            ids = [i for i in ids if i >= start]
+            revisions = []
+            for revid in ids:
+                revision = self.corpus.getRevision(revid, page)
+                size += len(revision["*"]) if content else 0
+                if size > self.apiMaxResultSize and (
+                    revisions or size > len(revision["*"])
+                ):
+                    self.addContinue(result, params, "revisions", "rvcontinue", revid)
+                    break
+                revisions.append(self.filterRevision(revision, props))
+            if revisions:
+                entries[str(page.id)]["revisions"] = revisions
+            if size > self.apiMaxResultSize:
+                break
+        return None
+
+    def addImageinfo(self, pages, entries):
+        for page in pages:
+            if isinstance(page, Page) and page.ns == FILE_NAMESPACE:
+                entries[str(page.id)]["imagerepository"] = "local"
+                entries[str(page.id)]["imageinfo"] = [
+                    self.getImageinfo(page.index - self.corpus.pages)
+                ]
+
+    def getImageinfo(self, k: int) -> Dict:
+        page = self.corpus.getPage(self.corpus.pages + k)
+        user, _ = self.corpus.getUser(page.first)
+        data = self.corpus.getImage(k)
+        return {
+            "timestamp": getTimestamp(page.first),
+            "user": user,
+            "size": len(data),
+            "width": 64,
+            "height": 64,
+            "url": self.url + self.corpus.getImagePath(k),
+            "descriptionurl": f"{self.index}/{urllib.parse.quote(page.title.replace(' ', '_'))}",
+            "sha1": hashlib.sha1(data).hexdigest(),
+        }
+
+    def listAllRevisions(self, result: Dict, params: Dict) -> List[Dict]:
+        props = set(
+            splitParam(params.get("arvprop", "ids|timestamp|flags|comment|user"))
+        )
+        content = "content" in props
+        limit = self.getLimit(params.get("arvlimit"), 10, 50 if content else 500)
+        namespaces = {int(n) for n in splitParam(params.get("arvnamespace"))}
+        revid = 1
+        if params.get("arvcontinue"):
+            revid = int(params["arvcontinue"].split("|")[-1])
+        pages, count, size = [], 0, 0
+        while revid <= self.corpus.revisionCount:
+            index = bisect.bisect_right(self.corpus.firsts, revid) - 1
+            if namespaces and self.corpus.getNamespace(index) not in namespaces:
+                revid = self.corpus.firsts[index + 1]
+                continue
+            page = self.corpus.getPage(index)
+            revision = self.corpus.getRevision(revid, page)
+            size += len(revision["*"]) if content else 0
+            if count == limit or (count and size > self.apiMaxResultSize):
+                self.addContinue(
+                    result,
+                    params,
+                    "allrevisions",
+                    "arvcontinue",
+                    f"{toMwTimestamp(revision['timestamp'])}|{revid}",
+                )
+                break
+            if not pages or pages[-1]["pageid"] != page.id:
+                pages.append(
+                    {
+                        "pageid": page.id,
+                        "revisions": [],
+                        "ns": page.ns,
+                        "title": page.title,
+                    }
+                )
+            pages[-1]["revisions"].append(self.filterRevision(revision, props))
+            count += 1
+            revid += 1
+        return pages
+
+    def listAllImages(self, result: Dict, params: Dict) -> List[Dict]:
+        limit = self.getLimit(params.get("ailimit"), 10, 500)
+        start = (params.get("aicontinue") or params.get("aifrom") or "").replace(
+            "_", " "
+        )
+        pages = list(
+            itertools.islice(self.corpus.iterPages(FILE_NAMESPACE, start), limit + 1)
+        )
+        if len(pages) > limit:
+            if self.newContinue(params):
+                self.addContinue(
+                    result,
+                    params,
+                    "allimages",
+                    "aicontinue",
+                    pages[-1].name.replace(" ", "_"),
+                )
+            else:
+                self.addContinue(result, params, "allimages", "aifrom", pages[-1].name)
+            pages = pages[:limit]
+        props = set(splitParam(params.get("aiprop", "timestamp|url")))
+        images = []
+        for page in pages:
+            info = self.getImageinfo(page.index - self.corpus.pages)
+            image = {
+                "name": page.name.replace(" ", "_"),
+                "ns": FILE_NAMESPACE,
+                "title": page.title,
+            }
+            image.update(
+                (k, v)
+                for k, v in info.items()
+                if k in props or (k == "descriptionurl" and "url" in props)
+            )
+            images.append(image)
+        return images
+
+    def toXML(self, result: Dict) -> str:
+        """The API result in format=xml, for the queries of pages"""
+        api = ET.Element(
+            "api", {"batchcomplete": ""} if "batchcomplete" in result else {}
+        )
+        if "error" in result:
+            ET.SubElement(api, "error", {k: str(v) for k, v in result["error"].items()})
+        if "continue" in result:
+            ET.SubElement(api, "continue", result["continue"])
+        if "query-continue" in result:
+            qc = ET.SubElement(api, "query-continue")
+            for module, values in result["query-continue"].items():
+                ET.SubElement(qc, module, {k: str(v) for k, v in values.items()})
+        query = ET.SubElement(api, "query")
+        pages = ET.SubElement(query, "pages")
+        for key, page in result.get("query", {}).get("pages", {}).items():
+            attrib = {"_idx": key}
+            attrib.update((k, str(v)) for k, v in page.items() if k != "revisions")
+            element = ET.SubElement(pages, "page", attrib)
+            if "revisions" in page:
+                revisions = ET.SubElement(element, "revisions")
+                for revision in page["revisions"]:
+                    attrib = {k: str(v) for k, v in revision.items() if k != "*"}
+                    if "*" in revision:
+                        attrib["xml:space"] = "preserve"
+                    rev = ET.SubElement(revisions, "rev", attrib)
+                    rev.text = revision.get("*")
+        return '<?xml version="1.0"?>' + ET.tostring(api, encoding="unicode")
+
+    # Special:Export
+
+    def getExportHeader(self) -> str:
+        schema = "0.10" if self.versionTuple >= (1, 21) else "0.6"
+        xml = (
+            f'<mediawiki xmlns="http://www.mediawiki.org/xml/export-{schema}/" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            f'xsi:schemaLocation="http://www.mediawiki.org/xml/export-{schema}/ '
+            f'http://www.mediawiki.org/xml/export-{schema}.xsd" version="{schema}" xml:lang="en">\n'
+            "  <siteinfo>\n"
+            "    <sitename>Fake Wiki</sitename>\n"
+            "    <dbname>fakewiki</dbname>\n"
+            f"    <base>{self.index}/Main_Page</base>\n"
+            f"    <generator>MediaWiki {self.version}</generator>\n"
+            "    <case>first-letter</case>\n"
+            "    <namespaces>\n"
+        )
+        for ns, name in NAMESPACES.items():
+            if name:
+                xml += f'      <namespace key="{ns}" case="first-letter">{name}</namespace>\n'
+            else:
+                xml += f'      <namespace key="{ns}" case="first-letter" />\n'
+        return xml + "    </namespaces>\n  </siteinfo>\n"
+
+    def exportRevision(self, page: Page, revid: int) -> str:
+        revision = self.corpus.getRevision(revid, page)
+        xml = f"    <revision>\n      <id>{revid}</id>\n"
+        if revision["parentid"]:
+            xml += f"      <parentid>{revision['parentid']}</parentid>\n"
+        xml += f"      <timestamp>{revision['timestamp']}</timestamp>\n      <contributor>\n"
+        if revision["userid"]:
+            xml += f"        <username>{escape(revision['user'])}</username>\n"
+            xml += f"        <id>{revision['userid']}</id>\n"
+        else:
+            xml += f"        <ip>{revision['user']}</ip>\n"
+        xml += "      </contributor>\n"
+        if "minor" in revision:
+            xml += "      <minor/>\n"
+        if revision["comment"]:
+            xml += f"      <comment>{escape(revision['comment'])}</comment>\n"
+        if self.versionTuple >= (1, 21):
+            xml += "      <model>wikitext</model>\n      <format>text/x-wiki</format>\n"
+        xml += f'      <text bytes="{revision["size"]}" xml:space="preserve">{escape(revision["*"])}</text>\n'
+        xml += f"      <sha1>{toBase36(revision['sha1'])}</sha1>\n    </revision>\n"
+        return xml
+
+    def export(self, pages: List[Tuple[Page, Iterable[int]]]) -> str:
+        """<mediawiki> with some revisions of some pages"""
+        xml = [self.getExportHeader()]
+        for page, revids in pages:
+            xml.append(f"  <page>\n    <title>{escape(page.title)}</title>\n")
+            xml.append(f"    <ns>{page.ns}</ns>\n    <id>{page.id}</id>\n")
+            xml.extend(self.exportRevision(page, revid) for revid in revids)
+            xml.append("  </page>\n")
+        xml.append("</mediawiki>\n")
+        return "".join(xml)
+
+    def specialExport(self, params: Dict[str, str]) -> str:
+        limit = self.exportMaxHistory
+        if params.get("limit"):
+            limit = self.getLimit(params["limit"], limit, limit)
+        offset = parseTimestamp(params.get("offset", ""))
+        pages = []
+        for title in params.get("pages", "").split("\n"):
+            ns, name, _ = self.normalizeTitle(title)
+            page = self.corpus.findPage(ns, name) if name else None
+            if page is None:
+                continue
+            ids = range(page.first, page.first + page.count)
+            if params.get("curonly"):
+                ids = ids[-1:]
+            else:
+                ids = [i for i in ids if getTimestamp(i) > offset][:limit]
+            pages.append((page, ids))
+        return self.export(pages)
+
+    # index.php
+
+    def handleIndex(self, params: Dict[str, str]) -> Tuple[int, str, bytes]:
+        ns, name, title = self.normalizeTitle(params.get("title", "Main Page"))
+        special = name.split("/")[0].lower() if ns == -1 else None
+        self.count(f"index {title.split('/')[0]}" if special else "index page")
+        if special == "export" and (
+            "pages" in params or params.get("action") == "submit"
+        ):
+            body = self.specialExport(params)
+            return 200, "application/xml; charset=utf-8", body.encode("utf-8")
+        if special == "version":
+            content = (
+                '<h2 id="mw-version-license">License</h2>\n'
+                "<p>This wiki is powered by <b>MediaWiki</b>.</p>\n"
+                f'<table id="sv-software"><tr><td>MediaWiki</td><td>{self.version}</td></tr></table>\n'
+            )
+        elif special == "allpages":
+            content = self.specialAllpages(params, name)
+        elif special in ("listfiles", "imagelist"):
+            content = self.specialListFiles(params)
+        elif ns >= 0 and self.corpus.findPage(ns, name):
+            page = self.corpus.findPage(ns, name)
+            content = f"<p>{escape(self.corpus.getText(page, page.first + page.count - 1))}</p>\n"
+        elif title == "Main Page":
+            content = "<p>Welcome to the Fake Wiki.</p>\n"
+        else:
+            return (
+                404,
+                "text/html; charset=utf-8",
+                self.getHTML(
+                    title, "<p>There is currently no text in this page.</p>\n"
+                ).encode(),
+            )
+        return (
+            200,
+            "text/html; charset=utf-8",
+            self.getHTML(title, content).encode("utf-8"),
+        )
+
+    def getHTML(self, title: str, content: str) -> str:
+        pageName = re.sub(r"[^\w:]", "_", title.replace(" ", "_"))
+        return (
+            '<!DOCTYPE html>\n<html class="client-nojs" lang="en" dir="ltr">\n<head>\n'
+            f'<meta charset="UTF-8"/>\n<title>{escape(title)} - Fake Wiki</title>\n'
+            f'<meta name="generator" content="MediaWiki {self.version}"/>\n'
+            '<link rel="EditURI" type="application/rsd+xml" href="/api.php?action=rsd"/>\n'
+            "</head>\n"
+            f'<body class="mediawiki ltr sitedir-ltr page-{pageName} skin-vector">\n'
+            f'<h1 id="firstHeading" class="firstHeading">{escape(title)}</h1>\n'
+            f'<div id="mw-content-text" class="mw-body-content">\n{content}</div>\n'
+            '<div class="printfooter">Retrieved from Fake Wiki</div>\n'
+            '<div id="footer">Powered by MediaWiki</div>\n</body>\n</html>\n'
+        )
+
+    def specialAllpages(self, params: Dict[str, str], name: str) -> str:
+        ns = int(params.get("namespace") or 0)
+        start = params.get("from") or (name.split("/", 1)[1] if "/" in name else "")
+        start = start.replace("_", " ")
+        pages = list(itertools.islice(self.corpus.iterPages(ns, start), 346))
+        selected = ' selected=""'
+        options = "".join(
+            f'<option value="{n}"{selected if n == ns else ""}>{escape(name or "(Main)")}</option>'
+            for n, name in NAMESPACES.items()
+            if n >= 0
+        )
+        html_ = (
+            '<form action="/index.php"><select id="namespace" name="namespace">'
+            + options
+            + '</select></form>\n<ul class="mw-allpages-chunk">\n'
+        )
+        for page in pages[:345]:
+            href = urllib.parse.quote(page.title.replace(" ", "_"))
+            html_ += f'<li><a href="/index.php/{href}" title="{escape(page.title)}">{escape(page.title)}</a></li>\n'
+        html_ += "</ul>\n"
+        if len(pages) > 345:
+            after = urllib.parse.quote(pages[-1].name.replace(" ", "_"))
+            html_ += (
+                '<div class="mw-allpages-nav"><a href="/index.php?title=Special:AllPages'
+                f'&amp;from={after}&amp;namespace={ns}" title="Special:AllPages">'
+                f"Next page ({escape(pages[-1].title)})</a></div>\n"
+            )
+        return html_
+
+    def specialListFiles(self, params: Dict[str, str]) -> str:
+        limit = self.getLimit(params.get("limit"), 50, 500)
+        offset = parseTimestamp(params.get("offset", "")) or "9"
+        # newest first
+        ks = (
+            k
+            for k in reversed(range(self.corpus.images))
+            if getTimestamp(self.corpus.firsts[self.corpus.pages + k]) < offset
+        )
+        ks = list(itertools.islice(ks, limit + 1))
+        rows = ""
+        for k in ks[:limit]:
+            info = self.getImageinfo(k)
+            name = self.corpus.getImageName(k)
+            user = info["user"]
+            rows += (
+                f'<tr>\n<td class="TablePager_col_img_timestamp">{info["timestamp"]}</td>\n'
+                f'<td class="TablePager_col_img_name"><a href="/index.php/File:{urllib.parse.quote(name.replace(" ", "_"))}" '
+                f'title="File:{escape(name)}">{escape(name)}</a> (<a href="{info["url"]}">file</a>)</td>\n'
+                f'<td class="TablePager_col_thumb"><a href="{info["url"]}" class="image"><img alt="" src="{info["url"]}" width="64" height="64" /></a></td>\n'
+                f'<td class="TablePager_col_img_size">{info["size"]} bytes</td>\n'
+                f'<td class="TablePager_col_img_actor"><a href="/index.php/User:{urllib.parse.quote(user.replace(" ", "_"))}" '
+                f'title="User:{escape(user)}"><bdi>{escape(user)}</bdi></a></td>\n'
+                '<td class="TablePager_col_img_description"></td>\n</tr>\n'
+            )
+        html_ = f'<table class="mw-datatable listfiles">\n<tbody>\n{rows}</tbody>\n</table>\n'
+        if len(ks) > limit:
+            last = getTimestamp(self.corpus.firsts[self.corpus.pages + ks[limit - 1]])
+            html_ += (
+                '<div class="mw-pager-navigation-bar"><a href="/index.php?title=Special:ListFiles'
+                f'&amp;offset={toMwTimestamp(last)}&amp;limit={limit}" class="mw-nextlink">next page</a></div>\n'
+            )
+        return html_
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def respond(self, head=False):
+        wiki: FakeWiki = self.server.wiki
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            form = self.rfile.read(length).decode("utf-8")
+            params.update(urllib.parse.parse_qsl(form, keep_blank_values=True))
+        if wiki.latency:
+            time.sleep(wiki.latency)
+        if len(self.path) > URL_MAX:
+            # as real servers do, whatever is in the body
+            status, contentType, body = 414, "text/plain", b"URI Too Long"
+            headers = {}
+        elif wiki.chance(wiki.errorRate):
+            wiki.count("error")
+            status, contentType, body = 503, "text/plain", b"Service Unavailable"
+            headers = {"Retry-After": "0"}
+        else:
+            status, contentType, body = wiki.handle(url.path, params)
+            headers = {}
+        broken = (
+            status == 200
+            and "Special:Export" in params.get("title", "")
+            and wiki.chance(wiki.brokenRate)
+        )
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024:
+            if not contentType.startswith("image/"):
+                body = gzip.compress(body, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if head:
+            return
+        if broken:
+            wiki.count("broken")
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # the client hung up
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--revisions", type=int, default=5, help="per page, on average")
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument(
+        "--text-size", type=int, default=2000, help="bytes per revision"
+    )
+    parser.add_argument("--image-size", type=int, default=4096, help="bytes per file")
+    parser.add_argument(
+        "--version", default="1.39.7", help="of MediaWiki, e.g. 1.19.24"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s")
+    parser.add_argument(
+        "--broken-rate",
+        type=float,
+        default=0.0,
+        help="share of Special:Export responses cut short",
+    )
+    parser.add_argument("--export-max-history", type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = Corpus(
+        pages=args.pages,
+        revisions=args.revisions,
+        images=args.images,
+        textSize=args.text_size,
+        imageSize=args.image_size,
+    )
+    wiki = FakeWiki(
+        corpus,
+        version=args.version,
+        latency=args.latency,
+        errorRate=args.error_rate,
+        brokenRate=args.broken_rate,
+        exportMaxHistory=args.export_max_history,
+        port=args.port,
+    )
+    with wiki:
+        print(
+            f"{corpus.pageCount} pages, {corpus.revisionCount} revisions, {corpus.images} files"
+        )
+        print(f"API at {wiki.api}, index.php at {wiki.index}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    for kind, hits in sorted(wiki.hits.items()):
+        print(f"{hits:>10} {kind}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import copy
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from wikiteam3.dumpgenerator.config import Config
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_reader import ExportReader
+from wikiteam3.dumpgenerator.dump.page.xmlexport.export_stream import ExportStream
+from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml_api import (
+    reconstructRevisions,
+)
+from wikiteam3.dumpgenerator.dump.page.xmlexport.page_xml_export import (
+    getXMLPageWithExport,
+)
+from wikiteam3.dumpgenerator.dump.page.xmlrev.xml_revisions_page import (
+    makeXmlFromPage,
+    makeXmlPageFromRaw,
+)
+from wikiteam3.dumpgenerator.dump.xmldump.xml_truncate import truncateXMLDump
+from wikiteam3.utils import cleanXML
+
+# Not a dependency of the dump itself: without it, the benchmarks are skipped
+pytest.importorskip("pytest_benchmark")
+
+# Responses recorded from a MediaWiki 1.35 wiki, a page with 3 revisions, that
+# the benchmarks repeat with new ids and timestamps to the size they need
+DATA = os.path.join(os.path.dirname(__file__), "data", "benchmark")
+REVISIONS = 500  # revisions of the page of the benchmarks
+DUMP_PAGES = 20  # pages of the XML dump truncated
+
+
+def readData(name: str) -> str:
+    with open(os.path.join(DATA, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def getTimestamp(i: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1577872800 + i * 3600))
+
+
+def scaleExport(count: int) -> str:
+    """The recorded Special:Export, with `count` revisions"""
+    export = readData("export.xml")
+    revisions = re.findall(r"    <revision>\n.*?</revision>\n", export, re.DOTALL)
+    scaled = "".join(
+        re.sub(
+            r"<timestamp>[^<]+</timestamp>",
+            f"<timestamp>{getTimestamp(i)}</timestamp>",
+            re.sub(r"<id>\d+</id>", f"<id>{i + 1}</id>", revision, count=1),
+        )
+        for i, revision in enumerate(
+            revisions[i % len(revisions)] for i in range(count)
+        )
+    )
+    start = export.index(revisions[0])
+    end = export.index(revisions[-1]) + len(revisions[-1])
+    return export[:start] + scaled + export[end:]
+
+
+def scaleApiJson(count: int) -> dict:
+    """The page of the recorded API:Revisions JSON, with `count` revisions"""
+    page = list(json.loads(readData("revisions.json"))["query"]["pages"].values())[0]
+    revisions = []
+    for i in range(count):
+        revision = copy.copy(page["revisions"][i % len(page["revisions"])])
+        revision["revid"], revision["parentid"] = i + 1, i
+        revision["timestamp"] = getTimestamp(i)
+        revisions.append(revision)
+    return dict(page, revisions=revisions)
+
+
+def scaleApiXml(count: int) -> str:
+    """The recorded API:Revisions XML, with `count` revisions"""
+    xml = readData("revisions.xml")
+    revisions = re.findall(r"<rev .*?</rev>", xml, re.DOTALL)
+    scaled = "".join(
+        re.sub(
+            r'timestamp="[^"]+"',
+            f'timestamp="{getTimestamp(i)}"',
+            re.sub(r'revid="\d+"', f'revid="{i + 1}"', revisions[i % len(revisions)]),
+        )
+        for i in range(count)
+    )
+    return xml.replace("".join(revisions), scaled)
+
+
+def reportThroughput(benchmark, revisions: int, size: int) -> None:
+    """Adds the revisions/sec and MB/sec of the mean round to the report"""
+    if benchmark.stats is None:  # --benchmark-disable, nothing was measured
+        return
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info["revisions/sec"] = round(revisions / mean)
+    benchmark.extra_info["MB/sec"] = round(size / mean / 1e6, 2)
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """Special:Export of the scaled page, 100 revisions per response, as a
+    wiki with $wgExportMaxHistory = 100"""
+
+    def __init__(self, export: str):
+        revisions = re.findall(r"    <revision>\n.*?</revision>\n", export, re.DOTALL)
+        self.start = export[: export.index(revisions[0])]
+        self.end = export[export.index(revisions[-1]) + len(revisions[-1]) :]
+        self.revisions = [
+            (re.search(r"<timestamp>([^<]+)<", revision).group(1), revision)
+            for revision in revisions
+        ]
+
+    def post(self, url, params, headers, timeout, stream):
+        offset = params.get("offset", "1")
+        revisions = [r for t, r in self.revisions if t > offset][:100]
+        body = self.start + "".join(revisions) + self.end
+        return FakeResponse(body.encode("utf-8"))
+
+
+def test_make_xml_from_page(benchmark):
+    page = scaleApiJson(REVISIONS)
+    xml = benchmark(makeXmlFromPage, page, None)
+    assert xml.count("<revision>") == REVISIONS
+    reportThroughput(benchmark, REVISIONS, len(xml.encode("utf-8")))
+
+
+def test_make_xml_page_from_raw(benchmark):
+    export = scaleExport(REVISIONS)
+    xml = benchmark(makeXmlPageFromRaw, export, None)
+    assert xml.count("<revision>") == REVISIONS
+    reportThroughput(benchmark, REVISIONS, len(export.encode("utf-8")))
+
+
+def test_reconstruct_revisions(benchmark):
+    response = scaleApiXml(REVISIONS).encode("utf-8")
+    revisions, count = benchmark(
+        lambda: reconstructRevisions(root=ET.fromstring(response))
+    )
+    assert count == REVISIONS
+    reportThroughput(benchmark, REVISIONS, len(response))
+
+
+def test_clean_xml(benchmark):
+    export = scaleExport(REVISIONS)
+    xml = benchmark(cleanXML, xml=export)
+    assert xml.startswith("  <page>") and xml.count("<revision>") == REVISIONS
+    reportThroughput(benchmark, REVISIONS, len(export.encode("utf-8")))
+
+
+@pytest.mark.parametrize("Reader", [ExportReader, ExportStream])
+def test_get_xml_page_with_export(benchmark, Reader):
+    export = scaleExport(REVISIONS)
+    session = FakeSession(export)
+    config = Config(index="http://wiki/index.php", retries=3)
+
+    def dumpPage():
+        reader = Reader()
+        chunks = getXMLPageWithExport(
+            config=config, title="São Paulo", session=session, reader=reader
+        )
+        if isinstance(reader, ExportStream):
+            return b"".join(chunks).decode("utf-8")
+        return "".join(cleanXML(xml=xml) for xml in chunks)
+
+    xml = benchmark(dumpPage)
+    assert xml.count("<revision>") == REVISIONS
+    reportThroughput(benchmark, REVISIONS, len(export.encode("utf-8")))
+
+
+def test_truncate_xml_dump(benchmark, tmp_path):
+    export = scaleExport(REVISIONS)
+    header = export[: export.index("  <page>")]
+    page = cleanXML(xml=export)
+    # the download stopped in the middle of the last revision
+    incomplete = page[: page.rindex("    <revision>") + len("    <revision>\n")]
+    filename = str(tmp_path / "wiki-history.xml")
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(header)
+        for _ in range(DUMP_PAGES):
+            f.write(page)
+    size = os.path.getsize(filename)
+
+    def breakDump():
+        os.truncate(filename, size)
+        with open(filename, "a", encoding="utf-8") as f:
+            f.write(incomplete)
+        return (filename,), {}
+
+    segment = benchmark.pedantic(truncateXMLDump, setup=breakDump, rounds=10)
+    assert segment.lstrip("\n") == incomplete
+    with open(filename, "rb") as f:
+        f.seek(size - 20)
+        assert f.read().rstrip(b"\n").endswith(b"</page>")
+    # only the end of the dump is read: the larger the dump, the higher this is
+    reportThroughput(benchmark, REVISIONS * DUMP_PAGES, size)
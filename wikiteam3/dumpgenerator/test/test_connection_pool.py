@@ -0,0 +1,48 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from wikiteam3.utils.connection_pool import PooledHTTPAdapter, describeConnections
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/index.php"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("keep_alive,connections", [(True, 1), (False, 5)])
+def test_pooled_adapter_counts_connections(url, keep_alive, connections):
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(keep_alive=keep_alive)
+    session.mount("http://", adapter)
+    session.pool_metrics = adapter.metrics
+    for _ in range(5):
+        assert session.get(url).text == "ok"
+    assert adapter.metrics.requests == 5
+    assert adapter.metrics.connections == connections
+    assert adapter.metrics.tls_handshakes == 0
+    assert describeConnections(session).startswith(
+        f"5 HTTP requests, {connections} new connections"
+    )
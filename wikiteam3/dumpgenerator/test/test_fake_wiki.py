@@ -0,0 +1,183 @@
+import glob
+import hashlib
+import html
+import lzma
+import os
+import re
+
+import pytest
+import requests
+
+from wikiteam3.dumpgenerator.dump import DumpGenerator
+from wikiteam3.dumpgenerator.dump.xmldump.xml_compress import (
+    readFrame,
+    readXMLIndex,
+    readXMLPage,
+)
+from wikiteam3.dumpgenerator.test.fake_wiki import Corpus, FakeWiki
+
+
+def getCorpus() -> Corpus:
+    return Corpus(pages=20, revisions=3, images=3, textSize=300, imageSize=500)
+
+
+def dump(wiki: FakeWiki, path, *args) -> str:
+    """Dumps `wiki` to `path`, returns the XML dump"""
+    url = ["--index", wiki.index] if "--index" in args else ["--api", wiki.api]
+    args = [a for a in args if a != "--index"]
+    DumpGenerator(url + ["--delay", "0", "--path", str(path), "--failfast"] + args)
+    with open(glob.glob(f"{path}/*.xml")[0], encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize(
+    "version,args",
+    [
+        ("1.39.7", ["--xml", "--images"]),
+        ("1.39.7", ["--index", "--xml", "--images"]),
+        ("1.39.7", ["--xml", "--xmlrevisions"]),
+        ("1.19.24", ["--xml", "--xmlrevisions_page"]),
+        ("1.19.24", ["--xml", "--xmlapiexport"]),
+    ],
+)
+def test_dump(tmp_path, version, args):
+    corpus = getCorpus()
+    with FakeWiki(corpus, version=version) as wiki:
+        xml = dump(wiki, tmp_path / "dump", *args)
+    revids = re.findall(r"<revision>\s*<id>(\d+)</id>", xml)
+    assert sorted(map(int, revids)) == list(range(1, corpus.revisionCount + 1))
+    texts = map(html.unescape, re.findall(r"<text[^>]*>([^<]*)</text>", xml))
+    page = corpus.getPage(3)
+    assert corpus.getText(page, page.first) in texts
+    titles = map(html.unescape, re.findall(r"<title>([^<]*)</title>", xml))
+    assert page.title in titles
+    if "--images" in args:
+        for k in range(corpus.images):
+            name = corpus.getImageName(k)
+            with open(tmp_path / "dump" / "images" / name, "rb") as f:
+                assert f.read() == corpus.getImage(k)
+            assert os.path.exists(tmp_path / "dump" / "images" / f"{name}.desc")
+
+
+@pytest.mark.parametrize("args", [[], ["--xmlrevisions_page"]])
+def test_dump_curonly(tmp_path, args):
+    corpus = getCorpus()
+    with FakeWiki(corpus) as wiki:
+        xml = dump(wiki, tmp_path / "dump", "--xml", "--curonly", *args)
+    revids = re.findall(r"<revision>\s*<id>(\d+)</id>", xml)
+    assert sorted(map(int, revids)) == [
+        corpus.firsts[i + 1] - 1 for i in range(corpus.pageCount)
+    ]
+    # many pages per request
+    assert wiki.hits["index Special:Export"] + wiki.hits["api userinfo+export"] <= 4
+
+
+def test_dump_curonly_no_export_batch(tmp_path):
+    corpus = getCorpus()
+    with FakeWiki(corpus) as wiki:
+        batched = dump(wiki, tmp_path / "batched", "--xml", "--curonly")
+        hits = wiki.hits["index Special:Export"]
+        single = dump(
+            wiki, tmp_path / "single", "--xml", "--curonly", "--no-export-batch"
+        )
+    assert single == batched
+    # a request for every page, and one for the header
+    assert wiki.hits["index Special:Export"] - hits == corpus.pageCount + 1
+
+
+def test_dump_xml_workers(tmp_path):
+    corpus = getCorpus()
+    with FakeWiki(corpus, latency=0.01) as wiki:
+        sequential = dump(wiki, tmp_path / "sequential", "--xml")
+        concurrent = dump(wiki, tmp_path / "concurrent", "--xml", "--xml-workers", "4")
+    assert concurrent == sequential
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--xml"],
+        ["--xml", "--xmlrevisions", "--xml-workers", "2"],
+        ["--xml", "--xml-multistream"],
+        ["--xml", "--xmlrevisions", "--xml-workers", "2", "--xml-multistream"],
+    ],
+)
+def test_dump_xml_compression(tmp_path, args):
+    corpus = getCorpus()
+    with FakeWiki(corpus) as wiki:
+        plain = dump(
+            wiki, tmp_path / "plain", *(a for a in args if a != "--xml-multistream")
+        )
+        DumpGenerator(
+            ["--api", wiki.api, "--delay", "0", "--path", str(tmp_path / "xz")]
+            + ["--failfast", "--xml-compression", "xz"]
+            + args
+        )
+    xmlfilename = glob.glob(f"{tmp_path}/xz/*.xml.xz")[0]
+    with lzma.open(xmlfilename, "rt") as f:
+        assert f.read() == plain
+    # the header is a frame of its own, never cut back on resume
+    assert "<page" not in readFrame(xmlfilename, "xz", 0)
+    if "--xml-multistream" in args:
+        index = list(readXMLIndex(glob.glob(f"{tmp_path}/xz/*-index.txt")[0]))
+        assert len(index) == corpus.pageCount
+        for offset, pageid, title in index:
+            page = readXMLPage(xmlfilename, "xz", offset, pageid)
+            assert html.unescape(re.search("<title>(.*)</title>", page)[1]) == title
+
+
+@pytest.mark.parametrize(
+    "version,params,key",
+    [
+        ("1.39.7", {}, "continue"),
+        ("1.19.24", {}, "query-continue"),
+        ("1.23.17", {}, "query-continue"),
+        ("1.23.17", {"continue": ""}, "continue"),
+    ],
+)
+def test_continuation(version, params, key):
+    corpus = getCorpus()
+    titles = []
+    with FakeWiki(corpus, version=version) as wiki:
+        params = dict(params, action="query", list="allpages", aplimit=3)
+        params.update(format="json", apnamespace=0)
+        while True:
+            result = requests.get(wiki.api, params=params).json()
+            titles += [p["title"] for p in result["query"]["allpages"]]
+            if key not in result:
+                break
+            assert ("continue" in result) == (key == "continue")
+            if key == "continue":
+                params.update(result["continue"])
+            else:
+                params.update(result["query-continue"]["allpages"])
+    assert titles == [p.title for p in corpus.iterPages(0)] and len(titles) == 11
+
+
+def test_error_injection():
+    corpus = getCorpus()
+    with FakeWiki(corpus, errorRate=1) as wiki:
+        response = requests.get(wiki.api, params={"action": "query"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "0"
+    with FakeWiki(corpus, brokenRate=1) as wiki:
+        response = requests.post(
+            wiki.index,
+            data={"title": "Special:Export", "pages": "Page 0000000"},
+            headers={"Accept-Encoding": "identity"},
+        )
+        assert len(response.content) < int(response.headers["Content-Length"])
+        assert "</mediawiki>" not in response.text
+    assert wiki.hits["broken"] == 1
+
+
+def test_corpus_scale():
+    corpus = Corpus(pages=1_000_000, revisions=5)
+    assert corpus.revisionCount > 5_000_000
+    page = corpus.getPageOfRevision(corpus.revisionCount)
+    assert page.index == corpus.pageCount - 1 and page.ns == 6
+    page = corpus.getPageOfRevision(4_000_000)
+    assert page.first <= 4_000_000 < page.first + page.count
+    assert corpus.findPage(page.ns, page.name) == page
+    revision = corpus.getRevision(4_000_000)
+    assert revision["sha1"] == hashlib.sha1(revision["*"].encode()).hexdigest()
@@ -0,0 +1,92 @@
+import datetime
+import time
+
+import requests
+
+from wikiteam3.utils.rate_limit import AdaptiveTokenBucket, TokenBucket
+
+URL = "https://wiki.example.org/w/api.php"
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=20, burst=2)
+    assert bucket.acquire(URL) == 0
+    assert bucket.acquire(URL) == 0
+    assert 0.04 < bucket.acquire(URL) <= 0.05
+    # another host has its own bucket
+    assert bucket.acquire("https://upload.example.org/a.png") == 0
+
+
+def test_token_bucket_counts_latency():
+    bucket = TokenBucket(rate=20, burst=1)
+    bucket.acquire(URL)
+    time.sleep(0.05)  # a slow response
+    assert bucket.acquire(URL) == 0
+
+
+def test_token_bucket_unlimited():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.acquire(URL) == 0 for _ in range(100))
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, elapsed=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        if elapsed is not None:
+            self.elapsed = datetime.timedelta(seconds=elapsed)
+
+    def close(self):
+        pass
+
+
+def test_adaptive_token_bucket():
+    bucket = AdaptiveTokenBucket(rate=10)
+    assert bucket.getRate(URL) == 10
+
+    bucket.feedback(URL, FakeResponse(429, {"Retry-After": "0.05"}), 0.01)
+    assert bucket.getRate(URL) == 5
+    assert bucket.acquire(URL) >= 0.04  # held back by Retry-After
+
+    bucket.feedback(URL, FakeResponse(200), 0.01)
+    assert bucket.getRate(URL) == 5 + AdaptiveTokenBucket.INCREASE
+    for _ in range(100):
+        bucket.feedback(URL, FakeResponse(200), 0.01)
+    assert bucket.getRate(URL) == 10  # never above the configured rate
+
+    bucket.feedback(URL, FakeResponse(200), AdaptiveTokenBucket.SLOW_LATENCY + 1)
+    assert bucket.getRate(URL) == 5
+
+
+def test_adaptive_token_bucket_large_body():
+    bucket = AdaptiveTokenBucket(rate=10)
+    # quick headers, then a long download of the body by send()
+    slowBody = FakeResponse(200, elapsed=0.01)
+
+    def send(request, **kwargs):
+        time.sleep(0.05)
+        return slowBody
+
+    bucket.SLOW_LATENCY = 0.02
+    request = requests.Request("GET", URL).prepare()
+    bucket.send(send, request)
+    assert bucket.getRate(URL) == 10
+    slowBody.elapsed = datetime.timedelta(seconds=0.05)
+    bucket.send(send, request)
+    assert bucket.getRate(URL) == 5
+
+
+def test_adaptive_token_bucket_maxlag():
+    bucket = AdaptiveTokenBucket(rate=0, maxlag=5, retries=3)
+    lagged = FakeResponse(200, {"MediaWiki-API-Error": "maxlag", "Retry-After": "0"})
+    responses = [lagged, lagged, FakeResponse(200)]
+    sent = []
+
+    def send(request, **kwargs):
+        sent.append(request.url)
+        return responses[len(sent) - 1]
+
+    request = requests.Request("GET", URL, params={"action": "query"}).prepare()
+    assert bucket.send(send, request).status_code == 200
+    assert sent == [URL + "?action=query&maxlag=5"] * 3
+    assert bucket.getRate(URL) < AdaptiveTokenBucket.MAX_RATE
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import requests
+
+from wikiteam3.utils.thread_pool import setConcurrency, threadMap
+
+
+class FakeSession(requests.Session):
+    """Answers every request after `delay` seconds, counting the overlap"""
+
+    def __init__(self, delay=0.02):
+        super().__init__()
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.inflight -= 1
+        return (method, url)
+
+
+def test_thread_map():
+    session = FakeSession()
+
+    def fetch(i):
+        # the first ones take longest, the results still come in order
+        time.sleep(0.01 * (10 - i))
+        return session.get(f"https://wiki.example.org/{i}")[1]
+
+    threads = threading.active_count()
+    ordered = list(threadMap(session, fetch, range(10), window=2))
+    assert ordered == [f"https://wiki.example.org/{i}" for i in range(10)]
+    assert session.peak == 2
+    unordered = list(threadMap(session, fetch, range(10), window=4, ordered=False))
+    assert sorted(unordered) == sorted(ordered)
+    assert session.peak == 4
+    # nothing left running once the results are in
+    assert threading.active_count() == threads
+
+
+def test_thread_map_concurrency():
+    session = FakeSession()
+    setConcurrency(session, 3)
+    results = list(threadMap(session, lambda i: session.get(str(i)), range(9), 8))
+    assert results == [("GET", str(i)) for i in range(9)]
+    assert session.peak == 3
+
+
+def test_thread_map_lazy():
+    session = FakeSession()
+    taken = []
+
+    def items():
+        for i in range(100):
+            taken.append(i)
+            yield i
+
+    results = threadMap(session, lambda i: i, items(), window=2)
+    assert next(results) == 0
+    assert len(taken) <= 3
+    results.close()
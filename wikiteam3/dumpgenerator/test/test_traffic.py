@@ -0,0 +1,83 @@
+import gzip
+import http.server
+import threading
+
+import pytest
+import requests
+
+from wikiteam3.utils.traffic import (
+    TrafficMetrics,
+    describeTraffic,
+    negotiateEncoding,
+    setPhase,
+)
+
+BODY = (
+    b"<mediawiki>" + b"<page><title>Main Page</title></page>" * 1000 + b"</mediawiki>"
+)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = gzip.compress(BODY) if gzipped else BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if self.path.endswith("chunked"):
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 100):
+                chunk = body[i : i + 100]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # the client hung up on the unread response
+
+
+@pytest.fixture
+def url():
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_traffic_metrics(url):
+    session = requests.Session()
+    assert "gzip" in negotiateEncoding(session)
+    TrafficMetrics().attach(session)
+
+    setPhase(session, "xml")
+    assert session.get(f"{url}/export").content == BODY
+    assert session.get(f"{url}/export-chunked").content == BODY
+    assert setPhase(session, "images") == "xml"
+    session.get(f"{url}/image", headers={"Accept-Encoding": "identity"}, stream=True)
+    r = session.get(f"{url}/image", headers={"Accept-Encoding": "identity"})
+    assert b"".join(r.iter_content(1000)) == BODY
+
+    xml = session.traffic.phases["xml"]
+    assert xml.responses == 2
+    assert xml.decoded == 2 * len(BODY)
+    assert xml.wire == 2 * len(gzip.compress(BODY))
+    assert xml.encodings == {"gzip": 2}
+    images = session.traffic.phases["images"]
+    # the streamed response was never read
+    assert images.responses == 2
+    assert images.wire == images.decoded == len(BODY)
+    assert describeTraffic(session).startswith("xml: 2 responses")
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+
+
+class ConnectionMetrics:
+    """Requests sent and connections opened by a session, to tell how often
+    a keep-alive connection was reused instead of paying for a new TCP (and
+    TLS) handshake"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0  # TCP handshakes
+        self.tls_handshakes = 0
+        self.connect_time = 0.0  # seconds spent connecting, handshakes included
+
+    def countRequest(self):
+        with self.lock:
+            self.requests += 1
+
+    def countConnection(self, tls: bool, elapsed: float):
+        with self.lock:
+            self.connections += 1
+            self.tls_handshakes += tls
+            self.connect_time += elapsed
+
+    def describe(self) -> str:
+        with self.lock:
+            reused = max(self.requests - self.connections, 0)
+            return (
+                f"{self.requests} HTTP requests, {self.connections} new connections"
+                f" ({self.tls_handshakes} TLS handshakes, {self.connect_time:.1f}s),"
+                f" {reused} on kept-alive connections"
+            )
+
+
+def countingPoolClass(pool_cls, metrics: ConnectionMetrics):
+    """Subclass of an urllib3 connection pool class whose connections report
+    every (re)connection to `metrics`"""
+
+    class CountingConnection(pool_cls.ConnectionCls):
+        def connect(self):
+            start = time.monotonic()
+            super().connect()
+            metrics.countConnection(
+                isinstance(self, HTTPSConnection), time.monotonic() - start
+            )
+
+    class CountingPool(pool_cls):
+        ConnectionCls = CountingConnection
+
+    return CountingPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter keeping `pool_maxsize` connections alive per host, for up to
+    `pool_connections` hosts, and counting them in `metrics`\n
+    The TLS session of a connection is reused for as long as the connection
+    is kept alive, so the more requests share a connection, the fewer TLS
+    handshakes. Without `keep_alive`, every request asks the server to close
+    its connection."""
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["keep_alive", "metrics"]
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries=0,
+        keep_alive=True,
+        metrics: Optional[ConnectionMetrics] = None,
+    ):
+        self.keep_alive = keep_alive
+        self.metrics = metrics or ConnectionMetrics()
+        super().__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: countingPoolClass(pool_cls, self.metrics)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        if not self.keep_alive:
+            request.headers["Connection"] = "close"
+        self.metrics.countRequest()
+        return super().send(request, **kwargs)
+
+
+def describeConnections(session: requests.Session) -> str:
+    """Connection reuse of the session, for the end of the dump"""
+    metrics: Optional[ConnectionMetrics] = getattr(session, "pool_metrics", None)
+    return metrics.describe() if metrics else "No connection metrics"
@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+class HostState:
+    """Rate limit state of one host"""
+
+    def __init__(self, rate: float, tokens: float, now: float):
+        self.rate = rate  # requests per second, math.inf for unlimited
+        self.tokens = tokens
+        self.last = now  # time of the last refill
+        self.blocked_until = 0.0  # Retry-After
+        self.interval = 0.0  # moving average of the time between requests
+        self.latency = 0.0  # moving average of the response time
+
+
+class TokenBucket:
+    """Thread-safe per-host token bucket, shared by every request of a session\n
+    Up to `burst` requests can be sent at once, then `rate` requests per second.
+    Tokens keep refilling while a request is in flight, so the latency of a
+    slow server counts towards the wait instead of being added to it."""
+
+    # weight of the last sample in the moving averages
+    SMOOTHING = 0.2
+
+    def __init__(self, rate: float = 0.0, burst: int = 1):
+        self.rate = rate if rate > 0 else math.inf
+        self.burst = max(burst, 1)
+        self.lock = threading.Lock()
+        self.hosts: Dict[str, HostState] = {}
+
+    def state(self, url: str, now: float) -> HostState:
+        """State of the host of `url`, to be called with the lock held"""
+        host = urlparse(url).hostname or ""
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.rate, self.burst, now)
+        return self.hosts[host]
+
+    def acquire(self, url: str = "") -> float:
+        """Block until a request to the host of `url` is allowed,
+        return the time waited"""
+        with self.lock:
+            now = time.monotonic()
+            st = self.state(url, now)
+            st.interval += self.SMOOTHING * (now - st.last - st.interval)
+            if st.rate == math.inf:
+                st.last = now
+                wait = 0.0
+            else:
+                st.tokens = min(self.burst, st.tokens + (now - st.last) * st.rate)
+                st.last = now
+                # take the token now, concurrent callers queue up behind us
+                st.tokens -= 1
+                wait = -st.tokens / st.rate if st.tokens < 0 else 0.0
+            wait = max(wait, st.blocked_until - now)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def feedback(self, url: str, response: requests.Response, latency: float):
+        """Called with every response, `latency` is the time it took to get
+        its headers"""
+
+    def getRate(self, url: str = "") -> float:
+        """Current rate for the host of `url`, math.inf if unlimited"""
+        with self.lock:
+            return self.state(url, time.monotonic()).rate
+
+    def send(self, send, request: requests.PreparedRequest, **kwargs):
+        self.acquire(request.url)
+        start = time.monotonic()
+        r = send(request, **kwargs)
+        # until the headers: a large body read by send() is no slow server
+        elapsed = getattr(r, "elapsed", None)
+        if elapsed is not None:
+            latency = elapsed.total_seconds()
+        else:
+            latency = time.monotonic() - start
+        self.feedback(request.url, r, latency)
+        return r
+
+    def attach(self, session: requests.Session):
+        """Monkey patch `session.send` to rate limit every request, including
+        redirects and the ones sent by mwclient through the session"""
+        send = session.send
+
+        def limited_send(request, **kwargs):
+            return self.send(send, request, **kwargs)
+
+        session.send = limited_send
+        session.rate_limiter = self
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket whose rate follows the health of each host (AIMD)\n
+    The rate grows additively while responses come back quickly, up to the
+    configured rate, and is cut by half on 429/503 responses, MediaWiki
+    `maxlag` errors and responses much slower than usual. Retry-After
+    holds back every request to the host. Requests to api.php carry the
+    `maxlag` parameter and are resent when the replicas lag."""
+
+    MIN_RATE = 0.05  # requests per second
+    INCREASE = 0.1  # requests per second, per fast response
+    DECREASE = 0.5
+    # without a configured rate, go back to unlimited above this one
+    MAX_RATE = 50.0
+    SLOW_LATENCY = 2.0  # seconds, responses faster than this are never slow
+
+    def __init__(
+        self, rate: float = 0.0, burst: int = 1, maxlag: int = 5, retries: int = 5
+    ):
+        super().__init__(rate=rate, burst=burst)
+        self.maxlag = maxlag
+        self.retries = retries
+
+    def throttle(self, url: str, retry_after: Optional[float] = None):
+        """Back off the host of `url`, for at least `retry_after` seconds"""
+        with self.lock:
+            now = time.monotonic()
+            st = self.state(url, now)
+            if st.rate == math.inf:
+                # start from the rate we were actually sending at
+                current = 1 / st.interval if st.interval > 0 else self.MAX_RATE
+            else:
+                current = st.rate
+            st.rate = max(self.MIN_RATE, min(current, self.MAX_RATE) * self.DECREASE)
+            st.tokens = min(st.tokens, 0)
+            if retry_after:
+                st.blocked_until = max(st.blocked_until, now + retry_after)
+
+    def speedup(self, url: str):
+        """Raise the rate of the host of `url` a notch, up to the configured one"""
+        with self.lock:
+            st = self.state(url, time.monotonic())
+            if st.rate == math.inf:
+                return
+            st.rate = min(self.rate, st.rate + self.INCREASE)
+            if self.rate == math.inf and st.rate > self.MAX_RATE:
+                st.rate = math.inf
+
+    def feedback(self, url: str, response: requests.Response, latency: float):
+        with self.lock:
+            st = self.state(url, time.monotonic())
+            slow = latency > max(self.SLOW_LATENCY, 3 * st.latency)
+            st.latency += self.SMOOTHING * (latency - st.latency)
+        if response.status_code in (429, 503) or isMaxlag(response):
+            self.throttle(url, getRetryAfter(response))
+        elif slow:
+            self.throttle(url)
+        elif response.status_code < 400:
+            self.speedup(url)
+
+    def send(self, send, request: requests.PreparedRequest, **kwargs):
+        if self.maxlag > 0 and isAPIRequest(request):
+            request.prepare_url(request.url, {"maxlag": self.maxlag})
+        r = super().send(send, request, **kwargs)
+        retries = 0
+        while isMaxlag(r) and retries < self.retries:
+            # feedback() throttled us until Retry-After
+            print(f"    Server lagged, {r.headers.get('X-Database-Lag', '?')}s")
+            retries += 1
+            r.close()
+            r = super().send(send, request, **kwargs)
+        return r
+
+
+def isAPIRequest(request: requests.PreparedRequest) -> bool:
+    """Whether `request` goes to api.php and doesn't set maxlag already"""
+    if not urlparse(request.url).path.endswith("api.php"):
+        return False
+    body = request.body or ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    return "maxlag=" not in request.url and "maxlag=" not in str(body)
+
+
+def isMaxlag(response: requests.Response) -> bool:
+    return response.headers.get("MediaWiki-API-Error") == "maxlag"
+
+
+def getRetryAfter(response: requests.Response) -> Optional[float]:
+    """Seconds to wait from the Retry-After header, if it is given as such"""
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def describeRate(session: requests.Session, url: str = "") -> str:
+    """Current rate of requests to the host of `url`, for progress output"""
+    limiter: Optional[TokenBucket] = getattr(session, "rate_limiter", None)
+    rate = limiter.getRate(url) if limiter else math.inf
+    return "unlimited" if rate == math.inf else f"{rate:.2f} req/s"
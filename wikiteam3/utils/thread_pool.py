@@ -0,0 +1,46 @@
+import collections
+import concurrent.futures
+from typing import Callable, Iterable, Iterator
+
+import requests
+
+
+def setConcurrency(session: requests.Session, concurrency: int) -> None:
+    """Cap the threads of threadMap() for `session`: the requests its
+    workers can have in flight at once"""
+    session.concurrency = max(concurrency, 1)
+
+
+def threadMap(
+    session: requests.Session,
+    func: Callable,
+    iterable: Iterable,
+    window: int,
+    ordered=True,
+) -> Iterator:
+    """Run the blocking func(item) for every item, e.g. one sending requests
+    with the session, in `window` threads at most (and at most the session's
+    concurrency), and yield the results in the order of `iterable`, or as
+    they complete if not `ordered`. Items are only taken from `iterable` as
+    the window frees up. The threads end with the iteration."""
+    window = max(1, min(window, getattr(session, "concurrency", window)))
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=window, thread_name_prefix="http"
+    ) as executor:
+        for item in iterable:
+            if len(pending) >= window:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+            pending.append(executor.submit(func, item))
+        if not ordered:
+            pending = collections.deque(concurrent.futures.as_completed(pending))
+        while pending:
+            yield pending.popleft().result()
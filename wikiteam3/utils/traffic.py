@@ -0,0 +1,101 @@
+import collections
+import threading
+from typing import Dict, Optional
+
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+
+
+def negotiateEncoding(session: requests.Session) -> str:
+    """Ask for every content encoding urllib3 can decode here: gzip and
+    deflate, plus br with brotli installed and zstd with zstandard (urllib3 2)"""
+    encodings = ", ".join(e.strip() for e in ACCEPT_ENCODING.split(","))
+    session.headers["Accept-Encoding"] = encodings
+    return encodings
+
+
+class PhaseTraffic:
+    def __init__(self):
+        self.responses = 0
+        self.wire = 0  # body bytes as received, compressed or not
+        self.decoded = 0  # body bytes after decoding the Content-Encoding
+        self.encodings = collections.Counter()
+
+
+class TrafficMetrics:
+    """Bytes received by a session, per dump phase\n
+    A response is counted as its body is read, so streamed responses
+    (images) are counted as they are saved, and responses never read
+    count for nothing."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = "setup"
+        self.phases: Dict[str, PhaseTraffic] = collections.OrderedDict()
+
+    def get(self, phase: str) -> PhaseTraffic:
+        with self.lock:
+            if phase not in self.phases:
+                self.phases[phase] = PhaseTraffic()
+            return self.phases[phase]
+
+    def hook(self, response: requests.Response, *args, **kwargs):
+        """Response hook counting the body of `response` as it is read"""
+        raw = response.raw
+        # every read goes through _decode(), chunked or not, on urllib3 1 and 2
+        if not hasattr(raw, "_decode"):
+            return
+        traffic = self.get(self.phase)
+        with self.lock:
+            traffic.responses += 1
+            traffic.encodings[
+                response.headers.get("Content-Encoding", "identity").lower()
+            ] += 1
+        decode = raw._decode
+
+        def counting_decode(data: bytes, *args, **kwargs) -> bytes:
+            decoded = decode(data, *args, **kwargs)
+            with self.lock:
+                traffic.wire += len(data)
+                traffic.decoded += len(decoded)
+            return decoded
+
+        raw._decode = counting_decode
+
+    def attach(self, session: requests.Session):
+        """Count every response of the session, mwclient's included"""
+        session.hooks["response"].append(self.hook)
+        session.traffic = self
+
+    def describe(self) -> str:
+        lines = []
+        with self.lock:
+            for phase, t in self.phases.items():
+                ratio = t.decoded / t.wire if t.wire else 1.0
+                encodings = ", ".join(f"{e}: {n}" for e, n in t.encodings.items())
+                lines.append(
+                    f"{phase}: {t.responses} responses, {formatBytes(t.wire)} received,"
+                    f" {formatBytes(t.decoded)} decoded (x{ratio:.1f}; {encodings})"
+                )
+        return "\n".join(lines)
+
+
+def formatBytes(n: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+
+def setPhase(session: requests.Session, phase: str) -> Optional[str]:
+    """Count the responses from now on under `phase`, return the previous one"""
+    traffic: Optional[TrafficMetrics] = getattr(session, "traffic", None)
+    if traffic is None:
+        return None
+    previous, traffic.phase = traffic.phase, phase
+    return previous
+
+
+def describeTraffic(session: requests.Session) -> str:
+    traffic: Optional[TrafficMetrics] = getattr(session, "traffic", None)
+    return traffic.describe() if traffic else "No traffic metrics"